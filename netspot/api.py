@@ -2,6 +2,8 @@
 
 """NetSPOT REST API."""
 
+from datetime import datetime, timedelta
+
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 import helpers
@@ -9,6 +11,34 @@ import nm_helper
 
 import netspot_settings
 
+from .lib.spotmax import mac_history
+
+# Accepted date formats for the MAC history API
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d')
+
+
+def _parse_date(value, default):
+  """Parse a date from a query parameter.
+
+  Args:
+    value: string, date or None
+    default: datetime, returned if value is empty
+
+  Returns:
+    date: datetime or None if value can't be parsed
+  """
+
+  if not value:
+    return default
+
+  for date_format in DATE_FORMATS:
+    try:
+      return datetime.strptime(value, date_format)
+    except ValueError:
+      pass
+
+  return None
+
 # API
 @api_view(['GET'])
 def api_get_mac(request, ip_address):
@@ -19,18 +49,40 @@ def api_get_mac(request, ip_address):
   """
 
   if request.method == 'GET':
-    collection = helpers.mongo_helper(netspot_settings.COLL_MACS)
-    macs = collection.find({'macs.ip': {'$regex': ip_address}}).sort('asset')
-
-    # Serialize response
-    macs_response = set()
-    for entry in macs:
-      for mac in entry['macs']:
-        if ip_address == mac['ip']:
-          macs_response.add(mac['mac'])
+    collection = helpers.mongo_helper(netspot_settings.COLL_MAC_ENTRIES)
+    macs_response = sorted(collection.distinct('mac', {'ip': ip_address}))
 
     return Response(macs_response)
 
+@api_view(['GET'])
+def api_mac_history(request, mac):
+  """Returns where a MAC address has been seen.
+
+  Query parameters 'start' and 'end' limit the period, eg.
+  ?start=2017-05-01&end=2017-05-02T12:00 in UTC. Defaults to the full
+  retention period.
+
+  Args:
+    mac: string, MAC address
+
+  Returns:
+    intervals: list of dict, asset, interface, vlan, ip, first_seen and last_seen
+  """
+
+  if request.method == 'GET':
+    now = datetime.utcnow()
+    start = _parse_date(request.GET.get('start'),
+                        now - timedelta(days=netspot_settings.MAC_HISTORY_RETENTION))
+    end = _parse_date(request.GET.get('end'), now)
+
+    if start is None or end is None:
+      return Response({'error': 'Invalid date. Use YYYY-MM-DD[THH:MM[:SS]].'}, status=400)
+
+    history = mac_history.MACHistory()
+    intervals = list(history.where_was(mac, start, end))
+
+    return Response(intervals)
+
 @api_view(['GET'])
 def api_netmagis_search(request, search_keyword):
   """Search NetMagis.
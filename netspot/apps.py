@@ -1,7 +1,18 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.core import checks
 
 
 class NetspotConfig(AppConfig):
     name = 'netspot'
+
+    def ready(self):
+        from .checks import check_indexes
+        checks.register(check_indexes)
+
+        # Invalidate cached inventory data on changes, also when made by other processes
+        import netspot_settings
+        from .lib.spotmax import inventory_cache, notify, spotmax
+        inventory_cache.register()
+        notify.start_listener(spotmax.get_database(netspot_settings.DATABASE))
@@ -0,0 +1,24 @@
+"""NetSPOT system checks."""
+
+from __future__ import unicode_literals
+
+from django.core import checks
+from pymongo.errors import PyMongoError
+
+from .lib.spotmax import indexes, spotmax
+import netspot_settings
+
+
+def check_indexes(app_configs, **kwargs):
+  """Warn about missing or outdated MongoDB indexes."""
+
+  try:
+    missing = indexes.missing_indexes(spotmax.get_database(netspot_settings.DATABASE))
+  except PyMongoError as error:
+    return [checks.Warning('Unable to verify MongoDB indexes: %s' % error,
+                           id='netspot.W002')]
+
+  return [checks.Warning('Missing or outdated MongoDB index %s.%s' % (collection, name),
+                         hint='Run: python manage.py netspot_indexes. Drop outdated indexes first',
+                         id='netspot.W001')
+          for collection, name in missing]
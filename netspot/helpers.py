@@ -7,8 +7,6 @@ import subprocess
 
 from collections import defaultdict
 
-from pymongo import MongoClient
-
 from lib.spotmax import spotmax
 from lib.spotmax import netspot
 import netspot_settings
@@ -104,9 +102,7 @@ def get_dhcp_server(network=None, asset=[]):
 def mongo_helper(collection):
   """Helper function to connect to Mongo."""
 
-  client = MongoClient()
-  database = client[netspot_settings.DATABASE]
-  database.authenticate(netspot_settings.DB_USERNAME, netspot_settings.DB_PASSWORD)
+  database = spotmax.get_database(netspot_settings.DATABASE)
   collection = database[collection]
 
   return collection
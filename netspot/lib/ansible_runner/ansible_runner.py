@@ -2,10 +2,13 @@
 
 """Ansible runner."""
 
+import multiprocessing
+import os
 import signal
+import socket
 import threading
 import Queue
-import time
+import uuid
 import taskdb
 import ansible_api
 
@@ -15,21 +18,85 @@ import netspot_settings
 PLAYBOOK_PATH = netspot_settings.PLAYBOOK_PATH
 SLEEP_TIMER = netspot_settings.SLEEP_TIMER
 
-class TaskProcessor(object):
-  """Task processor."""
+# Seconds to wait for a terminated playbook process before it is killed
+KILL_TIMEOUT = 10
+
+
+def _process_main(processor, task, result):
+  """Run a task in a child process and send its status to the parent.
+
+  Args:
+    processor: TaskProcessor object
+    task: Task object
+    result: multiprocessing Connection, receives the task status
+  """
 
-  def __init__(self, num_threads=3):
+  # Own process group, so the playbook and its forks can be killed together.
+  # Ctrl-C on the runner lets running playbooks finish, as with threads.
+  os.setpgrp()
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+  result.send(processor.process_task(task))
+  result.close()
+
+class TaskProcessor(object):
+  """Task processor.
+
+  The dispatcher claims up to one queued task per free worker thread and
+  is woken up as soon as a worker finishes or TaskDB.add_task() sends a
+  notification, so the queue drains at the speed of the workers rather
+  than one task per SLEEP_TIMER.
+
+  Claimed tasks are leased to this processor and the lease is renewed by
+  a heartbeat thread while they run, also after shutdown until the last
+  running task has finished. Several processors can share one task
+  database, and tasks of a crashed processor are queued again when their
+  lease expires.
+
+  With the 'process' backend every playbook runs in its own child process,
+  which is killed if it runs longer than the timeout. With the 'thread'
+  backend playbooks run in the worker threads and can't be timed out.
+  """
+
+  def __init__(self, num_threads=netspot_settings.TASK_WORKERS,
+               database=netspot_settings.TASK_DATABASE,
+               lease=taskdb.LEASE_TIME, notify_socket=taskdb.NOTIFY_SOCKET,
+               backend=netspot_settings.TASK_BACKEND, timeout=netspot_settings.TASK_TIMEOUT):
     self.shutting_down = False
     self.setup_signals()
     self.num_threads = num_threads
+    self.backend = backend
+    self.timeout = timeout
+    self.database = database
+    self.lease = lease
     self.task_queue = Queue.Queue()
 
+    # Unique ID of this processor, owner of claimed tasks
+    self.owner = '%s:%s:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+    # IDs of claimed tasks that are not finished yet
+    self.claimed = set()
+
+    self.claimed_lock = threading.Lock()
+
+    # Number of queued tasks in the database after the last dispatch
+    self.queue_depth = 0
+
+    # Set when a worker is free or a task is added
+    self.wakeup = threading.Event()
+
+    # Set when all workers are stopped, stops the heartbeat
+    self.stopped = threading.Event()
+    self.workers = list()
+    self.listener = taskdb.TaskListener(self.wakeup.set, path=notify_socket)
+
     self.setup_threads()
 
   def shutdown(self, signum, frame):
     """Shutdown."""
     self.shutting_down = True
-    self.task_queue = Queue.Queue()  # Reset the input queue
+    self.wakeup.set()
     print('Shutdown in progress - waiting for background threads to '
           'terminate')
 
@@ -45,21 +112,106 @@ class TaskProcessor(object):
     for num in range(self.num_threads):
       thread = threading.Thread(target=self.task_handler, args=[self.task_queue])
       thread.start()
+      self.workers.append(thread)
 
   def run(self):
-    """Run."""
+    """Dispatch tasks until shutdown.
+
+    Returns when the running tasks have finished and their leases are no
+    longer renewed.
+    """
+
+    heartbeat = threading.Thread(target=self.heartbeat_handler, name='taskdb-heartbeat')
+    heartbeat.daemon = True
+    heartbeat.start()
+
+    # New tasks wake up the dispatcher. Poll only if nobody can notify us
+    if self.listener.bind():
+      self.listener.start()
+    else:
+      print 'Task notifications disabled, polling every %ss.' % SLEEP_TIMER
 
     while not self.shutting_down:
-      tasks = self.get_tasks()
+      self.wakeup.clear()
 
-      if not tasks:
+      if not self.dispatch() and not self.claimed:
         print 'No tasks to process.'
-        time.sleep(SLEEP_TIMER)
-        continue
 
-      for task in tasks:
-        self.task_queue.put(task)
-      time.sleep(SLEEP_TIMER)
+      # Wait for a free worker, at most SLEEP_TIMER
+      self.wakeup.wait(SLEEP_TIMER)
+
+    self.listener.stop()
+    self.requeue()
+
+    # Running playbooks finish, keep their leases until they are done
+    for worker in self.workers:
+      worker.join()
+
+    self.stopped.set()
+    heartbeat.join()
+
+  def dispatch(self):
+    """Claim queued tasks for the free workers.
+
+    Tasks are claimed atomically and marked active before they are put on
+    the task queue, so they are not claimed again by any processor.
+
+    Returns:
+      number of dispatched tasks
+    """
+
+    free = self.num_threads - len(self.claimed)
+
+    with taskdb.TaskDB(self.database) as db_conn:
+      tasks = db_conn.claim_tasks(self.owner, limit=free, lease=self.lease) if free > 0 else []
+      self.queue_depth = db_conn.count_tasks_by_status(taskdb.Task.STATUS_CODES['QUEUED'])
+
+    with self.claimed_lock:
+      self.claimed.update(task.id for task in tasks)
+
+    for task in tasks:
+      self.task_queue.put(task)
+
+    if tasks:
+      print 'Dispatched %s task(s), %s queued.' % (len(tasks), self.queue_depth)
+
+    return len(tasks)
+
+  def heartbeat(self):
+    """Renew the lease of claimed tasks."""
+
+    with self.claimed_lock:
+      task_ids = list(self.claimed)
+
+    if task_ids:
+      with taskdb.TaskDB(self.database) as db_conn:
+        db_conn.heartbeat(task_ids, self.owner, lease=self.lease)
+
+  def heartbeat_handler(self):
+    """Renew leases until the workers are stopped."""
+
+    while not self.stopped.is_set():
+      try:
+        self.heartbeat()
+      except taskdb.sqlite3.Error as error:
+        # Database busy, retry on the next beat. The lease is renewed in time
+        print 'Failed to renew leases: %s' % error
+
+      self.stopped.wait(self.lease / 3.0)
+
+  def requeue(self):
+    """Release tasks that were dispatched but not started."""
+
+    with taskdb.TaskDB(self.database) as db_conn:
+      while True:
+        try:
+          task = self.task_queue.get_nowait()
+        except Queue.Empty:
+          break
+
+        db_conn.release_task(task.id, self.owner)
+        with self.claimed_lock:
+          self.claimed.discard(task.id)
 
   def task_handler(self, task_queue):
     """Fetch tasks and start to process them."""
@@ -68,30 +220,102 @@ class TaskProcessor(object):
 
       try:
         task = task_queue.get(block=True, timeout=2)
+      except Queue.Empty:
+        continue
+
+      try:
+        # Process task. An unexpected error fails the task but not the
+        # worker, otherwise the task would be requeued and fail forever
+        try:
+          status = self.execute(task)
+        except Exception as error:  # pylint: disable=broad-except
+          print 'Task %s failed: %r' % (task.id, error)
+          status = taskdb.Task.STATUS_CODES['ANSIBLE_ERROR']
+
+        # Save result and mark task as processed, unless the lease was lost
+        with taskdb.TaskDB(self.database) as db_conn:
+          if db_conn.complete_task(task.id, self.owner, status):
+            db_conn.delete_inventory_data(task.id)
+          else:
+            print 'Lease lost for task %s, result not saved.' % task.id
+      finally:
+        with self.claimed_lock:
+          self.claimed.discard(task.id)
+        self.wakeup.set()
+
+  def execute(self, task):
+    """Run a task with the configured backend.
 
-        # Update the database
-        with taskdb.TaskDB() as db_conn:
+    Args:
+      task: Task object
 
-          # Mark task as active
-          db_conn.update_status(task.id, taskdb.Task.STATUS_CODES['ACTIVE'])
+    Return:
+      status: integer, one of taskdb.Task.STATUS_CODES processed codes
+    """
 
-          # Process task
-          status = self.process_task(task)
+    if self.backend == 'process':
+      return self.execute_in_process(task)
 
-          # Save result and mark task as processed
-          db_conn.delete_inventory_data(task.id)
-          db_conn.update_status(task.id, status)
+    return self.process_task(task)
 
-      except Queue.Empty:
-        pass
+  def execute_in_process(self, task):
+    """Run a task in a child process with a wall clock timeout.
 
-  def get_tasks(self):
-    """Get queued tasks."""
+    Args:
+      task: Task object
 
-    with taskdb.TaskDB() as db_conn:
-      tasks = db_conn.get_tasks_by_status(taskdb.Task.STATUS_CODES['QUEUED'])
-    return tasks
+    Return:
+      status: integer, one of taskdb.Task.STATUS_CODES processed codes
+    """
+
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_process_main, args=(self, task, writer))
+    process.start()
+    writer.close()
 
+    status = None
+    timed_out = False
+    try:
+      if reader.poll(self.timeout or None):
+        status = reader.recv()
+      else:
+        timed_out = True
+    except EOFError:
+      # Process exited without a result
+      pass
+    finally:
+      reader.close()
+
+    if timed_out:
+      print 'Task %s timed out after %ss, killing playbook.' % (task.id, self.timeout)
+      self.kill(process)
+      status = taskdb.Task.STATUS_CODES['TIMEOUT']
+
+    # Don't wait forever for a process that hangs after its result
+    process.join(KILL_TIMEOUT)
+    if process.is_alive():
+      self.kill(process)
+
+    if status is None:
+      print 'Task %s failed, playbook process exit code %s.' % (task.id, process.exitcode)
+      status = taskdb.Task.STATUS_CODES['ANSIBLE_ERROR']
+
+    return status
+
+  @staticmethod
+  def kill(process):
+    """Terminate a playbook process group, kill it if it doesn't exit."""
+
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+      try:
+        os.killpg(process.pid, sig)
+      except OSError:
+        # Already gone
+        return
+
+      process.join(KILL_TIMEOUT)
+      if not process.is_alive():
+        return
 
   def process_task(self, task):
     """Process task.
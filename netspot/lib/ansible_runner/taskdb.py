@@ -2,13 +2,18 @@
 
 """TaskDB - Interacts with a task DB."""
 
+import errno
 import os
+import socket
 import sqlite3
+import threading
+import time
 
+from contextlib import contextmanager
 from datetime import datetime
 import netspot_settings
 
-SCHEMA = ('CREATE TABLE tasks( '
+SCHEMA = ('CREATE TABLE IF NOT EXISTS tasks( '
           'id INTEGER PRIMARY KEY, '
           'status INTEGER, '
           'date DATE, '
@@ -18,7 +23,26 @@ SCHEMA = ('CREATE TABLE tasks( '
           'extra_vars TEXT, '
           'become_pass TEXT, '
           'verbosity INTEGER, '
-          'hosts TEXT)')
+          'hosts TEXT, '
+          'owner TEXT, '
+          'lease_expires REAL)')
+
+# Columns added after the first schema version: (name, type)
+MIGRATIONS = [('owner', 'TEXT'), ('lease_expires', 'REAL')]
+
+INDEXES = ['CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id)',
+           'CREATE INDEX IF NOT EXISTS tasks_date ON tasks (date)']
+
+# Seconds to wait for a lock held by another connection
+BUSY_TIMEOUT = 30
+
+# Mode of the database and its WAL files. The web server and the task runner
+# run as different users, which need a shared group with write access to the
+# database directory
+FILE_MODE = 0o664
+
+# Files next to the database in WAL mode
+WAL_SUFFIXES = ('-wal', '-shm')
 
 
 SQL_INSERT = ('''
@@ -26,6 +50,243 @@ SQL_INSERT = ('''
   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''')
 SQL_DELETE = ('''DELETE FROM tasks WHERE id = ?''')
 SQL_SELECT_ONE = ('''SELECT * FROM tasks WHERE id = ? LIMIT 1''')
+SQL_SELECT_STATUS = ('''SELECT * FROM tasks WHERE status = ? ORDER BY id LIMIT ?''')
+SQL_SELECT_PROCESSED = ('''
+  SELECT * FROM tasks
+  WHERE status IN (?, ?, ?, ?)
+  ORDER BY date DESC
+  LIMIT ?''')
+SQL_SELECT_ALL = ('''SELECT * FROM tasks LIMIT ?''')
+SQL_UPDATE_STATUS = ('''UPDATE tasks SET status = ?, date = ? WHERE id = ?''')
+SQL_DELETE_INVENTORY = ('''UPDATE tasks SET inventory_data = '' WHERE id = ?''')
+SQL_COUNT_STATUS = ('''SELECT COUNT(*) FROM tasks WHERE status = ?''')
+SQL_SELECT_CLAIMABLE = ('''SELECT id FROM tasks WHERE status = ? ORDER BY id LIMIT ?''')
+SQL_CLAIM = ('''
+  UPDATE tasks SET status = ?, owner = ?, lease_expires = ?, date = ?
+  WHERE id = ? AND status = ?''')
+# Active tasks without a lease were started before leases were introduced
+SQL_REQUEUE_EXPIRED = ('''
+  UPDATE tasks SET status = ?, owner = NULL, lease_expires = NULL
+  WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)''')
+SQL_HEARTBEAT = ('''
+  UPDATE tasks SET lease_expires = ?
+  WHERE id = ? AND owner = ? AND status = ?''')
+SQL_COMPLETE = ('''
+  UPDATE tasks SET status = ?, date = ?, owner = NULL, lease_expires = NULL
+  WHERE id = ? AND owner = ?''')
+
+# Default task lease in seconds
+LEASE_TIME = netspot_settings.TASK_LEASE
+
+# Unix datagram socket the task runner listens on for new tasks
+NOTIFY_SOCKET = netspot_settings.TASK_NOTIFY_SOCKET
+
+# Persistent connections per thread. Key: database path
+_CONNECTIONS = threading.local()
+
+
+def get_connection(database):
+  """Return the calling thread's connection to database.
+
+  A connection is opened once per thread and database and kept open. New
+  connections use WAL journaling, so readers don't block the writer, and
+  wait up to BUSY_TIMEOUT seconds for locks instead of failing with
+  'database is locked'. The schema is created or migrated on first use.
+
+  The WAL files are created with the umask of the first process that opens
+  the database, so the database and WAL files owned by the calling process
+  are set to FILE_MODE.
+
+  Args:
+    database: string, path to the database file
+
+  Returns:
+    sqlite3 Connection object
+  """
+
+  if getattr(_CONNECTIONS, 'pid', None) != os.getpid():
+    _CONNECTIONS.pid = os.getpid()
+    _CONNECTIONS.connections = dict()
+
+  connection = _CONNECTIONS.connections.get(database)
+
+  if connection is None:
+    connection = sqlite3.connect(database, timeout=BUSY_TIMEOUT)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+
+    # Create or migrate schema. Processes opening a new database at the same
+    # time wait for each other
+    with immediate_transaction(connection):
+      connection.execute(SCHEMA)
+      columns = [row[1] for row in connection.execute('PRAGMA table_info(tasks)')]
+      for column, column_type in MIGRATIONS:
+        if column not in columns:
+          try:
+            connection.execute('ALTER TABLE tasks ADD COLUMN %s %s' % (column, column_type))
+          except sqlite3.OperationalError as error:
+            # Added by another process
+            if 'duplicate column' not in str(error):
+              raise
+      for index in INDEXES:
+        connection.execute(index)
+
+    set_file_modes(database)
+
+    _CONNECTIONS.connections[database] = connection
+
+  return connection
+
+def set_file_modes(database):
+  """Set FILE_MODE on the database and WAL files owned by this process.
+
+  Args:
+    database: string, path to the database file
+  """
+
+  for path in [database] + [database + suffix for suffix in WAL_SUFFIXES]:
+    try:
+      if os.stat(path).st_uid == os.getuid():
+        os.chmod(path, FILE_MODE)
+    except OSError:
+      # Not created yet
+      pass
+
+@contextmanager
+def immediate_transaction(connection):
+  """Run statements in a transaction that holds the database write lock.
+
+  Args:
+    connection: sqlite3 Connection object
+  """
+
+  isolation_level = connection.isolation_level
+  connection.isolation_level = None
+  connection.execute('BEGIN IMMEDIATE')
+
+  try:
+    yield
+    connection.execute('COMMIT')
+  except:
+    connection.execute('ROLLBACK')
+    raise
+  finally:
+    connection.isolation_level = isolation_level
+
+def close_connections():
+  """Close the calling thread's connections."""
+
+  for connection in getattr(_CONNECTIONS, 'connections', {}).values():
+    connection.close()
+
+  _CONNECTIONS.connections = dict()
+
+
+def notify_runner(path=NOTIFY_SOCKET):
+  """Wake up the task runner listening on path.
+
+  Errors are ignored, the runner falls back to polling.
+
+  Args:
+    path: string, Unix socket path
+
+  Returns:
+    Boolean: True if the notification was sent
+  """
+
+  if not path:
+    return False
+
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+  try:
+    sock.setblocking(False)
+    sock.sendto('task', path)
+    return True
+  except socket.error:
+    return False
+  finally:
+    sock.close()
+
+
+class TaskListener(threading.Thread):
+  """Thread that calls callback when a new task notification is received."""
+
+  def __init__(self, callback, path=NOTIFY_SOCKET):
+    """Init.
+
+    Args:
+      callback: function, called without arguments for every notification
+      path: string, Unix socket path
+    """
+
+    threading.Thread.__init__(self, name='taskdb-listener')
+    self.daemon = True
+    self.callback = callback
+    self.path = path
+    self.sock = None
+    self.stopped = threading.Event()
+
+  def bind(self):
+    """Bind the notification socket.
+
+    A stale socket file is replaced. The socket is not taken over if another
+    runner is listening on it.
+
+    Returns:
+      Boolean: True if bound
+    """
+
+    if not self.path:
+      return False
+
+    # Remove stale socket left by a runner that didn't shut down cleanly
+    if os.path.exists(self.path) and not notify_runner(self.path):
+      try:
+        os.remove(self.path)
+      except OSError:
+        return False
+
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+      self.sock.bind(self.path)
+    except socket.error as error:
+      if error.errno != errno.EADDRINUSE:
+        print 'Failed to bind %s: %s' % (self.path, error)
+      self.sock.close()
+      self.sock = None
+      return False
+
+    # The web server runs as a different user
+    os.chmod(self.path, 0o666)
+    self.sock.settimeout(1)
+
+    return True
+
+  def run(self):
+    while not self.stopped.is_set():
+      try:
+        self.sock.recv(64)
+      except socket.timeout:
+        continue
+      except socket.error:
+        break
+
+      self.callback()
+
+  def stop(self):
+    """Stop listening and remove the socket file."""
+
+    self.stopped.set()
+
+    if self.sock:
+      self.join(2)
+      self.sock.close()
+      self.sock = None
+
+      try:
+        os.remove(self.path)
+      except OSError:
+        pass
 
 class Task(object):
   """Task object."""
@@ -35,7 +296,8 @@ class Task(object):
       'ACTIVE': 2,
       'PROCESSED': 3,
       'PROCESSED_FAILURES': 4,
-      'ANSIBLE_ERROR': 5}
+      'ANSIBLE_ERROR': 5,
+      'TIMEOUT': 6}
 
   def __init__(self,
                id,
@@ -47,7 +309,9 @@ class Task(object):
                extra_vars=None,
                become_pass=None,
                verbosity=0,
-               hosts=None):
+               hosts=None,
+               owner=None,
+               lease_expires=None):
 
     self.id = id
     self.status = status
@@ -59,6 +323,8 @@ class Task(object):
     self.become_pass = become_pass
     self.verbosity = verbosity
     self.hosts = hosts
+    self.owner = owner
+    self.lease_expires = lease_expires
 
 class DatabaseMissing(Exception):
   """Database file missing."""
@@ -67,22 +333,19 @@ class DatabaseMissing(Exception):
 class TaskDB(object):
   """TaskDB."""
 
-  def __init__(self, database=netspot_settings.TASK_DATABASE):
+  def __init__(self, database=netspot_settings.TASK_DATABASE, notify_socket=NOTIFY_SOCKET):
     self.database = database
+    self.notify_socket = notify_socket
     self.session = None
 
   def _open_session(self):
-    """Returns a datbase session."""
-
-    if not os.path.isfile(self.database):
-      self.setup()
+    """Get the thread's persistent database session."""
 
     if not self.session:
       try:
-        with sqlite3.connect(self.database) as session:
-          self.session = session
-      except sqlite3.OperationalError:
-        print 'Failed to open database file.'
+        self.session = get_connection(self.database)
+      except sqlite3.DatabaseError:
+        raise DatabaseMissing('Database file missing or damaged.')
 
   def __enter__(self):
     """Open DB session."""
@@ -90,20 +353,9 @@ class TaskDB(object):
     return self
 
   def __exit__(self, ex_type, ex_value, traceback):
-    """Close DB session."""
-    if self.session:
-      self.session.close()
-
-  def setup(self):
-    """Setup queue table."""
-
-    try:
-      with sqlite3.connect(self.database) as session:
-        session.execute(SCHEMA)
-        session.commit()
-    except sqlite3.OperationalError:
-      raise DatabaseMissing('Database file missing or damaged.')
-
+    """Release DB session. The connection is kept open for reuse."""
+    if self.session and ex_type:
+      self.session.rollback()
 
   def delete_task(self, task_id):
     """Delete task from database.
@@ -112,7 +364,7 @@ class TaskDB(object):
       task_id: integer, task ID
     """
 
-    self.session.execute(SQL_DELETE, [str(task_id)])
+    self.session.execute(SQL_DELETE, [task_id])
     self.session.commit()
 
   def delete_inventory_data(self, task_id):
@@ -121,13 +373,8 @@ class TaskDB(object):
     Args:
       task_id: integer, task ID
     """
-    sql = ('''
-           UPDATE tasks
-           SET inventory_data = ''
-           WHERE id = %s;
-    ''')
 
-    self.session.execute(sql % task_id)
+    self.session.execute(SQL_DELETE_INVENTORY, [task_id])
     self.session.commit()
 
   def get_task(self, task_id):
@@ -141,7 +388,7 @@ class TaskDB(object):
     """
 
     if self.session:
-      row = self.session.execute(SQL_SELECT_ONE, str(task_id))
+      row = self.session.execute(SQL_SELECT_ONE, [task_id])
 
     try:
       task = Task(*row.fetchone())
@@ -159,21 +406,30 @@ class TaskDB(object):
     Returns:
       tasks: list, list of Task objects
     """
-    sql = ('''
-        SELECT *
-        FROM tasks
-        WHERE status = %s
-        LIMIT %s
-    ''')
 
     tasks = []
     if self.session:
-      for row in self.session.execute(sql % (status, limit)):
+      for row in self.session.execute(SQL_SELECT_STATUS, (status, limit)):
         task = Task(*row)
         tasks.append(task)
 
     return tasks
 
+  def count_tasks_by_status(self, status):
+    """Returns the number of tasks with status.
+
+    Args:
+      status: integer, Task STATUS_CODES
+
+    Returns:
+      integer, number of tasks
+    """
+
+    if not self.session:
+      return 0
+
+    return self.session.execute(SQL_COUNT_STATUS, [status]).fetchone()[0]
+
   def get_processed_tasks(self, limit=1):
     """Returns tasks with any processed status.
 
@@ -183,20 +439,14 @@ class TaskDB(object):
     Returns:
       tasks: list, list of Task objects
     """
-    sql = ('''
-        SELECT *
-        FROM tasks
-        WHERE status = %s OR status = %s or status = %s
-        ORDER BY date DESC
-        LIMIT %s
-    ''')
 
     tasks = []
     if self.session:
-      for row in self.session.execute(sql % (Task.STATUS_CODES['PROCESSED'],
-                                             Task.STATUS_CODES['PROCESSED_FAILURES'],
-                                             Task.STATUS_CODES['ANSIBLE_ERROR'],
-                                             limit)):
+      for row in self.session.execute(SQL_SELECT_PROCESSED, (Task.STATUS_CODES['PROCESSED'],
+                                                             Task.STATUS_CODES['PROCESSED_FAILURES'],
+                                                             Task.STATUS_CODES['ANSIBLE_ERROR'],
+                                                             Task.STATUS_CODES['TIMEOUT'],
+                                                             limit)):
         task = Task(*row)
         tasks.append(task)
 
@@ -220,10 +470,87 @@ class TaskDB(object):
                                       task.hosts))
     self.session.commit()
 
+    # Wake up the runner
+    notify_runner(self.notify_socket)
+
+  def claim_tasks(self, owner, limit=1, lease=LEASE_TIME):
+    """Atomically claim queued tasks.
+
+    Claimed tasks are marked active and leased to owner. Tasks whose lease
+    has expired, eg. because their runner crashed, are queued again first.
+
+    Args:
+      owner: string, unique ID of the claiming runner
+      limit: integer, max number of tasks to claim
+      lease: integer, lease time in seconds. Renew with heartbeat()
+
+    Returns:
+      tasks: list, claimed Task objects
+    """
+
+    now = time.time()
+    active = Task.STATUS_CODES['ACTIVE']
+    queued = Task.STATUS_CODES['QUEUED']
+
+    # No other connection can write between selecting and claiming
+    with immediate_transaction(self.session):
+      self.session.execute(SQL_REQUEUE_EXPIRED, (queued, active, now))
+
+      task_ids = [row[0] for row in self.session.execute(SQL_SELECT_CLAIMABLE, (queued, limit))]
+      for task_id in task_ids:
+        self.session.execute(SQL_CLAIM, (active, owner, now + lease, datetime.now(), task_id, queued))
+
+    return [self.get_task(task_id) for task_id in task_ids]
+
+  def heartbeat(self, task_ids, owner, lease=LEASE_TIME):
+    """Renew the lease of active tasks.
+
+    Args:
+      task_ids: list, task IDs
+      owner: string, runner ID the tasks are leased to
+      lease: integer, lease time in seconds from now
+    """
+
+    expires = time.time() + lease
+
+    for task_id in task_ids:
+      self.session.execute(SQL_HEARTBEAT, (expires, task_id, owner, Task.STATUS_CODES['ACTIVE']))
+    self.session.commit()
+
+  def complete_task(self, task_id, owner, status):
+    """Set the final status of a leased task and release the lease.
+
+    Args:
+      task_id: integer, task ID
+      owner: string, runner ID the task is leased to
+      status: integer, Task STATUS_CODES
+
+    Returns:
+      Boolean: True if updated, False if the task is no longer leased to owner
+    """
+
+    cursor = self.session.execute(SQL_COMPLETE, (status, datetime.now(), task_id, owner))
+    self.session.commit()
+
+    return cursor.rowcount == 1
+
+  def release_task(self, task_id, owner):
+    """Queue a leased task again, eg. on shutdown before it was started.
+
+    Args:
+      task_id: integer, task ID
+      owner: string, runner ID the task is leased to
+
+    Returns:
+      Boolean: True if released
+    """
+
+    return self.complete_task(task_id, owner, Task.STATUS_CODES['QUEUED'])
+
   def print_tasks(self, limit=10):
     """Print tasks."""
 
-    for row in self.session.execute('SELECT * FROM tasks LIMIT %s' % limit):
+    for row in self.session.execute(SQL_SELECT_ALL, [limit]):
       print row
 
   def update_status(self, task_id, status):
@@ -234,13 +561,7 @@ class TaskDB(object):
       status: integer, Task STATUS_CODES
     """
 
-    sql = ('''
-            UPDATE tasks
-            SET status="%s", date="%s"
-            WHERE id=%s
-    ''')
-
-    self.session.execute(sql % (status, datetime.now(), task_id))
+    self.session.execute(SQL_UPDATE_STATUS, (status, datetime.now(), task_id))
     self.session.commit()
 
 def main():
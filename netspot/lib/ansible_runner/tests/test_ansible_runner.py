@@ -6,6 +6,11 @@
 """
 
 import mock
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 import ansible_runner
@@ -30,6 +35,12 @@ class MockRunner(object):
     self.return_value = {'failures': 0}
 
   def run(self):
+    if 'slow' in self.playbook:
+      time.sleep(30)
+    if 'crash' in self.playbook:
+      os._exit(1)
+    if 'bug' in self.playbook:
+      raise KeyError('bug')
     if 'yml' in self.playbook:
       return self.return_value
     else:
@@ -70,7 +81,109 @@ class TestTaskProcessor(unittest.TestCase):
 
     status = self.tp.process_task(task)
     self.assertEqual(status, taskdb.Task.STATUS_CODES['ANSIBLE_ERROR'])
+  def test_process_backend(self):
+    tp = ansible_runner.TaskProcessor(num_threads=0, backend='process', timeout=1)
+    task = taskdb.Task(1,
+                       status=taskdb.Task.STATUS_CODES['ACTIVE'],
+                       playbook='mock_play.yml',
+                       inventory_data='{}',
+                       extra_vars='{}',
+                       hosts='test_host')
 
+    self.assertEqual(taskdb.Task.STATUS_CODES['PROCESSED'], tp.execute(task))
+
+    # Killed after the timeout
+    task.playbook = 'slow.yml'
+    start = time.time()
+    self.assertEqual(taskdb.Task.STATUS_CODES['TIMEOUT'], tp.execute(task))
+    self.assertLess(time.time() - start, 10)
+
+    # Process exits without a result
+    task.playbook = 'crash.yml'
+    self.assertEqual(taskdb.Task.STATUS_CODES['ANSIBLE_ERROR'], tp.execute(task))
+
+class TestDispatch(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+    self.database = os.path.join(self.path, 'taskdb.db')
+    self.tp = ansible_runner.TaskProcessor(num_threads=0, database=self.database)
+
+    with taskdb.TaskDB(self.database) as db_conn:
+      for _ in range(5):
+        db_conn.add_task(taskdb.Task(None,
+                                     status=taskdb.Task.STATUS_CODES['QUEUED'],
+                                     username='mock_user',
+                                     playbook='mock_play.yml',
+                                     inventory_data='{}',
+                                     extra_vars='{}',
+                                     hosts='test_host'))
+
+  def tearDown(self):
+    taskdb.close_connections()
+    shutil.rmtree(self.path)
+
+  def test_dispatch(self):
+    # One task per free worker
+    self.tp.num_threads = 3
+    self.assertEqual(3, self.tp.dispatch())
+    self.assertEqual(3, self.tp.task_queue.qsize())
+    self.assertEqual(2, self.tp.queue_depth)
+
+    # No free workers
+    self.assertEqual(0, self.tp.dispatch())
+
+    # Dispatched tasks are active
+    with taskdb.TaskDB(self.database) as db_conn:
+      active = db_conn.get_tasks_by_status(taskdb.Task.STATUS_CODES['ACTIVE'], limit=10)
+    self.assertEqual([1, 2, 3], [task.id for task in active])
+
+    # Not started tasks are queued again on shutdown
+    self.tp.requeue()
+    with taskdb.TaskDB(self.database) as db_conn:
+      self.assertEqual(5, db_conn.count_tasks_by_status(taskdb.Task.STATUS_CODES['QUEUED']))
+
+  def test_heartbeat_after_shutdown(self):
+    self.tp.num_threads = 1
+    self.tp.lease = 0.3
+    self.tp.dispatch()
+    self.tp.task_queue.get()
+
+    # Task is still running after shutdown, its lease is renewed
+    worker = threading.Thread(target=time.sleep, args=[1])
+    worker.start()
+    self.tp.workers.append(worker)
+    self.tp.shutdown(None, None)
+
+    runner = threading.Thread(target=self.tp.run)
+    runner.start()
+    time.sleep(0.6)
+
+    with taskdb.TaskDB(self.database) as db_conn:
+      self.assertNotIn(1, [task.id for task in db_conn.claim_tasks('runner2', limit=5)])
+      self.assertGreater(db_conn.get_task(1).lease_expires, time.time())
+
+    runner.join(5)
+    self.assertFalse(runner.is_alive())
+
+  def test_task_handler_error(self):
+    ansible_runner.ansible_api.Runner = MockRunner
+    self.tp.num_threads = 2
+    self.tp.backend = 'thread'
+    with taskdb.TaskDB(self.database) as db_conn:
+      db_conn.session.execute("UPDATE tasks SET playbook = 'bug.yml' WHERE id = 1")
+    self.tp.dispatch()
+
+    worker = threading.Thread(target=self.tp.task_handler, args=[self.tp.task_queue])
+    worker.start()
+    while not self.tp.task_queue.empty():
+      time.sleep(0.1)
+    self.tp.shutting_down = True
+    worker.join(5)
+
+    # The task failed, the worker went on with the next task
+    with taskdb.TaskDB(self.database) as db_conn:
+      self.assertEqual(taskdb.Task.STATUS_CODES['ANSIBLE_ERROR'], db_conn.get_task(1).status)
+      self.assertEqual(taskdb.Task.STATUS_CODES['PROCESSED'], db_conn.get_task(2).status)
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/python -tt
+"""TaskDB tests
+
+  Run: python -m unittest tests.test_taskdb
+
+"""
+
+import mock
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import taskdb
+
+QUEUED = taskdb.Task.STATUS_CODES['QUEUED']
+ACTIVE = taskdb.Task.STATUS_CODES['ACTIVE']
+PROCESSED = taskdb.Task.STATUS_CODES['PROCESSED']
+
+
+class TestTaskDB(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+    self.database = os.path.join(self.path, 'taskdb.db')
+
+    with taskdb.TaskDB(self.database) as db_conn:
+      for _ in range(3):
+        db_conn.add_task(taskdb.Task(None, status=QUEUED, playbook='mock_play.yml'))
+
+  def tearDown(self):
+    taskdb.close_connections()
+    shutil.rmtree(self.path)
+
+  def test_claim(self):
+    with taskdb.TaskDB(self.database) as db_conn:
+      first = db_conn.claim_tasks('runner1', limit=2)
+      second = db_conn.claim_tasks('runner2', limit=2)
+
+      # Each task is claimed once
+      self.assertEqual([1, 2], [task.id for task in first])
+      self.assertEqual([3], [task.id for task in second])
+      self.assertEqual(['runner1', 'runner1'], [task.owner for task in first])
+      self.assertEqual(ACTIVE, first[0].status)
+
+      # Only the owner completes a task
+      self.assertFalse(db_conn.complete_task(1, 'runner2', PROCESSED))
+      self.assertTrue(db_conn.complete_task(1, 'runner1', PROCESSED))
+      self.assertEqual(PROCESSED, db_conn.get_task(1).status)
+
+  def test_session(self):
+    with taskdb.TaskDB(self.database) as db_conn:
+      session = db_conn.session
+      self.assertEqual('wal', session.execute('PRAGMA journal_mode').fetchone()[0])
+      indexes = [row[1] for row in session.execute('PRAGMA index_list(tasks)')]
+      self.assertEqual(['tasks_date', 'tasks_status'], sorted(indexes))
+
+    # Connection is reused within the thread
+    with taskdb.TaskDB(self.database) as db_conn:
+      self.assertIs(session, db_conn.session)
+      self.assertEqual([1, 2], [task.id for task in db_conn.get_tasks_by_status(QUEUED, limit=2)])
+
+  def test_lease(self):
+    with taskdb.TaskDB(self.database) as db_conn:
+      db_conn.claim_tasks('runner1', limit=2, lease=-1)
+
+      # Renewed lease is kept, expired lease is queued again
+      db_conn.heartbeat([1], 'runner1', lease=60)
+      tasks = db_conn.claim_tasks('runner2', limit=3)
+
+      self.assertEqual([2, 3], [task.id for task in tasks])
+      self.assertEqual('runner1', db_conn.get_task(1).owner)
+      self.assertFalse(db_conn.complete_task(2, 'runner1', PROCESSED))
+
+  def test_migrate(self):
+    database = os.path.join(self.path, 'old.db')
+    session = sqlite3.connect(database)
+    session.execute('CREATE TABLE tasks(id INTEGER PRIMARY KEY, status INTEGER, date DATE, '
+                    'username TEXT, playbook TEXT, inventory_data TEXT, extra_vars TEXT, '
+                    'become_pass TEXT, verbosity INTEGER, hosts TEXT)')
+    session.execute('INSERT INTO tasks (status, playbook) VALUES (1, "mock_play.yml")')
+    session.execute('INSERT INTO tasks (status, playbook) VALUES (2, "mock_play.yml")')
+    session.commit()
+    session.close()
+
+    # Active task of the old runner has no lease and is queued again
+    with taskdb.TaskDB(database) as db_conn:
+      tasks = db_conn.claim_tasks('runner1', limit=2)
+      self.assertEqual([1, 2], [task.id for task in tasks])
+      self.assertEqual(['runner1', 'runner1'], [task.owner for task in tasks])
+
+  def test_migrate_concurrent(self):
+    database = os.path.join(self.path, 'old.db')
+    session = sqlite3.connect(database)
+    session.execute('CREATE TABLE tasks(id INTEGER PRIMARY KEY, status INTEGER, date DATE)')
+    session.close()
+
+    # Column added by another process meanwhile
+    with mock.patch.object(taskdb, 'MIGRATIONS', [('owner', 'TEXT'), ('owner', 'TEXT')]):
+      with taskdb.TaskDB(database) as db_conn:
+        columns = [row[1] for row in db_conn.session.execute('PRAGMA table_info(tasks)')]
+    self.assertEqual(['id', 'status', 'date', 'owner'], columns)
+
+  def test_file_modes(self):
+    database = os.path.join(self.path, 'new.db')
+
+    umask = os.umask(0o077)
+    try:
+      taskdb.get_connection(database)
+    finally:
+      os.umask(umask)
+
+    for path in [database, database + '-wal', database + '-shm']:
+      self.assertEqual(taskdb.FILE_MODE, os.stat(path).st_mode & 0o777)
+
+  def test_notify(self):
+    path = os.path.join(self.path, 'taskdb.sock')
+    notified = threading.Event()
+
+    listener = taskdb.TaskListener(notified.set, path=path)
+    self.assertTrue(listener.bind())
+    listener.start()
+
+    # Only one listener per socket
+    self.assertFalse(taskdb.TaskListener(notified.set, path=path).bind())
+
+    try:
+      with taskdb.TaskDB(self.database, notify_socket=path) as db_conn:
+        db_conn.add_task(taskdb.Task(None, status=QUEUED, playbook='mock_play.yml'))
+
+      self.assertTrue(notified.wait(5))
+    finally:
+      listener.stop()
+
+    self.assertFalse(os.path.exists(path))
+    self.assertFalse(taskdb.notify_runner(path))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/python -tt
+"""Benchmark memory use of collected MAC and ARP entries
+
+  Run: python -m benchmarks.record_memory
+
+"""
+
+import argparse
+import sys
+
+from records import ARPEntry, MACEntry
+
+# Arguments
+parser = argparse.ArgumentParser(description='Record memory benchmark')
+parser.add_argument('--entries', help='Number of ARP and MAC entries', type=int, default=80000)
+
+
+def size(entries):
+  """Return the memory used by the entry containers in bytes.
+
+  Field values are shared between both layouts and are not counted.
+  """
+
+  total = sys.getsizeof(entries)
+  for entry in entries:
+    total += sys.getsizeof(entry)
+
+  return total
+
+def main():
+  """Run benchmark."""
+
+  args = parser.parse_args()
+
+  macs = ['00:%02X:%02X:%02X:%02X:%02X' % (i >> 32 & 0xff, i >> 24 & 0xff, i >> 16 & 0xff,
+                                           i >> 8 & 0xff, i & 0xff) for i in range(args.entries)]
+  ips = ['10.%s.%s.%s' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff) for i in range(args.entries)]
+
+  # Dicts as built before the records
+  arp_dicts = [{'interface': 'irb.0', 'mac': mac, 'last_move': None, 'moves': None,
+                'vlan': None, 'static': None, 'ip': ip} for mac, ip in zip(macs, ips)]
+  mac_dicts = [{'interface': 'ae0.0', 'mac': mac, 'last_move': None, 'moves': None,
+                'vlan': 'servers', 'static': False, 'ip': ip} for mac, ip in zip(macs, ips)]
+
+  arp_records = [ARPEntry('irb.0', mac, ip) for mac, ip in zip(macs, ips)]
+  mac_records = [MACEntry('ae0.0', mac, 'servers', False, ip=ip) for mac, ip in zip(macs, ips)]
+
+  print 'Entries: %s ARP, %s MAC' % (args.entries, args.entries)
+  for name, dicts, records in (('ARP', arp_dicts, arp_records), ('MAC', mac_dicts, mac_records)):
+    dict_size = size(dicts)
+    record_size = size(records)
+    print '%s: dicts %.1f MB, records %.1f MB (%.0f%% less)' % (name,
+                                                               dict_size / 1024.0 / 1024,
+                                                               record_size / 1024.0 / 1024,
+                                                               100 - 100.0 * record_size / dict_size)
+
+if __name__ == '__main__':
+  main()
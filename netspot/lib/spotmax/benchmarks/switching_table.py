@@ -0,0 +1,82 @@
+#!/usr/bin/python -tt
+"""Benchmark 'show ethernet-switching table' parsing
+
+  Run: python -m benchmarks.switching_table
+
+"""
+
+import argparse
+import re
+import resource
+import time
+
+import parsers
+
+# Arguments
+parser = argparse.ArgumentParser(description='Switching table parser benchmark')
+parser.add_argument('--entries', help='Number of MAC entries', type=int, default=100000)
+
+# Regular expression as used before the shared parser
+RE_SWITCHING_TABLE = (r'\s+([\w\d-]+)\s+' + r'\s?([*\w\d:]+)\s+' + r'\s?([\w]+) ' +
+                      r'\s+([-\d:]+)' + r'\s+([-.\w\d/]+)')
+
+
+def generate(entries):
+  """Return a switching table with entries MAC addresses."""
+
+  lines = ['Ethernet switching table : %s entries, %s learned' % (entries, entries),
+           'Routing instance : default-switch',
+           '    Vlan                MAC                 MAC         Age    Logical',
+           '    name                address             flags              interface']
+
+  for i in range(entries):
+    mac = ':'.join('%02x' % (i >> shift & 0xff) for shift in (40, 32, 24, 16, 8, 0))
+    if i % 100 == 0:
+      mac = '*'
+    lines.append('    vlan-%-15s %-19s %-10s %4s   ge-%s/0/%s.0' % (i % 4000, mac,
+                                                                    'Static' if i % 50 == 0 else 'D',
+                                                                    '-', i / 48 % 10, i % 48))
+
+  return '\n'.join(lines) + '\n'
+
+def legacy_parse(output):
+  """Parse as done before the shared parser."""
+
+  mac_result = list()
+
+  for mac in re.findall(RE_SWITCHING_TABLE, output):
+    if mac[1] == '*':
+      continue
+
+    mac_result.append({'interface': mac[4],
+                       'mac': mac[1].upper(),
+                       'vlan': mac[0],
+                       'moves': None,
+                       'last_move': None,
+                       'static': mac[2] == 'Static'})
+
+  return mac_result
+
+def main():
+  """Run benchmark."""
+
+  args = parser.parse_args()
+  output = generate(args.entries)
+
+  print 'Switching table: %s entries, %.1f MB' % (args.entries, len(output) / 1024.0 / 1024)
+
+  start = time.time()
+  entries = list(parsers.parse_switching_table(output, upper=True))
+  duration = time.time() - start
+  print 'Shared parser: %s entries in %.2fs, max RSS %s MB' % (
+      len(entries), duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+  del entries
+
+  start = time.time()
+  entries = legacy_parse(output)
+  duration = time.time() - start
+  print 'findall and dicts (legacy): %s entries in %.2fs, max RSS %s MB' % (
+      len(entries), duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+if __name__ == '__main__':
+  main()
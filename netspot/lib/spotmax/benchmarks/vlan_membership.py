@@ -0,0 +1,86 @@
+#!/usr/bin/python -tt
+"""Benchmark VLAN membership lookup in NetSPOT.update_interfaces
+
+  Run: python -m benchmarks.vlan_membership
+
+"""
+
+import argparse
+import time
+
+from collections import defaultdict
+
+from netspot import NetSPOT
+
+# Arguments
+parser = argparse.ArgumentParser(description='VLAN membership benchmark')
+parser.add_argument('--vlans', help='Number of VLANs', type=int, default=4000)
+parser.add_argument('--ports', help='Number of access ports', type=int, default=400)
+parser.add_argument('--trunks', help='Number of trunk ports carrying all VLANs', type=int, default=8)
+
+
+class SyntheticDevice(object):
+  """QFX core like device with trunks carrying every VLAN."""
+
+  def __init__(self, num_vlans, num_ports, num_trunks):
+    self.vlans = list()
+    self.port_vlans = defaultdict(set)
+    self.interfaces = dict()
+    self.lldp = dict()
+
+    trunks = ['ae%s' % i for i in range(num_trunks)]
+    ports = ['xe-%s/0/%s' % (i / 48, i % 48) for i in range(num_ports)]
+
+    for port in trunks + ports:
+      self.interfaces[port] = {'description': port,
+                               'mac_address': '54:e0:32:30:87:09',
+                               'speed': 10000}
+
+    for vlan_id in range(1, num_vlans + 1):
+      vlan_data = {'vlan': str(vlan_id),
+                   'name': 'vlan-%s' % vlan_id,
+                   'untagged_interfaces': ports[vlan_id % num_ports::num_vlans],
+                   'tagged_interfaces': trunks}
+      self.vlans.append(vlan_data)
+
+      for interface in vlan_data['untagged_interfaces'] + vlan_data['tagged_interfaces']:
+        self.port_vlans[interface].add(vlan_data['vlan'])
+
+def legacy_port_vlans(device, port):
+  """VLAN lookup as done before the reverse index."""
+
+  vlans = list()
+  for vlan in device.vlans:
+    if port in vlan['tagged_interfaces']:
+      vlans.append(vlan['vlan'])
+    if port in vlan['untagged_interfaces']:
+      vlans.append(vlan['vlan'])
+
+  return vlans
+
+def main():
+  """Run benchmark."""
+
+  args = parser.parse_args()
+  device = SyntheticDevice(args.vlans, args.ports, args.trunks)
+
+  print 'VLANs: %s, ports: %s' % (len(device.vlans), len(device.interfaces))
+
+  start = time.time()
+  legacy = dict((port, sorted(legacy_port_vlans(device, port), key=int)) for port in device.interfaces)
+  legacy_time = time.time() - start
+
+  start = time.time()
+  interfaces = NetSPOT._interfaces(device)
+  index_time = time.time() - start
+
+  # Same result
+  for interface in interfaces:
+    assert interface['vlan'] == ', '.join(legacy[interface['interface']])
+
+  print 'VLAN membership, list scan: %.3fs' % legacy_time
+  print 'update_interfaces with reverse index: %.3fs' % index_time
+  print 'Speedup: %.0fx' % (legacy_time / index_time)
+
+if __name__ == '__main__':
+  main()
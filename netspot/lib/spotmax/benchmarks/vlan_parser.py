@@ -0,0 +1,112 @@
+#!/usr/bin/python -tt
+"""Benchmark 'show vlans detail' parsing on the recorded corpus
+
+  Run: python -m benchmarks.vlan_parser
+
+"""
+
+import argparse
+import os
+import re
+import resource
+import time
+
+import parsers
+
+# Recorded device output
+DATA = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+# Arguments
+parser = argparse.ArgumentParser(description='VLAN parser benchmark')
+parser.add_argument('--size', help='Size of generated output in MB', type=int, default=20)
+
+
+def generate(name, size):
+  """Repeat a recorded output until it is size MB."""
+
+  with open(os.path.join(DATA, name + '.txt')) as output:
+    sample = output.read()
+
+  return sample * (size * 1024 * 1024 / len(sample) + 1)
+
+def legacy_parse_vlans(output):
+  """EX parser as done before the line oriented parser."""
+
+  vlans = list()
+
+  for entry in output.split('VLAN:'):
+    vlan_name = re.search(r'([\w\d-]+), 802', entry)
+    vlan_id = re.search(r'Tag: ([\d\w]+),', entry)
+
+    interfaces = list()
+    for members in ('Untagged', 'Tagged'):
+      found = re.findall(members + r' interfaces: ([\w\s*.,\/-]+)\n', entry)
+      if found:
+        found = found[0].replace('*', '').replace('\n', '').replace(',', '').replace('.0', '')
+        interfaces.append(filter(None, found.split(' ')))
+      else:
+        interfaces.append([])
+
+    try:
+      vlans.append({'vlan': vlan_id.groups(0)[0],
+                    'name': vlan_name.groups(0)[0],
+                    'untagged_interfaces': interfaces[0],
+                    'tagged_interfaces': interfaces[1]})
+    except AttributeError:
+      continue
+
+  return vlans
+
+def legacy_parse_vlans_qfx(output):
+  """QFX parser as done before the line oriented parser."""
+
+  vlans = list()
+
+  for entry in output.split('Total MAC count'):
+    tagged = [interface.replace('*', '').replace('.0', '')
+              for interface in re.findall(r'([\w\d\/*.-]+),tagged,', entry)]
+    untagged = [interface.replace('*', '').replace('.0', '')
+                for interface in re.findall(r'([\w\d\/*.-]+),untagged,', entry)]
+
+    vlan_name = re.search(r'VLAN Name: ([\w\d-]+)\s', entry)
+    vlan_id = re.search(r'Tag: ([\d]+)\s', entry)
+
+    try:
+      vlans.append({'vlan': vlan_id.groups(0)[0],
+                    'name': vlan_name.groups(0)[0],
+                    'untagged_interfaces': untagged,
+                    'tagged_interfaces': tagged})
+    except AttributeError:
+      continue
+
+  return vlans
+
+def run(name, function, output):
+  """Run function on output and print throughput."""
+
+  start = time.time()
+  count = 0
+  for _ in function(output):
+    count += 1
+  duration = time.time() - start
+
+  print '%-28s %6s VLANs %6.2fs %6.1f MB/s  max RSS %s MB' % (
+      name, count, duration, len(output) / 1024.0 / 1024 / duration,
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+def main():
+  """Run benchmark."""
+
+  args = parser.parse_args()
+
+  for corpus, streaming, legacy in (('vlans_ex', parsers.parse_vlans, legacy_parse_vlans),
+                                    ('vlans_qfx', parsers.parse_vlans_qfx, legacy_parse_vlans_qfx)):
+    output = generate(corpus, args.size)
+    print '%s: %.1f MB' % (corpus, len(output) / 1024.0 / 1024)
+
+    # Streaming parser first, max RSS only grows
+    run('  line oriented parser', streaming, output)
+    run('  split and regex (legacy)', legacy, output)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python -tt
+
+"""Device session shared by discovery and data collection."""
+
+import time
+import warnings
+
+from multiprocessing.pool import ThreadPool
+
+
+class DeviceSession(object):
+  """Class that holds one open device connection and runs RPCs in the background.
+
+  RPCs are queued on a worker thread as soon as they are submitted, so the
+  caller can parse the output of one RPC while the next one is running on
+  the device. A NETCONF session runs one RPC at a time, therefore the
+  default is one worker.
+  """
+
+  def __init__(self, hostname, username, password, driver,
+               ssh_keyfile=None, timeout=60, workers=1):
+    """Init.
+
+    Args:
+      hostname: string, IP address or hostname of the device
+      username: string, username to login to device
+      password: string, password for the username
+      driver: NAPALM driver class, eg. get_network_driver('junos')
+      ssh_keyfile: string, path to SSH key file
+      timeout: integer, device RPC timeout in seconds
+      workers: integer, number of RPCs running at the same time
+    """
+
+    self.hostname = hostname
+    self.latency = dict()
+    self.pool = None
+
+    optional_args = dict()
+    if ssh_keyfile:
+      optional_args['key_file'] = ssh_keyfile
+
+    self.device = driver(hostname, username, password, timeout=timeout, optional_args=optional_args)
+    self.workers = workers
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def open(self):
+    """Open device connection.
+
+    Returns:
+      self
+    """
+
+    self.device.open()
+    self.pool = ThreadPool(self.workers)
+
+    return self
+
+  def close(self):
+    """Wait for submitted RPCs and close device connection."""
+
+    if self.pool:
+      self.pool.close()
+      self.pool.join()
+      self.pool = None
+
+    self.device.close()
+
+  def submit(self, method, *args):
+    """Queue a driver method.
+
+    Args:
+      method: string, driver method name eg. 'get_facts'
+      args: arguments to the method
+
+    Returns:
+      AsyncResult object, get() returns the method's return value
+    """
+
+    return self.pool.apply_async(self._run, [method, args])
+
+  def call(self, method, *args):
+    """Run a driver method and wait for the result.
+
+    Args:
+      method: string, driver method name eg. 'get_facts'
+      args: arguments to the method
+
+    Returns:
+      Return value of the method
+    """
+
+    return self.submit(method, *args).get()
+
+  def cli(self, command):
+    """Queue a CLI command.
+
+    Args:
+      command: string, CLI command
+
+    Returns:
+      AsyncResult object, get() returns the command output
+    """
+
+    return self.pool.apply_async(self._run_cli, [command])
+
+  def rpc(self, rpc, **kwargs):
+    """Queue a JUNOS RPC, eg. rpc('get_vlan_information', detail=True).
+
+    Args:
+      rpc: string, PyEZ RPC method name
+      kwargs: RPC arguments
+
+    Returns:
+      AsyncResult object, get() returns the RPC reply as an lxml Element
+    """
+
+    return self.pool.apply_async(self._run_rpc, [rpc, kwargs])
+
+  def _run(self, method, args, name=None):
+    """Run a driver method and record its latency."""
+
+    start = time.time()
+    try:
+      return getattr(self.device, method)(*args)
+    finally:
+      self.latency[name or method] = time.time() - start
+
+  def _run_cli(self, command):
+    """Run a CLI command and return its output."""
+
+    with warnings.catch_warnings(record=True):
+      warnings.filterwarnings('ignore')
+      output = self._run('cli', [[command]], name=command)
+
+    return output[command]
+
+  def _run_rpc(self, rpc, kwargs):
+    """Run a JUNOS RPC on the underlying PyEZ device and record its latency."""
+
+    start = time.time()
+    try:
+      return getattr(self.device.device.rpc, rpc)(**kwargs)
+    finally:
+      self.latency[rpc] = time.time() - start
+
+  def report(self):
+    """Return a printable per RPC latency summary."""
+
+    return ', '.join('%s: %.2fs' % (name, self.latency[name]) for name in sorted(self.latency))
+
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
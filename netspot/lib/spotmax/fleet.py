@@ -0,0 +1,224 @@
+#!/usr/bin/python -tt
+
+"""Run a function against many assets in parallel."""
+
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+# Cancel event of the device run in the current thread
+_CURRENT = threading.local()
+
+
+class Cancelled(Exception):
+  """Device run was cancelled after a timeout."""
+  pass
+
+
+def check_cancelled():
+  """Raise Cancelled if the device run in the calling thread timed out.
+
+  Functions run by Fleet call this before they write to the database, so a
+  device reported as timed out doesn't write its data afterwards. Does
+  nothing outside a fleet run.
+  """
+
+  cancel = getattr(_CURRENT, 'cancel', None)
+
+  if cancel is not None and cancel.is_set():
+    raise Cancelled('Cancelled after timeout')
+
+
+class FleetResult(object):
+  """Class to represent the outcome for one asset."""
+
+  def __init__(self, asset, success=False, duration=0.0, result=None, error=None, attempts=1):
+    """Init.
+
+    Args:
+      asset: string, asset name
+      success: boolean, True if the function returned without errors
+      duration: float, wall clock time in seconds
+      result: object, return value of the function
+      error: string, error message if failed
+      attempts: integer, number of times the function was run
+    """
+
+    self.asset = asset
+    self.success = success
+    self.duration = duration
+    self.result = result
+    self.error = error
+    self.attempts = attempts
+
+
+class FleetSummary(object):
+  """Class to summarize a fleet run."""
+
+  def __init__(self, results, duration):
+    self.results = results
+    self.duration = duration
+    self.succeeded = [result for result in results if result.success]
+    self.failed = [result for result in results if not result.success]
+
+  def report(self):
+    """Return a printable summary of the run."""
+
+    lines = list()
+
+    for result in sorted(self.failed, key=lambda k: k.asset):
+      lines.append('FAILED %s (%.1fs, %s attempts): %s' % (result.asset,
+                                                           result.duration,
+                                                           result.attempts,
+                                                           result.error))
+
+    if self.results:
+      durations = sorted(result.duration for result in self.results)
+      lines.append('Devices: %s, succeeded: %s, failed: %s' % (len(self.results),
+                                                               len(self.succeeded),
+                                                               len(self.failed)))
+      lines.append('Device time min/median/max: %.1fs/%.1fs/%.1fs' % (durations[0],
+                                                                      durations[len(durations) / 2],
+                                                                      durations[-1]))
+    else:
+      lines.append('No devices found.')
+
+    lines.append('Total run time: %.1fs' % self.duration)
+
+    return '\n'.join(lines)
+
+
+class Fleet(object):
+  """Run a function for a list of assets with a bounded number of workers."""
+
+  def __init__(self, workers=20, timeout=120, retries=0, backoff=5, retry_errors=(Exception,)):
+    """Init.
+
+    Args:
+      workers: integer, maximum number of devices processed at the same time
+      timeout: integer, maximum number of seconds per device and attempt
+      retries: integer, number of retries for timed out devices or retry_errors
+      backoff: integer, seconds to wait before the first retry. Doubled for every retry
+      retry_errors: tuple, exception classes that are retried. SystemExit is never retried
+    """
+
+    self.workers = workers
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+    self.retry_errors = retry_errors
+
+    # Held from the start of a device run until its thread exits
+    self.slots = threading.Semaphore(max(1, workers))
+
+  def run(self, function, assets, *args, **kwargs):
+    """Run function(asset, *args, **kwargs) for every asset.
+
+    Args:
+      function: callable, first argument is the asset
+      assets: list, assets to process
+
+    Returns:
+      FleetSummary object
+    """
+
+    start = time.time()
+
+    pool = ThreadPool(max(1, min(self.workers, len(assets))))
+    jobs = [pool.apply_async(self._run_retry, [function, asset, args, kwargs]) for asset in assets]
+    pool.close()
+
+    results = [job.get() for job in jobs]
+    pool.join()
+
+    return FleetSummary(results, time.time() - start)
+
+  def _run_retry(self, function, asset, args, kwargs):
+    """Run function for a single asset and retry with backoff if it fails.
+
+    Only timeouts and retry_errors are retried. A timed out attempt is
+    retried once its thread has exited, never while it is still connected.
+
+    Returns:
+      FleetResult object
+    """
+
+    duration = 0.0
+
+    for attempt in range(1, self.retries + 2):
+      if attempt > 1:
+        time.sleep(self.backoff * 2 ** (attempt - 2))
+
+        # Previous attempt still running, give up
+        if not finished.wait(self.timeout):
+          attempt -= 1
+          break
+
+      result, retry, finished = self._run_one(function, asset, args, kwargs)
+      duration += result.duration
+
+      if result.success or not retry:
+        break
+
+    result.attempts = attempt
+    result.duration = duration
+
+    return result
+
+  def _run_one(self, function, asset, args, kwargs):
+    """Run function for a single asset and enforce the timeout.
+
+    The function is run in its own daemon thread so a hung device is
+    reported as failed after the timeout. Its run is cancelled, see
+    check_cancelled(), and it keeps its worker slot until the thread exits,
+    so no more than workers devices are connected at the same time.
+
+    Returns:
+      (result, retry, finished): tuple, FleetResult object, True if the failure
+                                 may be retried and Event set when the thread exits
+    """
+
+    outcome = dict()
+    cancel = threading.Event()
+    finished = threading.Event()
+
+    def target():
+      """Call function and store the outcome."""
+      _CURRENT.cancel = cancel
+      try:
+        outcome['result'] = function(asset, *args, **kwargs)
+      except (Exception, SystemExit) as error:
+        outcome['error'] = '%s: %s' % (type(error).__name__, error)
+        outcome['retry'] = isinstance(error, self.retry_errors)
+      finally:
+        self.slots.release()
+        finished.set()
+
+    self.slots.acquire()
+    start = time.time()
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    thread.join(self.timeout)
+
+    duration = time.time() - start
+
+    if thread.is_alive():
+      cancel.set()
+      return (FleetResult(asset, duration=duration, error='Timeout after %ss' % self.timeout),
+              True, finished)
+    elif 'error' in outcome:
+      return FleetResult(asset, duration=duration, error=outcome['error']), outcome['retry'], finished
+
+    return (FleetResult(asset, success=True, duration=duration, result=outcome.get('result')),
+            False, finished)
+
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
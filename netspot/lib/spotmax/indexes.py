@@ -0,0 +1,124 @@
+#!/usr/bin/python -tt
+
+"""MongoDB indexes for the netspot collections."""
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+import netspot_settings
+
+# Indexes per collection
+INDEXES = {
+    netspot_settings.COLL_NETSPOT: [
+        IndexModel([('asset', ASCENDING)], name='asset', unique=True),
+        IndexModel([('groups', ASCENDING)], name='groups'),
+        IndexModel([('loopback', ASCENDING)], name='loopback'),
+        IndexModel([('interfaces.mac', ASCENDING)], name='interfaces_mac'),
+        IndexModel([('interfaces.interface', ASCENDING)], name='interfaces_interface'),
+    ],
+    netspot_settings.COLL_NETSPOT_GROUPS: [
+        IndexModel([('group', ASCENDING)], name='group', unique=True),
+    ],
+    netspot_settings.COLL_MACS: [
+        IndexModel([('asset', ASCENDING)], name='asset', unique=True),
+        IndexModel([('macs.mac', ASCENDING)], name='macs_mac'),
+        IndexModel([('macs.ip', ASCENDING)], name='macs_ip'),
+    ],
+    netspot_settings.COLL_MAC_ENTRIES: [
+        IndexModel([('asset', ASCENDING), ('interface', ASCENDING), ('vlan', ASCENDING),
+                    ('mac', ASCENDING)], name='asset_interface_vlan_mac', unique=True),
+        IndexModel([('mac', ASCENDING)], name='mac'),
+        IndexModel([('ip', ASCENDING)], name='ip'),
+    ],
+    netspot_settings.COLL_MAC_HISTORY: [
+        IndexModel([('asset', ASCENDING), ('last_seen', ASCENDING)], name='asset_last_seen'),
+        IndexModel([('mac', ASCENDING), ('first_seen', ASCENDING)], name='mac_first_seen'),
+        IndexModel([('last_seen', ASCENDING)], name='last_seen_ttl',
+                   expireAfterSeconds=netspot_settings.MAC_HISTORY_RETENTION * 86400),
+    ],
+    netspot_settings.COLL_IP: [
+        IndexModel([('ip', ASCENDING)], name='ip', unique=True),
+        IndexModel([('mac', ASCENDING)], name='mac'),
+        IndexModel([('date', ASCENDING), ('time', ASCENDING)], name='date_time'),
+    ],
+    netspot_settings.COLL_PLAYBOOK_LOGS: [
+        IndexModel([('date', DESCENDING), ('time', DESCENDING)], name='date_time'),
+        IndexModel([('playbook', ASCENDING)], name='playbook'),
+    ],
+}
+
+
+def _keys(key):
+  """Return index keys as a list of (field, direction) tuples."""
+
+  if hasattr(key, 'items'):
+    key = key.items()
+
+  return [(field, direction) for field, direction in key]
+
+def _matches(index, existing):
+  """Return True if an existing index has the keys and options of index.
+
+  Args:
+    index: dict, IndexModel document
+    existing: dict, index information from the database
+  """
+
+  if _keys(index['key']) != _keys(existing.get('key', [])):
+    return False
+
+  if bool(index.get('unique')) != bool(existing.get('unique')):
+    return False
+
+  return index.get('expireAfterSeconds') == existing.get('expireAfterSeconds')
+
+def missing_indexes(database):
+  """Return indexes that are missing in database or differ from INDEXES.
+
+  Args:
+    database: pymongo Database object
+
+  Returns:
+    missing: list of tuples, (collection, index name)
+  """
+
+  missing = list()
+
+  for collection in sorted(INDEXES):
+    existing = database[collection].index_information()
+
+    for index in INDEXES[collection]:
+      name = index.document['name']
+      if name not in existing or not _matches(index.document, existing[name]):
+        missing.append((collection, name))
+
+  return missing
+
+def ensure_indexes(database):
+  """Create all indexes in database. Existing indexes are left as is.
+
+  Args:
+    database: pymongo Database object
+
+  Returns:
+    errors: list of tuples, (collection, index name, error message)
+  """
+
+  errors = list()
+
+  for collection in sorted(INDEXES):
+    for index in INDEXES[collection]:
+      try:
+        database[collection].create_indexes([index])
+      except OperationFailure as error:
+        # Eg. duplicate values for a unique index
+        errors.append((collection, index.document['name'], str(error)))
+
+  return errors
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
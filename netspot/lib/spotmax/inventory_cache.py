@@ -0,0 +1,271 @@
+#!/usr/bin/python -tt
+
+"""File based cache for Ansible inventory data.
+
+One JSON file is kept per inventory filter so the cache is shared between
+the web application and ansible's dynamic inventory calls. Cached entries
+are invalidated on change notifications, see register(): group changes
+invalidate the entries that contain the group, asset changes the entries
+that contain the asset or whose filter matches it now.
+
+The web application, the collectors and the Ansible runner may run as
+different users sharing a group, so the cache directory and files are
+group writable.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import netspot_settings
+import notify
+
+from pymongo.errors import PyMongoError
+from spotmax import SpotMAX
+
+# File that marks the last invalidation
+GENERATION_FILE = 'generation'
+
+# Cache directory and file modes, writable by the group of the processes
+DIR_MODE = 0o2775
+FILE_MODE = 0o664
+
+# Set when an invalidation failed, stale entries may be left in the cache
+_INVALIDATION_FAILED = threading.Event()
+
+
+class InventoryCache(object):
+  """Class to cache inventory data per filter with a time to live."""
+
+  def __init__(self,
+               path=netspot_settings.INVENTORY_CACHE_PATH,
+               ttl=netspot_settings.INVENTORY_CACHE_TTL):
+    """Init.
+
+    Args:
+      path: string, cache directory. Caching is disabled if empty
+      ttl: integer, number of seconds a cached entry is valid
+    """
+
+    self.path = path
+    self.ttl = ttl
+
+  def _filename(self, key):
+    """Return cache file name for key."""
+
+    if isinstance(key, unicode):
+      key = key.encode('utf-8')
+
+    return os.path.join(self.path, 'nsinv-%s.json' % hashlib.sha1(key or '').hexdigest())
+
+  def _generation(self):
+    """Return time of the last invalidation."""
+
+    try:
+      return os.stat(os.path.join(self.path, GENERATION_FILE)).st_mtime
+    except OSError:
+      return 0
+
+  def get(self, key):
+    """Return cached data for key.
+
+    Args:
+      key: string, inventory filter
+
+    Returns:
+      data: dict or None if not cached, expired or invalidated
+    """
+
+    if not self.path or _INVALIDATION_FAILED.is_set():
+      return None
+
+    filename = self._filename(key)
+
+    try:
+      modified = os.stat(filename).st_mtime
+      if time.time() - modified > self.ttl:
+        return None
+
+      with open(filename) as cache_file:
+        entry = json.load(cache_file)
+    except (IOError, OSError, ValueError):
+      return None
+
+    if not isinstance(entry, dict) or entry.get('key') != key:
+      return None
+
+    return entry.get('data')
+
+  def set(self, key, data, started=None):
+    """Cache data for key.
+
+    Data is not cached if the cache was invalidated after started, since
+    it may have been read before the change that invalidated the cache.
+
+    Args:
+      key: string, inventory filter
+      data: dict, inventory data
+      started: float, time when reading the data started
+    """
+
+    if not self.path or _INVALIDATION_FAILED.is_set():
+      return
+
+    if started is not None and self._generation() >= started:
+      return
+
+    try:
+      if not os.path.isdir(self.path):
+        os.makedirs(self.path)
+        os.chmod(self.path, DIR_MODE)
+
+      # Write to a temporary file and rename to replace the entry atomically
+      handle, temp_name = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+    except (IOError, OSError):
+      return
+
+    try:
+      with os.fdopen(handle, 'w') as cache_file:
+        os.fchmod(cache_file.fileno(), FILE_MODE)
+        json.dump({'key': key, 'data': data}, cache_file)
+      os.rename(temp_name, self._filename(key))
+    except (IOError, OSError, TypeError, ValueError):
+      # Not writable or not JSON serializable
+      os.remove(temp_name)
+      return
+
+    # Invalidated while the entry was written
+    if started is not None and self._generation() >= started:
+      self._remove(self._filename(key))
+
+  def invalidate(self, groups=None, assets=None, matches=None):
+    """Invalidate cached entries.
+
+    All entries are invalidated if neither groups nor assets are given.
+    If an entry can't be invalidated, eg. it's not writable by this
+    process, the error is printed and the cache is no longer used by this
+    process.
+
+    Args:
+      groups: list, invalidate entries that contain these groups
+      assets: list, invalidate entries that contain these assets
+      matches: function, matches(key) returns True if the assets match the
+               entry's filter now. Invalidates these entries as well
+    """
+
+    if not self.path or not os.path.isdir(self.path):
+      return
+
+    try:
+      # Mark invalidation time for entries being built right now
+      generation = os.path.join(self.path, GENERATION_FILE)
+      with open(generation, 'w'):
+        pass
+      if os.stat(generation).st_uid == os.getuid():
+        os.chmod(generation, FILE_MODE)
+
+      filenames = [os.path.join(self.path, filename) for filename in os.listdir(self.path)
+                   if filename.startswith('nsinv-')]
+
+      for filename in filenames:
+        if (groups is None and assets is None) or self._stale(filename, groups, assets, matches):
+          self._remove(filename)
+    except (IOError, OSError) as error:
+      _INVALIDATION_FAILED.set()
+      print >>sys.stderr, 'Failed to invalidate inventory cache, cache disabled: %s' % error
+
+  @staticmethod
+  def _stale(filename, groups, assets, matches):
+    """Return True if the cached entry depends on the changed groups or assets."""
+
+    try:
+      with open(filename) as cache_file:
+        entry = json.load(cache_file)
+      data = entry['data']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+      return True
+
+    if groups and any(group in data for group in groups):
+      return True
+
+    if assets:
+      hosts = data.get('_meta', {}).get('hostvars', {})
+      if any(asset in hosts for asset in assets):
+        return True
+
+      if matches is not None and matches(entry.get('key')):
+        return True
+
+    return False
+
+  @staticmethod
+  def _remove(filename):
+    """Remove a cache file that may already be removed."""
+
+    try:
+      os.remove(filename)
+    except OSError as error:
+      if error.errno != errno.ENOENT:
+        raise
+
+
+def assets_match(search_filter, assets):
+  """Return True if any of the assets matches an inventory filter.
+
+  Args:
+    search_filter: string, inventory filter
+    assets: list, asset names
+
+  Returns:
+    Boolean, also True if the database can't be queried
+  """
+
+  inventory = SpotMAX(netspot_settings.DATABASE, netspot_settings.COLL_NETSPOT)
+  query = {'$and': [inventory.build_query(search_filter or ''), {'asset': {'$in': assets}}]}
+
+  try:
+    return inventory.collection.find_one(query, {'_id': 1}) is not None
+  except PyMongoError:
+    return True
+
+def invalidate(collection, operation, names):
+  """Invalidate the default inventory cache on a change notification.
+
+  Args:
+    collection: string, changed collection
+    operation: string, eg. 'update'
+    names: list, changed asset/group names or None if unknown
+  """
+
+  cache = InventoryCache()
+
+  if not names:
+    cache.invalidate()
+  elif collection == netspot_settings.COLL_NETSPOT_GROUPS:
+    cache.invalidate(groups=names)
+  elif operation == 'delete':
+    cache.invalidate(assets=names)
+  else:
+    # New or changed assets may match filters they didn't match before
+    cache.invalidate(assets=names, matches=lambda key: assets_match(key, names))
+
+def register():
+  """Invalidate the default inventory cache on change notifications.
+
+  Called by the processes that change assets or groups.
+  """
+
+  notify.subscribe(netspot_settings.COLL_NETSPOT, invalidate)
+  notify.subscribe(netspot_settings.COLL_NETSPOT_GROUPS, invalidate)
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
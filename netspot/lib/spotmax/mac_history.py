@@ -0,0 +1,118 @@
+#!/usr/bin/python -tt
+
+"""Module to keep a history of where MAC addresses have been seen."""
+
+from datetime import datetime, timedelta
+
+import netspot_settings
+
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from spotmax import SpotMAX
+
+
+class MACHistory(SpotMAX):
+  """Class that saves when and where MAC addresses have been seen.
+
+  Each document is an observation interval for a MAC on an asset,
+  interface and VLAN. An entry seen again within 'gap' seconds extends the
+  interval's last_seen, otherwise a new interval is started. Intervals are
+  removed by a TTL index on last_seen. Times are UTC.
+
+  last_seen is only written when the next poll would otherwise find the
+  interval closed, ie. when it is older than gap - poll_interval. Polls in
+  between write nothing for MACs that have not moved, so write volume
+  follows MAC churn rather than the size of the MAC tables. last_seen is
+  therefore accurate to gap - poll_interval seconds.
+  """
+
+  def __init__(self,
+               database=netspot_settings.DATABASE,
+               collection=netspot_settings.COLL_MAC_HISTORY,
+               gap=netspot_settings.MAC_HISTORY_GAP,
+               poll_interval=netspot_settings.MAC_POLL_INTERVAL):
+    SpotMAX.__init__(self, database, collection)
+    self.gap = gap
+    self.poll_interval = poll_interval
+
+  def add_macs(self, device_macs):
+    """Add MAC observations for an asset.
+
+    Args:
+      device_macs: dict, key: asset: asset name
+                              macs: list of mac entries
+
+    Returns:
+      summary: dict, number of extended and started intervals
+    """
+
+    now = datetime.utcnow()
+    # Extend intervals that would be closed by the time of the next poll
+    stale = now - timedelta(seconds=max(self.gap - self.poll_interval, 0))
+    asset = device_macs['asset']
+
+    # Intervals for this asset that are still open
+    open_intervals = dict()
+    for interval in self.collection.find({'asset': asset,
+                                          'last_seen': {'$gte': now - timedelta(seconds=self.gap)}},
+                                         {'interface': 1, 'vlan': 1, 'mac': 1, 'ip': 1,
+                                          'last_seen': 1}):
+      open_intervals[(interval['interface'], interval['vlan'], interval['mac'])] = interval
+
+    extend = set()
+    requests = list()
+    for mac in device_macs['macs']:
+      key = (mac['interface'], mac['vlan'], mac['mac'])
+      interval = open_intervals.get(key)
+
+      if interval is None:
+        requests.append(InsertOne({'asset': asset,
+                                   'interface': mac['interface'],
+                                   'vlan': mac['vlan'],
+                                   'mac': mac['mac'],
+                                   'ip': mac['ip'],
+                                   'first_seen': now,
+                                   'last_seen': now}))
+        # Only one new interval per key
+        open_intervals[key] = {}
+      elif interval:
+        # Still open, written only when needed to keep it open
+        if interval['last_seen'] <= stale:
+          extend.add(interval['_id'])
+
+        # IP address changed within the interval
+        if mac['ip'] and mac['ip'] != interval.get('ip'):
+          requests.append(UpdateOne({'_id': interval['_id']}, {'$set': {'ip': mac['ip']}}))
+
+    if extend:
+      requests.append(UpdateMany({'_id': {'$in': list(extend)}}, {'$set': {'last_seen': now}}))
+
+    if requests:
+      self.collection.bulk_write(requests, ordered=False)
+
+    return {'extended': len(extend),
+            'started': len([request for request in requests if isinstance(request, InsertOne)])}
+
+  def where_was(self, mac, start, end):
+    """Return where a MAC address has been seen between start and end.
+
+    Args:
+      mac: string, MAC address
+      start: datetime, start of the period in UTC
+      end: datetime, end of the period in UTC
+
+    Returns:
+      cursor: MongoDB cursor, observation intervals sorted by first_seen
+    """
+
+    return self.collection.find({'mac': mac.upper(),
+                                 'first_seen': {'$lte': end},
+                                 'last_seen': {'$gte': start}},
+                                {'_id': 0}).sort('first_seen', 1)
+
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
@@ -6,15 +6,35 @@
 
 import argparse
 import getpass
+import inventory_cache
+import mac_history
 import net_collector
 import netspot_settings
 
-from spotmax import SpotMAX
+from device_session import DeviceSession
+from fleet import Fleet, check_cancelled
+from napalm import get_network_driver
+from netspot import Asset, NetSPOT
+
+# MAC entry changes reported per run
+MAC_CHANGES = ('added', 'removed', 'moved', 'changed')
 
 # Arguments
 parser = argparse.ArgumentParser(description='NetSPOT Network Collector')
 parser.add_argument('-a', '--asset', help='Asset', required=False)
 
+# Fleet mode
+parser.add_argument('--all', help='Collect from all assets', action='store_true', required=False)
+parser.add_argument('-f', '--filter', help='Collect from matching assets eg. groups:asw', required=False)
+parser.add_argument('-w', '--workers', help='Number of devices to collect from in parallel',
+                    type=int, default=20, required=False)
+parser.add_argument('-t', '--timeout', help='Timeout in seconds per device',
+                    type=int, default=120, required=False)
+parser.add_argument('-d', '--discover', help='Also discover the asset using the same device session',
+                    action='store_true', required=False)
+parser.add_argument('-b', '--batchsize', help='Number of IP addresses per database bulk write',
+                    type=int, default=1000, required=False)
+
 # Username/password
 parser.add_argument('-u', '--username', help='Username for device login', required=False)
 parser.add_argument('-p', '--password', help='Password for device login', required=False)
@@ -39,38 +59,102 @@ def ask_user_passwd():
 
   return (username, password)
 
-class MACS(SpotMAX):
-  """Class that interacts with the MongoDB backend."""
+def collect(asset, username, password, sshkey=None, timeout=60, loopback=None):
+  """Collect MAC and ARP data from asset and save it to the database.
 
-  def __init__(self, database=netspot_settings.DATABASE, collection=netspot_settings.COLL_MACS):
-    SpotMAX.__init__(self, database, collection)
+  Args:
+    asset: string, asset name
+    username: string, username to login to device
+    password: string, password for the username
+    sshkey: string, path to SSH key file
+    timeout: integer, device RPC timeout in seconds
+    loopback: string, IP address of the asset
 
-  def add_macs(self, device_macs):
-    """Add MACs to database.
+  Returns:
+    ip_summary: dict, IP usage write summary, number of collected MAC entries,
+                MAC entry changes and RPC latency
+  """
 
-    Args:
-      device_macs: dict, key: asset: asset name
-                              macs: list of mac entries
-    """
+  if args.discover:
+    inventory = NetSPOT()
+    if not loopback:
+      for entry in inventory.search('asset:%s' % asset, limit=1):
+        loopback = entry['loopback']
+    if not loopback:
+      raise ValueError('Asset %s not found in inventory' % asset)
+
+    # Discover and collect data from asset using one device session
+    with DeviceSession(loopback, username, password, get_network_driver('junos'),
+                       ssh_keyfile=sshkey, timeout=timeout) as session:
+      inventory.discover(Asset(asset, username=username, password=password, ssh_keyfile=sshkey),
+                         session=session)
+      device = net_collector.NetCollector(asset, username, password, session=session)
+  else:
+    # Collect data from asset
+    device = net_collector.NetCollector(asset, username, password, sshkey, timeout, loopback)
 
-    # Add asset if it's a new asset
-    if not self._exist(device_macs['asset'], key='asset'):
-      # Add asset to database
-      self.collection.insert_one(device_macs)
-    else:
-      # Update existing asset with the latest data
-      update = {
-          '$set': device_macs,
-          '$currentDate': {'lastModified': True}
-      }
+  # Don't write if the fleet run timed out meanwhile
+  check_cancelled()
 
-      self.collection.update_one({'asset': device_macs['asset']}, update)
+  # Add collected data to the database
+  macs = net_collector.MACEntries()
+  mac_summary = macs.add_macs(device.device_macs)
 
+  if netspot_settings.MAC_LEGACY_LAYOUT:
+    net_collector.LegacyMACs().add_macs(device.device_macs)
+
+  history = mac_history.MACHistory()
+  history.add_macs(device.device_macs)
+
+  macs = net_collector.IPUsage(device.device_macs)
+  ip_summary = macs.uppdate_ip(batch_size=args.batchsize)
+  ip_summary['macs'] = len(device.device_macs['macs'])
+  ip_summary.update(mac_summary)
+  ip_summary['latency'] = device.session.report()
+
+  return ip_summary
+
+def collect_fleet(search_filter, username, password):
+  """Collect MAC and ARP data from all assets matching search_filter.
+
+  Args:
+    search_filter: string, NetSPOT search filter
+    username: string, username to login to device
+    password: string, password for the username
+  """
+
+  # Get assets
+  inventory = NetSPOT()
+  assets = inventory.search(search_filter, key='asset', limit=0)
+  loopbacks = dict((asset['asset'], asset.get('loopback')) for asset in assets)
+
+  print 'Collecting data from %s assets.' % len(loopbacks)
+
+  def collect_asset(asset):
+    """Collect data from a single asset."""
+    return collect(asset, username, password, args.sshkey, args.timeout, loopbacks[asset])
+
+  fleet = Fleet(workers=args.workers, timeout=args.timeout)
+  summary = fleet.run(collect_asset, sorted(loopbacks))
+
+  print summary.report()
+
+  # MAC entry changes for the whole run
+  changes = dict.fromkeys(MAC_CHANGES, 0)
+  for result in summary.succeeded:
+    for change in MAC_CHANGES:
+      changes[change] += result.result[change]
+
+  print ('MAC entries: %(added)s added, %(removed)s removed, %(moved)s moved, '
+         '%(changed)s changed.' % changes)
 
 def main():
   """Main."""
 
-  if args.asset:
+  # Discovery changes assets, invalidate cached inventory data
+  inventory_cache.register()
+
+  if args.asset or args.all or args.filter:
     # Get username/password
     if not args.username or (not args.sshkey and not args.password):
       print 'Please specify device username/password.'
@@ -79,15 +163,16 @@ def main():
       username = args.username
       password = args.password
 
-    # Collect data from asset
-    device = net_collector.NetCollector(args.asset, username, password, args.sshkey)
-
-    # Add collected data to the database
-    macs = MACS()
-    macs.add_macs(device.device_macs)
-
-    macs = net_collector.IPUsage(device.device_macs)
-    macs.uppdate_ip()
+    if args.asset:
+      summary = collect(args.asset, username, password, args.sshkey, args.timeout)
+      print ('%(macs)s MACs collected: %(added)s added, %(removed)s removed, %(moved)s moved, '
+             '%(changed)s changed. IP usage: %(upserted)s added, %(modified)s updated '
+             'in %(batches)s bulk writes.' % summary)
+      print 'RPC latency: %(latency)s' % summary
+    elif args.all:
+      collect_fleet('', username, password)
+    else:
+      collect_fleet(args.filter, username, password)
 
   else:
     print 'Need more arguments. Please try -h'
@@ -2,39 +2,107 @@
 
 """Module to collect data from network devices."""
 
-from collections import defaultdict
 from datetime import datetime
 import sys
-import re
 import warnings
 import ipaddress
 
 import helpers
 import netspot
 import netspot_settings
+import parsers
 
+from device_session import DeviceSession
 from napalm import get_network_driver
+from pymongo import DeleteMany, InsertOne, UpdateOne
+from records import ARPEntry, MACEntry
 from spotmax import SpotMAX
 
-# JUNOS Ethernet swtich table RE
-RE_VLAN = r'\s+([\w\d-]+)\s+'
-RE_MAC = r'\s?([*\w\d:]+)\s+'
-RE_TYPE = r'\s?([\w]+) '
-RE_AGE = r'\s+([-\d:]+)'
-RE_INTERFACE = r'\s+([-.\w\d/]+)'
-RE_SWITCHING_TABLE = RE_VLAN + RE_MAC + RE_TYPE + RE_AGE + RE_INTERFACE
+# MAC entry fields that are updated in place
+MAC_ENTRY_FIELDS = ('ip', 'static', 'moves', 'last_move')
 
 class NetCollector(object):
   """NetCollector class."""
 
-  def __init__(self, hostname, username, password, ssh_keyfile=None):
-    self.mac_arp_table = defaultdict()
+  def __init__(self, hostname, username, password, ssh_keyfile=None, timeout=60, loopback=None,
+               session=None):
+    """Init.
+
+    Args:
+      hostname: string, asset name or IP address
+      username: string, username to login to device
+      password: string, password for the username
+      ssh_keyfile: string, path to SSH key file
+      timeout: integer, device RPC timeout in seconds
+      loopback: string, IP address of the asset. Skips name resolution if set
+      session: DeviceSession object, open session to use instead of connecting
+    """
+
+    self.mac_arp_table = dict()
 
     self.hostname = hostname
 
+    if session:
+      self.loopback_ip = session.hostname
+    elif loopback:
+      self.loopback_ip = loopback
+    else:
+      self.loopback_ip = self._resolve(hostname)
+
+    self.device_macs = {'asset': self.hostname,
+                        'macs': []}
+
+    if session:
+      self._collect(session)
+    else:
+      # Connect and get data from device
+      session = DeviceSession(self.loopback_ip,
+                              username,
+                              password,
+                              get_network_driver('junos'),
+                              ssh_keyfile=ssh_keyfile,
+                              timeout=timeout)
+      with session:
+        self._collect(session)
+
+    # Device session with per RPC latency
+    self.session = session
+
+    # Analyze collected data
+    self.analyze_data()
+
+  def _collect(self, session):
+    """Get MAC and ARP tables from device.
+
+    Args:
+      session: DeviceSession object
+    """
+
+    macs = session.submit('get_mac_address_table')
+    arps = session.submit('get_arp_table')
+
+    # Keep compact records instead of the driver's dicts
+    self.macs = [MACEntry(mac['interface'], mac['mac'], mac['vlan'], mac['static'], mac['moves'],
+                          mac['last_move']) for mac in macs.get()]
+    self.arps = [ARPEntry(arp['interface'], arp['mac'], arp['ip']) for arp in arps.get()]
+
+    # Due to a bug with the JUNOS API some devices returns 0 MACs
+    if len(self.macs) == 0:
+      self._get_mac_table(session.device)
+
+  def _resolve(self, hostname):
+    """Return the loopback IP address for hostname.
+
+    Args:
+      hostname: string, asset name or IP address
+
+    Returns:
+      loopback_ip: string, IP address
+    """
+
     # Check if hostname is IP address instead of hostname
     try:
-      self.loopback_ip = str(ipaddress.ip_address(unicode(hostname)))
+      loopback_ip = str(ipaddress.ip_address(unicode(hostname)))
 
       # Hostname is given as IP address - need to find asset name
       inventory = netspot.NetSPOT()
@@ -45,37 +113,11 @@ class NetCollector(object):
     except ValueError:
       # Resolve hostname
       try:
-        self.loopback_ip = helpers.resolv(hostname)[0]
+        loopback_ip = helpers.resolv(hostname)[0]
       except helpers.CouldNotResolv:
-        self.loopback_ip = None
         sys.exit('Could not resolv hostname: %s' % hostname)
 
-
-    self.device_macs = {'asset': self.hostname,
-                        'macs': []}
-
-    # Connect and get data from device
-    driver = get_network_driver('junos')
-
-    if ssh_keyfile:
-      device = driver(self.loopback_ip, username, password, optional_args={'key_file': ssh_keyfile})
-    else:
-      device = driver(self.loopback_ip, username, password)
-    device.open()
-
-    # Get MAC and ARP tables
-    self.macs = device.get_mac_address_table()
-    self.arps = device.get_arp_table()
-
-    # Due to a bug with the JUNOS API some devices returns 0 MACs
-    if len(self.macs) == 0:
-      self._get_mac_table(device)
-
-    # Close device connection
-    device.close()
-
-    # Analyze collected data
-    self.analyze_data()
+    return loopback_ip
 
   def analyze_data(self):
     """Run methods to generate a common MAC-ARP table."""
@@ -83,37 +125,19 @@ class NetCollector(object):
     self._extract_macs()
 
   def _extract_arp(self):
-    """Extract ARPs and creates ARP entries."""
+    """Index ARP entries on MAC address."""
 
     for arp in self.arps:
-      arp_entry = {'interface': arp['interface'],
-                   'mac': arp['mac'],
-                   'last_move': None,
-                   'moves': None,
-                   'vlan': None,
-                   'static': None,
-                   'ip': arp['ip']}
-
-      self.mac_arp_table[arp['mac']] = arp_entry
+      self.mac_arp_table[arp.mac] = arp
 
   def _extract_macs(self):
-    """Extract MAC addresses and create MAC entries."""
+    """Add IP addresses to the MAC entries."""
     for mac in self.macs:
       # Get IP
-      if self.mac_arp_table.get(mac['mac']):
-        ip_address = self.mac_arp_table[mac['mac']]['ip']
-      else:
-        ip_address = None
-
-      # Create entry
-      mac_entry = {'interface': mac['interface'],
-                   'mac': mac['mac'],
-                   'last_move': mac['last_move'],
-                   'moves': mac['moves'],
-                   'vlan': mac['vlan'],
-                   'static': mac['static'],
-                   'ip': ip_address}
-      self.device_macs['macs'].append(mac_entry)
+      arp = self.mac_arp_table.get(mac.mac)
+      mac.ip = arp.ip if arp else None
+
+      self.device_macs['macs'].append(mac)
 
   def _get_mac_table(self, device):
     """Run CLI command to get ethernet switch table.
@@ -126,28 +150,146 @@ class NetCollector(object):
       warnings.filterwarnings('ignore')
       macs = device.cli(['show ethernet-switching table'])
 
-    mac_entry = re.findall(RE_SWITCHING_TABLE, macs.values()[0])
-    mac_result = list()
+    self.macs = [MACEntry(entry.interface, entry.mac, entry.vlan, entry.type == 'Static')
+                 for entry in parsers.parse_switching_table(macs.values()[0], upper=True)]
+
+class MACEntries(SpotMAX):
+  """Class that saves one document per asset, interface, VLAN and MAC."""
 
-    if mac_entry:
-      for mac in mac_entry:
-        # Ignore '*' MAC
-        if mac[1] == '*':
-          continue
+  def __init__(self, database=netspot_settings.DATABASE, collection=netspot_settings.COLL_MAC_ENTRIES):
+    SpotMAX.__init__(self, database, collection)
 
-        # Check if MAC is static
-        static = False
-        if mac[2] == 'Static':
-          static = True
+  @staticmethod
+  def _entry(asset, mac, now):
+    """Return database document for a MAC entry.
 
-        mac_result.append({'interface': mac[4],
-                           'mac': mac[1].upper(),
-                           'vlan': mac[0],
-                           'moves': None,
-                           'last_move': None,
-                           'static': static})
+    Args:
+      asset: string, asset name
+      mac: dict, MAC entry
+      now: datetime, time of collection
 
-    self.macs = mac_result
+    Returns:
+      entry: dict, MAC entry document
+    """
+
+    return {'asset': asset,
+            'interface': mac['interface'],
+            'vlan': mac['vlan'],
+            'mac': mac['mac'],
+            'ip': mac['ip'],
+            'static': mac.get('static'),
+            'moves': mac.get('moves'),
+            'last_move': mac.get('last_move'),
+            'lastModified': now}
+
+  def add_macs(self, device_macs):
+    """Update the MAC entries for an asset.
+
+    The collected entries are compared with the stored entries and only
+    the difference is written: new entries are inserted, entries that are
+    gone are deleted and entries with new values are updated.
+
+    Args:
+      device_macs: dict, key: asset: asset name
+                              macs: list of mac entries
+
+    Returns:
+      summary: dict, number of added, removed, moved, changed and unchanged entries
+    """
+
+    now = datetime.now()
+    asset = device_macs['asset']
+
+    # One entry per interface, VLAN and MAC
+    entries = dict()
+    for mac in device_macs['macs']:
+      entries[(mac['interface'], mac['vlan'], mac['mac'])] = self._entry(asset, mac, now)
+
+    # Stored entries
+    stored = dict()
+    projection = dict.fromkeys(('interface', 'vlan', 'mac') + MAC_ENTRY_FIELDS, 1)
+    for entry in self.collection.find({'asset': asset}, projection):
+      stored[(entry['interface'], entry['vlan'], entry['mac'])] = entry
+
+    requests = list()
+    added = set(entries) - set(stored)
+    removed = set(stored) - set(entries)
+    changed = 0
+
+    for key in added:
+      requests.append(InsertOne(entries[key]))
+
+    if removed:
+      requests.append(DeleteMany({'_id': {'$in': [stored[key]['_id'] for key in removed]}}))
+
+    for key in set(entries) & set(stored):
+      update = dict((field, entries[key][field]) for field in MAC_ENTRY_FIELDS
+                    if entries[key][field] != stored[key].get(field))
+      if update:
+        update['lastModified'] = now
+        requests.append(UpdateOne({'_id': stored[key]['_id']}, {'$set': update}))
+        changed += 1
+
+    if requests:
+      self.collection.bulk_write(requests, ordered=False)
+
+    # A MAC that was removed from one interface/VLAN and added to another has moved
+    moved = set(key[2] for key in added) & set(key[2] for key in removed)
+
+    return {'added': len(added),
+            'removed': len(removed),
+            'moved': len(moved),
+            'changed': changed,
+            'unchanged': len(entries) - len(added) - changed}
+
+  def migrate(self, collection=netspot_settings.COLL_MACS):
+    """Copy MAC entries from the embedded 'macs' layout.
+
+    Args:
+      collection: string, collection with one document per asset
+                  and a list of MAC entries in 'macs'
+
+    Returns:
+      (assets, entries): tuple, number of migrated assets and MAC entries
+    """
+
+    assets = 0
+    entries = 0
+
+    for device_macs in self.database[collection].find({}, {'asset': 1, 'macs': 1}):
+      summary = self.add_macs({'asset': device_macs['asset'],
+                               'macs': device_macs.get('macs', [])})
+      entries += summary['added'] + summary['changed'] + summary['unchanged']
+      assets += 1
+
+    return assets, entries
+
+class LegacyMACs(SpotMAX):
+  """Class that saves MAC entries as one document per asset (COLL_MACS).
+
+  The old layout is written as well while MAC_LEGACY_LAYOUT is set, until
+  netspot_migrate_macs has copied the existing data to COLL_MAC_ENTRIES.
+  """
+
+  def __init__(self, database=netspot_settings.DATABASE, collection=netspot_settings.COLL_MACS):
+    SpotMAX.__init__(self, database, collection)
+
+  def add_macs(self, device_macs):
+    """Replace the MAC entries of an asset.
+
+    Args:
+      device_macs: dict, key: asset: asset name
+                              macs: list of mac entries
+    """
+
+    macs = [mac.to_dict() if hasattr(mac, 'to_dict') else mac for mac in device_macs['macs']]
+
+    update = {
+        '$set': {'asset': device_macs['asset'], 'macs': macs},
+        '$currentDate': {'lastModified': True}
+    }
+
+    self.collection.update_one({'asset': device_macs['asset']}, update, upsert=True)
 
 class IPUsage(SpotMAX):
   """Class that save IP usage to database."""
@@ -157,30 +299,49 @@ class IPUsage(SpotMAX):
     #super(IPUsage, self).__init__(database, collection)
     self.device_macs = device_macs
 
-  def uppdate_ip(self):
-    """Add or update IP address entry in database."""
+  def uppdate_ip(self, batch_size=1000):
+    """Add or update IP address entries in database.
+
+    Entries are upserted on 'ip' with unordered bulk writes.
+
+    Args:
+      batch_size: integer, number of IP addresses per bulk write
+
+    Returns:
+      summary: dict, number of matched, modified and upserted entries
+               and the number of bulk writes
+    """
 
     # Get time and date
     now = datetime.now()
 
+    # One entry per IP address. The last MAC wins as before.
+    ip_addresses = dict()
     for mac in self.device_macs['macs']:
       if mac['ip']:
-        ip_address = {'date': now.strftime("%Y-%m-%d"),
-                      'time': now.strftime("%H:%M"),
-                      'ip': mac['ip'],
-                      'vlan': mac['vlan'],
-                      'mac': mac['mac'],
-                      'asset': self.device_macs['asset'],
-                      'interface': mac['interface']
-                     }
-
-        if not self._exist(mac['ip'], key='ip'):
-          # Add asset to database
-          self.collection.insert_one(ip_address)
-        else:
-          update = {"$set": ip_address}
-
-          self.collection.update_one({'ip': mac['ip']}, update)
+        ip_addresses[mac['ip']] = {'date': now.strftime("%Y-%m-%d"),
+                                   'time': now.strftime("%H:%M"),
+                                   'ip': mac['ip'],
+                                   'vlan': mac['vlan'],
+                                   'mac': mac['mac'],
+                                   'asset': self.device_macs['asset'],
+                                   'interface': mac['interface']
+                                  }
+
+    summary = {'matched': 0, 'modified': 0, 'upserted': 0, 'batches': 0}
+
+    requests = [UpdateOne({'ip': ip}, {'$set': ip_addresses[ip]}, upsert=True)
+                for ip in ip_addresses]
+
+    for index in range(0, len(requests), batch_size):
+      result = self.collection.bulk_write(requests[index:index + batch_size], ordered=False)
+
+      summary['matched'] += result.matched_count
+      summary['modified'] += result.modified_count
+      summary['upserted'] += result.upserted_count
+      summary['batches'] += 1
+
+    return summary
 
 if __name__ == '__main__':
   pass
@@ -7,8 +7,11 @@ Interact with the netspot database.
 """
 
 from datetime import datetime
-from spotmax import SpotMAX
-from network_device import NetworkDevice
+from fleet import Fleet, check_cancelled
+from pymongo import UpdateOne
+from records import InterfaceEntry
+from spotmax import SpotMAX, SPOTStats
+from network_device import NetworkDevice, CONNECTION_ERRORS
 
 import netspot_settings
 
@@ -52,6 +55,9 @@ class NetSPOT(SpotMAX):
   def __init__(self, database=netspot_settings.DATABASE, collection=netspot_settings.COLL_NETSPOT):
     SpotMAX.__init__(self, database, collection)
 
+    # Dashboard statistics
+    self.stats = SPOTStats() if self.collection is not None else None
+
   def _update_discover_data(self, asset, facts):
     """Update discoverd data for a given asset.
 
@@ -70,6 +76,7 @@ class NetSPOT(SpotMAX):
     cursor = self.collection.update_one({"asset": asset}, update)
 
     if cursor.matched_count == 1:
+      self._changed('update', [asset])
       print '%s updated sucessfully.' % asset
     else:
       print 'Failed to update database.'
@@ -143,11 +150,53 @@ class NetSPOT(SpotMAX):
 
     # Add asset to database
     self.collection.insert_one(new_device)
+    self._changed('insert', [asset.asset])
+
+    if self.stats:
+      self.stats.increment(num_assets=1)
 
     # Add all interfaces
     self.update_interfaces(asset.asset, device)
     return True
 
+  def delete(self, name, key='asset'):
+    """Delete asset.
+
+    Args:
+      name: string, asset name
+      key: string, asset name field
+
+    Returns:
+      Boolean:  True if success
+                False if failed
+    """
+
+    asset = self.collection.find_one_and_delete({key: name}, projection={'interfaces.interface': 1})
+    if asset is None:
+      return False
+
+    self._changed('delete', [name])
+
+    if self.stats:
+      self.stats.increment(num_assets=-1, num_interfaces=-len(asset.get('interfaces', [])))
+
+    return True
+
+  def _interface_counts(self, assets):
+    """Return the number of stored interfaces per asset.
+
+    Args:
+      assets: list, asset names
+
+    Returns:
+      counts: dict, key: asset name, value: number of interfaces
+    """
+
+    cursor = self.collection.find({'asset': {'$in': list(assets)}},
+                                  {'asset': 1, 'interfaces.interface': 1})
+
+    return dict((asset['asset'], len(asset.get('interfaces', []))) for asset in cursor)
+
   def count_interfaces(self):
     """Return the total number of interfaces."""
 
@@ -162,11 +211,12 @@ class NetSPOT(SpotMAX):
 
     return num_interfaces
 
-  def discover(self, asset):
+  def discover(self, asset, session=None):
     """Discover asset data and updates database.
 
     Args:
       asset: Asset object
+      session: DeviceSession object, open session to the asset
 
     Returns:
       Boolean: True, dicover successfull
@@ -178,7 +228,11 @@ class NetSPOT(SpotMAX):
 
     if cursor:
       # Connect to device
-      device = NetworkDevice(cursor['loopback'], asset.username, asset.password, asset.ssh_keyfile)
+      device = NetworkDevice(cursor['loopback'], asset.username, asset.password, asset.ssh_keyfile,
+                             session=session)
+
+      # Don't write if a fleet run timed out meanwhile
+      check_cancelled()
 
       # Update disocvered data
       self._update_discover_data(asset.asset, device.facts)
@@ -187,6 +241,84 @@ class NetSPOT(SpotMAX):
     else:
       return False
 
+  def discover_fleet(self, search_filter, username, password, ssh_keyfile=None, fleet=None,
+                     batch_size=500):
+    """Discover all assets matching search_filter in parallel.
+
+    Devices are discovered by fleet and the discovered data is saved
+    with unordered bulk writes once all devices are done.
+
+    Args:
+      search_filter: string, search filter eg. groups:asw. Empty string for all assets
+      username: string, username to login to devices
+      password: string, password for the username
+      ssh_keyfile: string, path to SSH key file
+      fleet: Fleet object, controls concurrency, timeout and retries. The
+             timeout is also the device RPC timeout
+      batch_size: integer, number of assets per bulk write
+
+    Returns:
+      FleetSummary object
+    """
+
+    if fleet is None:
+      fleet = Fleet(retry_errors=CONNECTION_ERRORS)
+
+    assets = self.search(search_filter, key='asset', limit=0)
+    loopbacks = dict((asset['asset'], asset.get('loopback')) for asset in assets)
+
+    # Number of discovered interfaces per asset
+    interfaces = dict()
+
+    def discover_asset(asset):
+      """Discover a single asset and return its database update."""
+      if not loopbacks[asset]:
+        raise ValueError('Loopback missing for %s' % asset)
+
+      device = NetworkDevice(loopbacks[asset], username, password, ssh_keyfile,
+                             timeout=fleet.timeout)
+      update = self._discover_update(device)
+      interfaces[asset] = len(update['interfaces'])
+      return UpdateOne({'asset': asset},
+                       {'$set': update,
+                        '$currentDate': {'lastModified': True}})
+
+    summary = fleet.run(discover_asset, sorted(loopbacks))
+
+    requests = [result.result for result in summary.succeeded]
+    updated = [result.asset for result in summary.succeeded]
+
+    if self.stats and updated:
+      previous = sum(self._interface_counts(updated).values())
+
+    for i in range(0, len(requests), batch_size):
+      self.collection.bulk_write(requests[i:i + batch_size], ordered=False)
+
+    # Nothing to publish if all devices failed
+    if updated:
+      self._changed('update', updated)
+
+    if self.stats and updated:
+      current = sum(interfaces[asset] for asset in updated)
+      self.stats.increment(num_interfaces=current - previous)
+
+    return summary
+
+  def _discover_update(self, device):
+    """Return discovered facts and interfaces for a device.
+
+    Args:
+      device: NetworkDevice object
+
+    Returns:
+      update: dict, fields to set on the asset
+    """
+
+    update = self._extract_device(device.facts)
+    update['interfaces'] = [interface.to_dict() for interface in self._interfaces(device)]
+
+    return update
+
   def update_interfaces(self, asset, device):
     """Update or add interfaces for a given asset.
 
@@ -195,6 +327,32 @@ class NetSPOT(SpotMAX):
       device: NetworkDevice object
     """
 
+    interfaces = [interface.to_dict() for interface in self._interfaces(device)]
+
+    if self.stats:
+      previous = self._interface_counts([asset]).get(asset, 0)
+
+    # Update the asset with the new interface information
+    cursor = self.collection.update_one({'asset': asset}, {'$set': {'interfaces': interfaces}})
+    if cursor.matched_count:
+      self._changed('update', [asset])
+
+    if self.stats and cursor.matched_count:
+      self.stats.increment(num_interfaces=len(interfaces) - previous)
+
+    return cursor
+
+  @staticmethod
+  def _interfaces(device):
+    """Return physical interfaces for a device.
+
+    Args:
+      device: NetworkDevice object
+
+    Returns:
+      interfaces: list of InterfaceEntry objects
+    """
+
     interfaces = list()
 
     for port in device.interfaces:
@@ -219,12 +377,7 @@ class NetSPOT(SpotMAX):
           speed = ''
 
         # Get VLAN id
-        vlans = list()
-        for vlan in device.vlans:
-          if port in vlan['tagged_interfaces']:
-            vlans.append(vlan['vlan'])
-          if port in vlan['untagged_interfaces']:
-            vlans.append(vlan['vlan'])
+        vlans = list(device.port_vlans.get(port, ()))
 
         try:
           vlans.sort(key=int)
@@ -241,23 +394,17 @@ class NetSPOT(SpotMAX):
           lldp_neighbors.append(lldp_neighbor['hostname'] + ':' + lldp_neighbor['port'])
 
         # Create new interface
-        new_interface = {
-            'interface': port,
-            'description': description,
-            'mac': device.interfaces[port]['mac_address'].upper(),
-            'speed': speed,
-            'lldp_neighbor': lldp_neighbors,
-            'vlan': ', '.join(vlans)
-            }
+        new_interface = InterfaceEntry(interface=port,
+                                       description=description,
+                                       mac=device.interfaces[port]['mac_address'].upper(),
+                                       speed=speed,
+                                       lldp_neighbor=lldp_neighbors,
+                                       vlan=', '.join(vlans))
 
         # Add interface to list
         interfaces.append(new_interface)
 
-    # Update the asset with the new interface information
-    cursor = self.collection.update_one({'asset': asset},
-                                        {'$set': {'interfaces': interfaces}})
-
-    return cursor
+    return interfaces
 
 def main():
   """Do nothing."""
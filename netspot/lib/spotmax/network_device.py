@@ -4,18 +4,40 @@
 
 # pylint: disable=E0611
 
+import socket
 import sys
-import re
-import warnings
+
+from collections import defaultdict
+
+import netspot_settings
+import parsers
 
 from jnpr.junos.op.phyport import PhyPortTable
-from jnpr.junos.exception import ConnectRefusedError, ConnectAuthError
+from jnpr.junos.exception import ConnectError, ConnectRefusedError, ConnectAuthError, RpcTimeoutError
 from napalm import get_network_driver
+from napalm.base.exceptions import ConnectionException
+from device_session import DeviceSession
+
+# Transient connection errors worth retrying. Authentication failures and
+# refused connections exit in NetworkDevice and are not retried
+CONNECTION_ERRORS = (ConnectError, ConnectionException, RpcTimeoutError, socket.error)
 
 class NetworkDevice(object):
   """Class that connects and discovers JUNOS devices."""
 
-  def __init__(self, ip_address, username=None, password=None, ssh_keyfile=None):
+  def __init__(self, ip_address, username=None, password=None, ssh_keyfile=None, session=None,
+               timeout=60):
+    """Init.
+
+    Args:
+      ip_address: string, IP address of the device
+      username: string, username to login to device
+      password: string, password for the username
+      ssh_keyfile: string, path to SSH key file
+      session: DeviceSession object, open session to use instead of connecting
+      timeout: integer, device RPC timeout in seconds
+    """
+
     self.ip_address = ip_address
     self.facts = None
     self.ports = None
@@ -23,35 +45,22 @@ class NetworkDevice(object):
     self.password = password
     self.vlans = list()
 
-    # Connect and get data from device
-    driver = get_network_driver('junos')
-
-    if ssh_keyfile:
-      self.device = driver(self.ip_address,
-                           self.username,
-                           self.password,
-                           optional_args={'key_file': ssh_keyfile})
-    else:
-      self.device = driver(self.ip_address, self.username, self.password)
+    # Reverse index, interface name -> set of VLAN ids
+    self.port_vlans = defaultdict(set)
 
     try:
-      self.device.open()
-
-      # Get facts and interfaces
-      self.facts = self.device.get_facts()
-      self.interfaces = self.device.get_interfaces()
-
-      # Get VLAN information
-      with warnings.catch_warnings(record=True) as warning:
-        warnings.filterwarnings('ignore')
-        vlan_cli_output = self.device.cli(['show vlans detail'])
-      if 'qfx' in self.facts['model'].lower():
-        self.get_vlan_information_qfx(vlan_cli_output['show vlans detail'])
+      if session:
+        self._discover(session)
       else:
-        self.get_vlan_information(vlan_cli_output['show vlans detail'])
-
-      # LLDP neighbors
-      self.lldp = self.device.get_lldp_neighbors()
+        # Connect and get data from device
+        session = DeviceSession(self.ip_address,
+                                self.username,
+                                self.password,
+                                get_network_driver('junos'),
+                                ssh_keyfile=ssh_keyfile,
+                                timeout=timeout)
+        with session:
+          self._discover(session)
 
     except ConnectAuthError:
       print 'Autentication failed to %s.' % self.ip_address
@@ -59,103 +68,109 @@ class NetworkDevice(object):
     except ConnectRefusedError:
       print 'Connection refused to %s.' % self.ip_address
       sys.exit(1)
-    finally:
-      # Close device connection
-      self.device.close()
 
-  def get_vlan_information_qfx(self, output):
-    """Retrieve VLAN information from 'show vlan detail' from a QFX swtich.
+    # Device session with per RPC latency
+    self.session = session
+
+  def _discover(self, session):
+    """Get facts, interfaces, VLANs and LLDP neighbors from device.
+
+    Facts and interfaces are queued up front. LLDP neighbors are queued
+    after the VLAN request, so the VLAN output is parsed while the LLDP
+    neighbors are retrieved.
 
     Args:
-      output: string, output from 'show vlan detail'
+      session: DeviceSession object
     """
 
-    for entry in output.split('Total MAC count'):
-      tagged = []
-      re_tagged_interfaces = re.findall(r'([\w\d\/*.-]+),tagged,', entry)
-      for interface in re_tagged_interfaces:
-        tagged.append(self.clean_interface(interface))
-
-      untagged = []
-      re_untagged_interfaces = re.findall(r'([\w\d\/*.-]+),untagged,', entry)
-      for interface in re_untagged_interfaces:
-        untagged.append(self.clean_interface(interface))
-
-      vlan_name = re.search(r'VLAN Name: ([\w\d-]+)\s', entry)
-      vlan_id = re.search(r'Tag: ([\d]+)\s', entry)
-
-      try:
-        vlan_data = {'vlan': vlan_id.groups(0)[0],
-                     'name': vlan_name.groups(0)[0],
-                     'untagged_interfaces': untagged,
-                     'tagged_interfaces': tagged}
-        self.vlans.append(vlan_data)
-      except AttributeError:
-        continue
+    facts = session.submit('get_facts')
+    interfaces = session.submit('get_interfaces')
 
-  def get_vlan_information(self, output):
-    """Retrieve VLAN information from 'show vlan detail' from a JUNOS swtich.
+    # Get facts
+    self.facts = facts.get()
+    model = self.facts['model'].lower()
 
-    Args:
-      output: string, output from 'show vlan detail'
-    """
+    # Get VLAN information
+    if self.vlan_retrieval(model) == 'rpc':
+      vlan_output = session.rpc('get_vlan_information', detail=True)
+      parser = self.get_vlan_information_rpc
+    else:
+      vlan_output = session.cli('show vlans detail')
+      if 'qfx' in model:
+        parser = self.get_vlan_information_qfx
+      else:
+        parser = self.get_vlan_information
 
-    for entry in output.split('VLAN:'):
-      vlan_name = re.search(r'([\w\d-]+), 802', entry)
-      vlan_id = re.search(r'Tag: ([\d\w]+),', entry)
+    lldp = session.submit('get_lldp_neighbors')
 
-      # Get VLAN interfaces
-      untagged, tagged = self.get_interfaces_per_vlan(entry)
+    self.interfaces = interfaces.get()
+    parser(vlan_output.get())
 
-      try:
-        vlan_data = {'vlan': vlan_id.groups(0)[0],
-                     'name': vlan_name.groups(0)[0],
-                     'untagged_interfaces': untagged,
-                     'tagged_interfaces': tagged}
-        self.vlans.append(vlan_data)
-      except AttributeError:
-        continue
+    # LLDP neighbors
+    self.lldp = lldp.get()
 
-  def clean_interface(self, interface):
-    """Clean interface name.
+  @staticmethod
+  def vlan_retrieval(model):
+    """Return how VLANs are retrieved for a model.
 
     Args:
-      interface: string, interface name
+      model: string, device model eg. qfx5100-48s-6q
 
     Returns:
-      Cleaned up string
+      string, 'rpc' or 'cli'
     """
 
-    return interface.replace('*', '').replace('\n', '').replace(',', '').replace('.0', '')
+    for family, retrieval in netspot_settings.VLAN_RETRIEVAL.items():
+      if model.lower().startswith(family):
+        return retrieval
+
+    return 'cli'
 
-  def get_interfaces_per_vlan(self, vlan_data):
-    """Returns interfaces in vlan_data.
+  def get_vlan_information_rpc(self, reply):
+    """Retrieve VLAN information from a get-vlan-information RPC reply.
 
     Args:
-      vlan_data: string, interface part from 'show vlan detail'
+      reply: lxml Element, XML string or file object
+    """
 
-    Returns:
-      tuple, (untagged, tagged) interfaces
+    for vlan_data in parsers.parse_vlans_xml(reply):
+      self.vlans.append(vlan_data)
+      self._index_vlan(vlan_data)
+
+  def get_vlan_information_qfx(self, output):
+    """Retrieve VLAN information from 'show vlan detail' from a QFX swtich.
+
+    Args:
+      output: string or iterable of lines, output from 'show vlan detail'
     """
 
-    untagged_interfaces = list()
-    tagged_interfaces = list()
+    for vlan_data in parsers.parse_vlans_qfx(output):
+      self.vlans.append(vlan_data)
+      self._index_vlan(vlan_data)
 
-    untagged = re.findall(r'Untagged interfaces: ([\w\s*.,\/-]+)\n', vlan_data)
-    if untagged:
-      # Clean, split and remove empty entries
-      untagged = self.clean_interface(untagged[0])
-      untagged = untagged.split(' ')
-      untagged_interfaces = filter(None, untagged)
+  def get_vlan_information(self, output):
+    """Retrieve VLAN information from 'show vlan detail' from a JUNOS swtich.
+
+    Args:
+      output: string or iterable of lines, output from 'show vlan detail'
+    """
+
+    for vlan_data in parsers.parse_vlans(output):
+      self.vlans.append(vlan_data)
+      self._index_vlan(vlan_data)
+
+  def _index_vlan(self, vlan_data):
+    """Add VLAN to the interface to VLAN reverse index.
+
+    Args:
+      vlan_data: dict, VLAN entry
+    """
 
-    tagged = re.findall(r'Tagged interfaces: ([\w\s*.,\/-]+)\n', vlan_data)
-    if tagged:
-      # Clean, split and remove empty entries
-      tagged = self.clean_interface(tagged[0])
-      tagged = tagged.split(' ')
-      tagged_interfaces = filter(None, tagged)
+    for interface in vlan_data['untagged_interfaces']:
+      self.port_vlans[interface].add(vlan_data['vlan'])
 
-    return untagged_interfaces, tagged_interfaces
+    for interface in vlan_data['tagged_interfaces']:
+      self.port_vlans[interface].add(vlan_data['vlan'])
 
 def main():
   """Do nothing."""
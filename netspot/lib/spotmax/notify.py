@@ -0,0 +1,182 @@
+#!/usr/bin/python -tt
+
+"""Change notifications for cached inventory data.
+
+SpotMAX write paths publish a notification per change. Caches subscribe
+to the collections they depend on and invalidate the affected entries.
+
+Notifications are delivered in-process when published. Changes made by
+other processes (eg. nsclient run from cron) are delivered by a
+ChangeListener that follows a MongoDB change stream. Change streams
+require a replica set and are enabled with CHANGE_STREAMS. The listener
+reconnects after errors and resumes after the last change it has seen.
+"""
+
+import threading
+
+from collections import defaultdict
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import netspot_settings
+
+# Subscribers. Key: collection name, value: list of callbacks
+_SUBSCRIBERS = defaultdict(list)
+_SUBSCRIBERS_LOCK = threading.Lock()
+
+# Seconds to wait before reconnecting a change stream
+RECONNECT_DELAY = 10
+
+# Server error codes: change streams not supported, resume token no longer in the oplog
+NOT_SUPPORTED_CODES = (40573,)
+HISTORY_LOST_CODES = (280, 286)
+
+# Document field that holds the name, per collection
+NAME_FIELDS = {
+    netspot_settings.COLL_NETSPOT: 'asset',
+    netspot_settings.COLL_NETSPOT_GROUPS: 'group',
+}
+
+
+def subscribe(collection, callback):
+  """Subscribe to changes in a collection.
+
+  Args:
+    collection: string, collection name
+    callback: function, called as callback(collection, operation, names) where
+              names is a list of changed asset/group names, or None if unknown
+  """
+
+  with _SUBSCRIBERS_LOCK:
+    if callback not in _SUBSCRIBERS[collection]:
+      _SUBSCRIBERS[collection].append(callback)
+
+def unsubscribe(collection, callback):
+  """Remove a subscription."""
+
+  with _SUBSCRIBERS_LOCK:
+    if callback in _SUBSCRIBERS[collection]:
+      _SUBSCRIBERS[collection].remove(callback)
+
+def publish(collection, operation, names=None):
+  """Notify subscribers about a change.
+
+  Args:
+    collection: string, collection name
+    operation: string, eg. 'insert', 'update' or 'delete'
+    names: list, changed asset/group names. None if unknown
+  """
+
+  with _SUBSCRIBERS_LOCK:
+    callbacks = list(_SUBSCRIBERS.get(collection, []))
+
+  for callback in callbacks:
+    callback(collection, operation, names)
+
+
+class ChangeListener(threading.Thread):
+  """Thread that publishes changes read from a MongoDB change stream."""
+
+  def __init__(self, database, collections=None):
+    """Init.
+
+    Args:
+      database: pymongo Database object
+      collections: list, collection names to follow. Default: NAME_FIELDS
+    """
+
+    threading.Thread.__init__(self, name='netspot-change-listener')
+    self.daemon = True
+    self.database = database
+    self.collections = list(collections or NAME_FIELDS)
+    self.error = None
+    self.resume_token = None
+    self.stopped = threading.Event()
+    self._stream = None
+
+  def run(self):
+    pipeline = [{'$match': {'ns.coll': {'$in': self.collections}}}]
+
+    while not self.stopped.is_set():
+      try:
+        with self.database.watch(pipeline, full_document='updateLookup',
+                                 resume_after=self.resume_token) as stream:
+          self._stream = stream
+          for change in stream:
+            if change['operationType'] == 'invalidate':
+              # Collection or database dropped, the stream can't be resumed
+              self.resume_token = None
+              self.publish_all()
+              continue
+
+            self.resume_token = change['_id']
+            self.publish_change(change)
+      except OperationFailure as error:
+        self.error = error
+
+        # Not a replica set. Writes are still published in-process
+        if error.code in NOT_SUPPORTED_CODES:
+          return
+
+        # Changes were missed, start over
+        if error.code in HISTORY_LOST_CODES:
+          self.resume_token = None
+          self.publish_all()
+      except PyMongoError as error:
+        self.error = error
+
+      self.stopped.wait(RECONNECT_DELAY)
+
+  def stop(self):
+    """Close the change stream."""
+
+    self.stopped.set()
+
+    if self._stream is not None:
+      self._stream.close()
+
+  def publish_all(self):
+    """Publish an unknown change for every followed collection."""
+
+    for collection in self.collections:
+      publish(collection, 'invalidate', None)
+
+  @staticmethod
+  def publish_change(change):
+    """Publish a change stream event."""
+
+    collection = change['ns']['coll']
+    names = None
+
+    # Deleted documents can't be looked up, their names are unknown
+    document = change.get('fullDocument') or {}
+    if NAME_FIELDS.get(collection) in document:
+      names = [document[NAME_FIELDS[collection]]]
+
+    publish(collection, change['operationType'], names)
+
+
+def start_listener(database):
+  """Start a change stream listener if enabled in the settings.
+
+  Args:
+    database: pymongo Database object
+
+  Returns:
+    ChangeListener object or None if disabled
+  """
+
+  if not netspot_settings.CHANGE_STREAMS:
+    return None
+
+  listener = ChangeListener(database)
+  listener.start()
+
+  return listener
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
@@ -8,7 +8,11 @@ import getpass
 import argparse
 from pprint import pprint
 
+import inventory_cache
+
+from fleet import Fleet
 from netspot import Asset, NetSPOT
+from network_device import CONNECTION_ERRORS
 from spotmax import SPOTGroup
 
 # Arguments
@@ -20,6 +24,18 @@ parser.add_argument('-r', '--groups', help='Group name(s)', required=False)
 parser.add_argument('-l', '--loopback', help='IPv4 loopback', required=False)
 parser.add_argument('-y', '--discover', help='Trigger manual discovery process', required=False)
 
+# Fleet discovery
+parser.add_argument('--all', help='Discover all assets', action='store_true', required=False)
+parser.add_argument('-f', '--filter', help='Discover matching assets eg. groups:asw', required=False)
+parser.add_argument('-w', '--workers', help='Number of devices to discover in parallel',
+                    type=int, default=20, required=False)
+parser.add_argument('-t', '--timeout', help='Timeout in seconds per device',
+                    type=int, default=120, required=False)
+parser.add_argument('--retries', help='Number of retries for unreachable devices',
+                    type=int, default=2, required=False)
+parser.add_argument('--backoff', help='Seconds before first retry, doubled for every retry',
+                    type=int, default=5, required=False)
+
 # Groups
 parser.add_argument('-g', '--group', dest='group', action='store_true')
 parser.add_argument('-z', '--addvar', help='Add group variable', nargs='*', required=False)
@@ -120,6 +136,17 @@ def parse_asset():
     else:
       print '%s does not exists.' % asset.asset
 
+  elif args.all or args.filter:
+    search_filter = '' if args.all else args.filter
+    fleet = Fleet(workers=args.workers, timeout=args.timeout,
+                  retries=args.retries, backoff=args.backoff, retry_errors=CONNECTION_ERRORS)
+
+    # Discover assets
+    print 'Discovering assets.'
+    summary = inventory.discover_fleet(search_filter, username, password, args.sshkey, fleet)
+
+    print summary.report()
+
   elif args.search:
     # Search
     result = inventory.search(args.search, key='asset')
@@ -189,6 +216,9 @@ def parse_group():
 def main():
   """Perform action based on the arguments."""
 
+  # Invalidate cached inventory data on changes
+  inventory_cache.register()
+
   # Group
   if args.group:
     parse_group()
@@ -7,7 +7,11 @@
 import json
 import os
 import argparse
+import time
 
+from collections import OrderedDict
+
+from inventory_cache import InventoryCache
 from netspot import NetSPOT
 from spotmax import SPOTGroup
 
@@ -53,17 +57,24 @@ class Hostvars(object):
 class Group(object):
   """Class that hold group information."""
 
-  def __init__(self, group):
+  def __init__(self, group, variables=None):
+    """Init.
+
+    Args:
+      group: string, group name
+      variables: list of dicts, group variables. Read from the database if None
+    """
+
     self.group = group
     self.members = list()
     self.vars = dict()
 
-    # Get inventory
-    inventory = SPOTGroup()
+    # Get group variables if not provided
+    if variables is None:
+      variables = SPOTGroup().get_variables(group)
 
     # Add group variables
-    group_vars = inventory.get_variables(group)
-    for var in group_vars:
+    for var in variables:
       if var.keys()[0] not in SPECIAL_FIELDS:
         self.add_vars(var.keys()[0], var.values()[0])
 
@@ -80,7 +91,54 @@ class Group(object):
     return {'hosts': self.members,
             'vars': self.vars}
 
-def AnsibleInventory(attribute=None, json_output=True, inventory=None):
+def build_inventory(inventory, attribute, group_inventory=None):
+  """Build Ansible inventory data for assets matching attribute.
+
+  Assets are read in one pass and the variables of all their groups are
+  fetched with one query.
+
+  Args:
+    inventory: searchable inventory
+    attribute: string, what to search for
+    group_inventory: SPOTGroup object, defaults to SPOTGroup()
+
+  Returns:
+    data: dict, Ansible inventory data
+  """
+
+  data = dict()
+  hostvars = Hostvars()
+  members = OrderedDict()
+
+  # Add devices
+  for asset in inventory.search(attribute, limit=0):
+    # Create Host object and add it to hostvars
+    hostvars.add_host(Host(asset))
+
+    # Add device as member to its groups/roles
+    for group in asset['groups']:
+      members.setdefault(group, list()).append(asset['asset'])
+
+  # Get variables for all groups/roles at once
+  if members:
+    if group_inventory is None:
+      group_inventory = SPOTGroup()
+    variables = group_inventory.get_group_variables(members.keys())
+
+    for group in members:
+      group_data = Group(group, variables=variables.get(group, []))
+      for member in members[group]:
+        group_data.add_group_member(member)
+
+      data[group] = group_data.get_group()
+
+  if hostvars.hosts:
+    data['_meta'] = hostvars.get_hostvars()
+
+  return data
+
+def AnsibleInventory(attribute=None, json_output=True, inventory=None, group_inventory=None,
+                     cache=None, refresh=False):
   """Class to generate and return Ansible JSON inventory data.
 
   Args:
@@ -88,41 +146,28 @@ def AnsibleInventory(attribute=None, json_output=True, inventory=None):
     json_output: boolean, True: return JSON
                           False: return raw data
     inventory: searchable inventory
+    group_inventory: SPOTGroup object, defaults to SPOTGroup()
+    cache: InventoryCache object, cache inventory data per attribute
+    refresh: boolean, ignore cached data and rebuild the inventory
 
   Return:
     search result in either JSON or raw format
   """
 
   # Reurn {} if inventory is missing
-  if not inventory:
+  if not inventory or not attribute:
     return {}
 
-  if attribute:
-    cursor = inventory.search(attribute)
-
-  groups = dict()
-  data = dict()
-  hostvars = Hostvars()
-
-  # Add devices
-  for asset in cursor:
-    # Create Host object and add it to hostvars
-    host = Host(asset)
-    hostvars.add_host(host)
-
-    # Add group/role and group/role member
-    for group in asset['groups']:
-      if group not in groups:
-        groups[group] = Group(group)
-
-      # Add device as member to the group
-      groups[group].add_group_member(asset['asset'])
+  data = None
+  if cache and not refresh:
+    data = cache.get(attribute)
 
-      # Update group/role members in return data
-      data.update({group: groups[group].get_group()})
+  if data is None:
+    started = time.time()
+    data = build_inventory(inventory, attribute, group_inventory=group_inventory)
 
-    # Return data
-    data.update({'_meta': hostvars.get_hostvars()})
+    if cache:
+      cache.set(attribute, data, started=started)
 
   if json_output:
     return json.dumps(data, sort_keys=True, indent=4, separators=(',', ': '))
@@ -135,17 +180,23 @@ def main():
   parser = argparse.ArgumentParser(description='MAX IV Network SPOT - netspot')
   parser.add_argument('-l', '--list', help='List all', action='store_true', required=True)
   parser.add_argument('-f', '--filter',
-                      help='Filter: eg. group:blue',
+                      help='Filter: eg. groups:blue',
                       action='store',
                       required=False,
                       default=None)
+  parser.add_argument('--refresh-cache',
+                      help='Ignore cached inventory data',
+                      action='store_true',
+                      required=False)
   args = parser.parse_args()
 
   if args.list:
-    if args.filter:
-      print AnsibleInventory(attribute=args.filter, inventory=NetSPOT())
-    elif os.environ.get('FILTER'):
-      print AnsibleInventory(attribute=os.environ['FILTER'], inventory=NetSPOT())
+    search_filter = args.filter or os.environ.get('FILTER')
+    if search_filter:
+      print AnsibleInventory(attribute=search_filter,
+                             inventory=NetSPOT(),
+                             cache=InventoryCache(),
+                             refresh=args.refresh_cache)
     else:
       print "Need filter criteria. Specify with -s or env variable FILTER."
 
@@ -0,0 +1,284 @@
+#!/usr/bin/python -tt
+
+"""Line oriented parsers for JUNOS CLI output.
+
+The parsers read the output one line at a time and yield one record at a
+time, so memory use is bounded by the largest record rather than the size
+of the output.
+"""
+
+import re
+
+from collections import namedtuple
+from io import BytesIO
+from lxml import etree
+
+# 'show ethernet-switching table'
+RE_SWITCHING_TABLE = re.compile(r'\s+([\w\d-]+)\s+'      # VLAN
+                                r'\s?([*\w\d:]+)\s+'     # MAC
+                                r'\s?([\w]+) '            # Type
+                                r'\s+([-\d:]+)'           # Age
+                                r'\s+([-.\w\d/]+)')      # Interface
+
+# Ethernet switching table entry
+SwitchingEntry = namedtuple('SwitchingEntry', ['vlan', 'mac', 'type', 'age', 'interface'])
+
+# 'show vlans detail', EX
+RE_EX_VLAN = re.compile(r'([\w\d-]+), 802\.1Q Tag: ([\d\w]+),')
+RE_EX_MEMBERS = re.compile(r'(Untagged|Tagged) interfaces: ([\w\s*.,\/-]*)$')
+RE_EX_CONTINUATION = re.compile(r'^[\w\s*.,\/-]*$')
+
+# 'show vlans detail', QFX/ELS
+RE_QFX_VLAN_NAME = re.compile(r'VLAN Name: ([\w\d-]+)\s')
+RE_QFX_TAG = re.compile(r'Tag: ([\d]+)\s')
+RE_QFX_MEMBER = re.compile(r'([\w\d\/*.-]+),(tagged|untagged),')
+
+
+def lines(output):
+  """Iterate over the lines in output.
+
+  Args:
+    output: string or iterable of lines eg. a file object
+
+  Returns:
+    iterator of lines
+  """
+
+  if isinstance(output, basestring):
+    return _split_lines(output)
+
+  return iter(output)
+
+def _split_lines(output):
+  """Yield the lines in a string without splitting the whole string at once."""
+
+  start = 0
+  while True:
+    end = output.find('\n', start)
+    if end == -1:
+      if start < len(output):
+        yield output[start:]
+      return
+
+    yield output[start:end + 1]
+    start = end + 1
+
+def clean_interface(interface):
+  """Return interface name without flags and unit 0.
+
+  Args:
+    interface: string, interface name eg. ge-0/0/1.0*
+
+  Returns:
+    string, interface name eg. ge-0/0/1
+  """
+
+  return interface.replace('*', '').replace('.0', '')
+
+def _vlan(vlan_id, name):
+  """Return an empty VLAN record."""
+
+  return {'vlan': vlan_id,
+          'name': name,
+          'untagged_interfaces': [],
+          'tagged_interfaces': []}
+
+def parse_vlans(output):
+  """Parse 'show vlans detail' from a JUNOS (EX) switch.
+
+  Args:
+    output: string or iterable of lines
+
+  Yields:
+    vlan_data: dict, vlan, name, untagged_interfaces and tagged_interfaces
+  """
+
+  vlan_data = None
+  members = None
+
+  for line in lines(output):
+    if 'VLAN:' in line:
+      if vlan_data:
+        yield vlan_data
+
+      match = RE_EX_VLAN.search(line)
+      vlan_data = _vlan(match.group(2), match.group(1)) if match else None
+      members = None
+      continue
+
+    if vlan_data is None:
+      continue
+
+    match = RE_EX_MEMBERS.search(line) if 'interfaces:' in line else None
+    if match:
+      if match.group(1) == 'Untagged':
+        members = vlan_data['untagged_interfaces']
+      else:
+        members = vlan_data['tagged_interfaces']
+      line = match.group(2)
+    elif members is None or not RE_EX_CONTINUATION.match(line):
+      # Not part of an interface list
+      members = None
+      continue
+
+    members.extend(clean_interface(line).replace(',', ' ').split())
+
+  if vlan_data:
+    yield vlan_data
+
+def parse_vlans_qfx(output):
+  """Parse 'show vlans detail' from a QFX (ELS) switch.
+
+  Args:
+    output: string or iterable of lines
+
+  Yields:
+    vlan_data: dict, vlan, name, untagged_interfaces and tagged_interfaces
+  """
+
+  name = vlan_id = None
+  untagged = list()
+  tagged = list()
+
+  for line in lines(output):
+    if 'Total MAC count' in line:
+      if name and vlan_id:
+        yield {'vlan': vlan_id,
+               'name': name,
+               'untagged_interfaces': untagged,
+               'tagged_interfaces': tagged}
+
+      name = vlan_id = None
+      untagged = list()
+      tagged = list()
+      continue
+
+    # Substring checks first, regular expressions only on candidate lines
+    if 'tagged,' in line:
+      match = RE_QFX_MEMBER.search(line)
+      if match:
+        if match.group(2) == 'tagged':
+          tagged.append(clean_interface(match.group(1)))
+        else:
+          untagged.append(clean_interface(match.group(1)))
+        continue
+
+    if name is None and 'VLAN Name:' in line:
+      match = RE_QFX_VLAN_NAME.search(line)
+      if match:
+        name = match.group(1)
+        continue
+
+    if vlan_id is None and 'Tag:' in line:
+      match = RE_QFX_TAG.search(line)
+      if match:
+        vlan_id = match.group(1)
+
+  if name and vlan_id:
+    yield {'vlan': vlan_id,
+           'name': name,
+           'untagged_interfaces': untagged,
+           'tagged_interfaces': tagged}
+
+def parse_switching_table(output, upper=False):
+  """Parse 'show ethernet-switching table'.
+
+  Flood entries (MAC '*') are skipped.
+
+  Args:
+    output: string, command output
+    upper: boolean, return MAC addresses in upper case
+
+  Yields:
+    SwitchingEntry, vlan, mac, type, age and interface
+  """
+
+  for match in RE_SWITCHING_TABLE.finditer(output):
+    vlan, mac, entry_type, age, interface = match.groups()
+
+    if mac == '*':
+      continue
+
+    if upper:
+      mac = mac.upper()
+
+    yield SwitchingEntry(vlan, mac, entry_type, age, interface)
+
+def _localname(tag):
+  """Return tag name without XML namespace."""
+
+  return tag.rsplit('}', 1)[-1]
+
+def parse_vlans_xml(source):
+  """Parse the get-vlan-information RPC reply from EX and QFX (ELS) switches.
+
+  Both the EX (<vlan>) and the ELS (<l2ng-l2ald-vlan-instance-group>)
+  formats are supported. When parsing from a string or file, elements
+  are freed as soon as a VLAN has been yielded.
+
+  Args:
+    source: lxml Element (RPC reply), XML string or file object
+
+  Yields:
+    vlan_data: dict, vlan, name, untagged_interfaces and tagged_interfaces
+  """
+
+  # XML string or file, not an already parsed Element
+  needs_parse = not hasattr(source, 'tag')
+
+  if not needs_parse:
+    events = etree.iterwalk(source, events=('end',))
+  else:
+    if isinstance(source, basestring):
+      source = BytesIO(source.encode('utf-8') if isinstance(source, unicode) else source)
+    events = etree.iterparse(source, events=('end',))
+
+  name = vlan_id = interface = tagness = None
+  untagged = list()
+  tagged = list()
+
+  for _, element in events:
+    if not isinstance(element.tag, basestring):
+      # Comments and processing instructions
+      continue
+
+    tag = _localname(element.tag)
+
+    if tag.endswith('vlan-member-interface'):
+      interface = clean_interface(element.text.strip())
+    elif tag.endswith('vlan-member-tagness'):
+      tagness = element.text.strip()
+    elif tag.endswith('vlan-member'):
+      if interface and tagness == 'tagged':
+        tagged.append(interface)
+      elif interface:
+        untagged.append(interface)
+      interface = tagness = None
+    elif tag.endswith('vlan-name'):
+      name = element.text.strip()
+    elif tag.endswith('vlan-tag'):
+      vlan_id = element.text.strip()
+    elif tag in ('vlan', 'l2ng-l2ald-vlan-instance-group'):
+      if name:
+        yield {'vlan': vlan_id or 'Untagged',
+               'name': name,
+               'untagged_interfaces': untagged,
+               'tagged_interfaces': tagged}
+
+      name = vlan_id = None
+      untagged = list()
+      tagged = list()
+
+      # Free the VLAN parsed from a string or file
+      if needs_parse:
+        element.clear()
+        while element.getprevious() is not None:
+          del element.getparent()[0]
+
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python -tt
+
+"""Compact records for collected MAC, ARP and interface entries.
+
+Records use __slots__ instead of a dict per entry. They support item
+access (entry['mac'], entry.get('ip')) so code written for dicts keeps
+working, and are converted to dicts with to_dict() when written to the
+database.
+"""
+
+
+class Record(object):
+  """Base class for slotted records."""
+
+  __slots__ = ()
+
+  def __init__(self, *args, **kwargs):
+    for field, value in zip(self.__slots__, args):
+      setattr(self, field, value)
+
+    for field in self.__slots__[len(args):]:
+      setattr(self, field, kwargs.pop(field, None))
+
+    if kwargs:
+      raise TypeError('Unknown fields: %s' % ', '.join(sorted(kwargs)))
+
+  def __getitem__(self, field):
+    try:
+      return getattr(self, field)
+    except AttributeError:
+      raise KeyError(field)
+
+  def __setitem__(self, field, value):
+    setattr(self, field, value)
+
+  def __eq__(self, other):
+    return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return '%s(%s)' % (type(self).__name__,
+                       ', '.join('%s=%r' % (field, getattr(self, field)) for field in self.__slots__))
+
+  def get(self, field, default=None):
+    """Return field value or default."""
+
+    return getattr(self, field, default)
+
+  def to_dict(self):
+    """Return record as a dict."""
+
+    return dict((field, getattr(self, field)) for field in self.__slots__)
+
+
+class MACEntry(Record):
+  """MAC address table entry."""
+
+  __slots__ = ('interface', 'mac', 'vlan', 'static', 'moves', 'last_move', 'ip')
+
+
+class ARPEntry(Record):
+  """ARP table entry."""
+
+  __slots__ = ('interface', 'mac', 'ip')
+
+
+class InterfaceEntry(Record):
+  """Physical interface."""
+
+  __slots__ = ('interface', 'description', 'mac', 'speed', 'lldp_neighbor', 'vlan')
+
+
+def main():
+  """Do nothing."""
+  pass
+
+if __name__ == '__main__':
+  main()
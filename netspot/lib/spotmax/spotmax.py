@@ -2,12 +2,164 @@
 
 """Module to connect to MongoDB. Acts as base class for different SPOTs. eg netspot."""
 
+import base64
+import os
+import re
+import threading
+
+from bson import json_util
 from bson.objectid import ObjectId
 
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReadPreference, ReturnDocument
 from datetime import datetime
 
 import netspot_settings
+import notify
+
+# Fields that only exist in embedded documents, per collection
+EMBEDDED_FIELDS = {
+    netspot_settings.COLL_NETSPOT: {
+        'interfaces': ('interface', 'description', 'mac', 'speed', 'vlan', 'lldp_neighbor')},
+    netspot_settings.COLL_MACS: {
+        'macs': ('interface', 'mac', 'ip', 'vlan', 'static')},
+}
+
+# Fields that hold several values. key:value searches match a whole value
+TOKEN_FIELDS = {
+    netspot_settings.COLL_NETSPOT: {
+        # Comma separated VLAN ids eg. '201, 202'
+        'vlan': r'(^|, )%s(,|$)',
+        # host:port, also matched by host
+        'lldp_neighbor': r'^%s(:|$)'},
+}
+
+RE_MAC_ADDRESS = re.compile(r'^([0-9A-F]{2}:){5}[0-9A-F]{2}$', re.IGNORECASE)
+RE_IP_ADDRESS = re.compile(r'^\d{1,3}(\.\d{1,3}){3}$')
+RE_SPECIAL_CHARACTERS = re.compile(r'([.^$*+?{}\[\]\\|()])')
+
+# Statistics document id
+STATS_ID = 'dashboard'
+
+# Materialized reports
+REPORTS = ('models', 'junos_versions', 'playbook_runs')
+
+# Process wide MongoDB clients. Key: database name, value: (client, pid)
+_CLIENTS = dict()
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_database(database):
+  """Return a database object from the shared MongoDB client.
+
+  One client (and connection pool) is created per database and process.
+  The client connects and authenticates lazily on first use, and a new
+  client is created in forked child processes.
+
+  Args:
+    database: string, database name
+
+  Returns:
+    pymongo Database object
+  """
+
+  with _CLIENTS_LOCK:
+    client, pid = _CLIENTS.get(database, (None, None))
+
+    if client is None or pid != os.getpid():
+      credentials = dict()
+      if netspot_settings.DB_USERNAME:
+        credentials = {'username': netspot_settings.DB_USERNAME,
+                       'password': netspot_settings.DB_PASSWORD,
+                       'authSource': database}
+
+      client = MongoClient(host=netspot_settings.DB_HOST,
+                           port=netspot_settings.DB_PORT,
+                           maxPoolSize=netspot_settings.DB_MAX_POOL_SIZE,
+                           connectTimeoutMS=netspot_settings.DB_TIMEOUT * 1000,
+                           serverSelectionTimeoutMS=netspot_settings.DB_TIMEOUT * 1000,
+                           connect=False,
+                           **credentials)
+      _CLIENTS[database] = (client, os.getpid())
+
+  return client[database]
+
+def encode_token(document, sort):
+  """Return an opaque continuation token for the sort key of document.
+
+  Args:
+    document: dict, MongoDB document
+    sort: list, sort order as (field, direction) tuples
+
+  Returns:
+    token: string, URL safe token
+  """
+
+  return base64.urlsafe_b64encode(json_util.dumps([document.get(field) for field, _ in sort]))
+
+def decode_token(token, sort):
+  """Return the sort key values in a continuation token.
+
+  Args:
+    token: string, token from encode_token()
+    sort: list, sort order the token was created with
+
+  Returns:
+    values: list, sort key values
+
+  Raises:
+    ValueError: token is invalid
+  """
+
+  try:
+    values = json_util.loads(base64.urlsafe_b64decode(str(token)))
+  except (TypeError, ValueError) as error:
+    raise ValueError('Invalid token: %s' % error)
+
+  if not isinstance(values, list) or len(values) != len(sort):
+    raise ValueError('Invalid token: sort order mismatch')
+
+  return values
+
+def close_clients():
+  """Close all shared MongoDB clients in this process."""
+
+  with _CLIENTS_LOCK:
+    for client, pid in _CLIENTS.values():
+      if pid == os.getpid():
+        client.close()
+    _CLIENTS.clear()
+
+
+class SearchPage(object):
+  """One page of search results with continuation tokens."""
+
+  def __init__(self, documents, sort, has_next=False, has_prev=False):
+    """Init.
+
+    Args:
+      documents: list, documents on this page
+      sort: list, sort order as (field, direction) tuples
+      has_next: boolean, there are documents after this page
+      has_prev: boolean, there are documents before this page
+    """
+
+    self.documents = documents
+    self.next_token = None
+    self.prev_token = None
+
+    if documents and has_next:
+      self.next_token = encode_token(documents[-1], sort)
+    if documents and has_prev:
+      self.prev_token = encode_token(documents[0], sort)
+
+  def __iter__(self):
+    return iter(self.documents)
+
+  def __len__(self):
+    return len(self.documents)
+
+  def __getitem__(self, index):
+    return self.documents[index]
 
 
 class SpotMAX(object):
@@ -16,12 +168,9 @@ class SpotMAX(object):
   def __init__(self, database=None, collection=None):
 
     if database and collection:
-      # Connect to inventory
-      self.client = MongoClient()          # Defaults to localhost on port 27017
-
-      # Select correct database
-      self.database = self.client[database]
-      self.database.authenticate(netspot_settings.DB_USERNAME, netspot_settings.DB_PASSWORD)
+      # Select correct database using the shared client
+      self.database = get_database(database)
+      self.client = self.database.client
 
       # Select collection
       self.collection = self.database[collection]
@@ -31,8 +180,8 @@ class SpotMAX(object):
       self.collection = None
 
   def __exit__(self, exc_type, exc_value, traceback):
-    """Cloase connection to MongoDB."""
-    self.client.close()
+    """The MongoDB client is shared within the process and is left open."""
+    pass
 
   def add_variable(self, target, name=None, variable=None):
     """Add or update name variable.
@@ -60,6 +209,7 @@ class SpotMAX(object):
         result = self.collection.update_one({target: name},
                                             {'$push': {'variables' : {key: value}}})
 
+      self._changed('update', [name])
       return True
     else:
       return False
@@ -94,6 +244,7 @@ class SpotMAX(object):
       result = self.collection.update_one({target: name},
                                           {'$pull': {'variables': {variable: value}}})
       if result.modified_count:
+        self._changed('update', [name])
         return True
     else:
       return False
@@ -144,10 +295,23 @@ class SpotMAX(object):
     cursor = self.collection.delete_one({key: name})
 
     if cursor.deleted_count == 1:
+      self._changed('delete', [name])
       return True
     else:
       return False
 
+  def _changed(self, operation, names=None):
+    """Publish a change notification for the collection.
+
+    Args:
+      operation: string, eg. 'insert', 'update' or 'delete'
+      names: list, changed asset/group names. None if unknown
+    """
+
+    collection = getattr(self.collection, 'name', None)
+    if collection:
+      notify.publish(collection, operation, names)
+
   def _exist(self, name, key='asset'):
     """Check if name exist. Returns True or False.
 
@@ -166,39 +330,33 @@ class SpotMAX(object):
     else:
       return True
 
-  def search(self, searchterm, key='asset', sort=None, limit=100, page=1):
+  def search(self, searchterm, key='asset', sort=None, limit=100, page=1, substring=False,
+             after=None):
     """Search inventory based on searchterm.
 
       Args:
         searchterm: string, what to search for
         key: string, either asset or group
+        sort: string or list, sort order
+        limit: integer, max number of documents. 0 = no limit
+        page: integer, page number. Ignored if after is set
+        substring: boolean, match anywhere in the field (slow, can't use indexes)
+        after: string, continuation token. Return documents after the token
+               sorted on sort (list) or key, see search_page()
 
       Returns:
         return_cursor: MongoDB cursor
     """
 
-    # Parse search term
-    field, value = self.parse_variable(searchterm.strip())
+    query = self.build_query(searchterm, key=key, substring=substring)
 
-    # Split if comma separated list
-    values = set(value.split(','))
-
-    # Check if field is set, otherwise set it to key
-    if not field:
-      field = key
-
-    # Search both top level field and 'interfaces' fields
-    search_list = list()
-    for search_value in values:
-      search_dict = {field: {'$regex': search_value}}
-      search_list.append(search_dict)
-
-    # Add interfaces and MACs
-    search_list.append({'interfaces.%s' % field: {'$regex': value}})
-    search_list.append({'macs.%s' % field: {'$regex': value}})
+    # Keyset pagination
+    if after:
+      sort = self._keyset_sort(sort, key)
+      return self._keyset_cursor(query, sort, decode_token(after, sort)).limit(limit)
 
     # Get assets
-    cursor = self.collection.find({'$or': search_list}).skip(limit*(page-1)).limit(limit)
+    cursor = self.collection.find(query).skip(limit*(page-1)).limit(limit)
 
     # Sort if sort is specified
     if sort:
@@ -206,6 +364,171 @@ class SpotMAX(object):
 
     return cursor
 
+  def search_page(self, searchterm, key='asset', sort=None, limit=100, after=None, before=None,
+                  substring=False):
+    """Return one page of search results using keyset pagination.
+
+    Pages continue from the sort key of the previous page's last (or next
+    page's first) document instead of skipping documents, so fetching a
+    page costs the same at any depth. An invalid token returns the first page.
+
+      Args:
+        searchterm: string, what to search for
+        key: string, field to search and sort on if sort is not set
+        sort: list, sort order as (field, direction) tuples
+        limit: integer, number of documents per page
+        after: string, next_token of the previous page
+        before: string, prev_token of the next page
+        substring: boolean, match anywhere in the field
+
+      Returns:
+        SearchPage object
+    """
+
+    query = self.build_query(searchterm, key=key, substring=substring)
+    sort = self._keyset_sort(sort, key)
+
+    token = after or before
+    reverse = not after and bool(before)
+
+    try:
+      values = decode_token(token, sort) if token else None
+    except ValueError:
+      values, reverse = None, False
+
+    documents = list(self._keyset_cursor(query, sort, values, reverse=reverse).limit(limit + 1))
+    more = len(documents) > limit
+    documents = documents[:limit]
+
+    if reverse:
+      documents.reverse()
+      return SearchPage(documents, sort, has_next=True, has_prev=more)
+
+    return SearchPage(documents, sort, has_next=more, has_prev=values is not None)
+
+  @staticmethod
+  def _keyset_sort(sort, key):
+    """Return sort order with _id as tie breaker."""
+
+    sort = list(sort or [(key, ASCENDING)])
+    if '_id' not in [field for field, _ in sort]:
+      sort.append(('_id', ASCENDING))
+
+    return sort
+
+  def _keyset_cursor(self, query, sort, values=None, reverse=False):
+    """Return a cursor for documents after the sort key values.
+
+    Args:
+      query: dict, MongoDB query
+      sort: list, sort order as (field, direction) tuples
+      values: list, sort key values to continue after. None: from the start
+      reverse: boolean, walk backwards, ie. documents before values in reverse order
+
+    Returns:
+      MongoDB cursor
+    """
+
+    if reverse:
+      sort = [(field, DESCENDING if direction == ASCENDING else ASCENDING)
+              for field, direction in sort]
+
+    if values is not None:
+      # (a > x) or (a == x and b > y) or ...
+      keyset = list()
+      for index, (field, direction) in enumerate(sort):
+        condition = dict((sort[i][0], values[i]) for i in range(index))
+        condition[field] = {'$gt' if direction == ASCENDING else '$lt': values[index]}
+        keyset.append(condition)
+
+      query = {'$and': [query, {'$or': keyset}]} if query else {'$or': keyset}
+
+    return self.collection.find(query).sort(sort)
+
+  def build_query(self, searchterm, key='asset', substring=False):
+    """Build an index friendly query from searchterm.
+
+    Each comma separated value is matched as:
+      - MAC or IP address, key:value: exact match, whole VLAN id or
+        LLDP neighbor host for interface VLANs and neighbors
+      - value*: prefix match
+      - *value: substring match
+      - value: prefix match on key
+    A MAC address without a key is searched in the MAC address field.
+    Substring matches are used for all values if substring is True.
+
+    Args:
+      searchterm: string, what to search for eg. 'w-b08', 'group:blue' or 'mac:*10:00'
+      key: string, field to search if searchterm has no key
+      substring: boolean, match anywhere in the field
+
+    Returns:
+      query: dict, MongoDB query
+    """
+
+    # Parse search term. A MAC address is not a key:value search and
+    # never matches the default key eg. asset
+    if RE_MAC_ADDRESS.match(searchterm.strip()):
+      field, value = 'mac', searchterm.strip()
+    else:
+      field, value = self.parse_variable(searchterm.strip())
+
+    # Exact match for key:value searches
+    exact = field is not None
+
+    # Check if field is set, otherwise set it to key
+    if not field:
+      field = key
+
+    # Split if comma separated list
+    values = set(item.strip() for item in value.split(',') if item.strip())
+
+    # Empty search matches all documents
+    if not values:
+      return {}
+
+    equal = list()
+    conditions = list()
+    tokens = TOKEN_FIELDS.get(getattr(self.collection, 'name', None), {})
+    for search_value in sorted(values):
+      if substring or search_value.startswith('*'):
+        conditions.append({'$regex': self._escape(search_value.strip('*'))})
+      elif search_value.endswith('*'):
+        conditions.append({'$regex': '^' + self._escape(search_value.rstrip('*'))})
+      elif RE_MAC_ADDRESS.match(search_value):
+        equal.append(search_value.upper())
+      elif exact and field in tokens:
+        conditions.append({'$regex': tokens[field] % self._escape(search_value)})
+      elif exact or RE_IP_ADDRESS.match(search_value):
+        equal.append(search_value)
+      else:
+        conditions.append({'$regex': '^' + self._escape(search_value)})
+
+    if len(equal) == 1:
+      conditions.append(equal[0])
+    elif equal:
+      conditions.append({'$in': equal})
+
+    # Search embedded documents if field is not a top level field
+    paths = [field]
+    embedded = EMBEDDED_FIELDS.get(getattr(self.collection, 'name', None), {})
+    if [document for document in embedded if field in embedded[document]]:
+      paths = ['%s.%s' % (document, field) for document in sorted(embedded)
+               if field in embedded[document]]
+
+    search_list = [{path: condition} for path in paths for condition in conditions]
+
+    if len(search_list) == 1:
+      return search_list[0]
+
+    return {'$or': search_list}
+
+  @staticmethod
+  def _escape(value):
+    """Escape regular expression special characters in value."""
+
+    return RE_SPECIAL_CHARACTERS.sub(r'\\\1', value)
+
 
 class SPOTGroup(SpotMAX):
   """Class that interacts with the MongoDB backend."""
@@ -213,6 +536,28 @@ class SPOTGroup(SpotMAX):
   def __init__(self, database=netspot_settings.DATABASE, collection=netspot_settings.COLL_NETSPOT_GROUPS):
     SpotMAX.__init__(self, database, collection)
 
+    # Dashboard statistics
+    self.stats = SPOTStats() if self.collection is not None else None
+
+  def delete(self, name, key='group'):
+    """Delete group.
+
+    Args:
+      name: string, group name
+      key: string, group name field
+
+    Returns:
+      Boolean:  True if success
+                False if failed
+    """
+
+    deleted = SpotMAX.delete(self, name, key=key)
+
+    if deleted and self.stats:
+      self.stats.increment(num_groups=-1)
+
+    return deleted
+
   def add_group(self, group):
     """Add new group.
 
@@ -230,6 +575,11 @@ class SPOTGroup(SpotMAX):
 
     # Add group to database
     self.collection.insert_one({'group': group})
+    self._changed('insert', [group])
+
+    if self.stats:
+      self.stats.increment(num_groups=1)
+
     return True
 
   def get_variables(self, group):
@@ -253,6 +603,205 @@ class SPOTGroup(SpotMAX):
     # Return
     return result
 
+  def get_group_variables(self, groups):
+    """Returns variables for several groups with one query.
+
+    Args:
+      groups: list, group names
+
+    Returns:
+      variables: dict, key: group name, value: list of variable dicts
+    """
+
+    variables = dict((group, []) for group in groups)
+
+    cursor = self.collection.find({'group': {'$in': list(groups)}}, {'group': 1, 'variables': 1})
+    for group in cursor:
+      variables[group['group']] = group.get('variables', [])
+
+    return variables
+
+class SPOTStats(SpotMAX):
+  """Class that maintains precomputed dashboard statistics.
+
+  Counters are incremented by the asset, group and interface write paths
+  and recounted from the collections by reconcile().
+  """
+
+  def __init__(self, database=netspot_settings.DATABASE, collection=netspot_settings.COLL_STATS):
+    SpotMAX.__init__(self, database, collection)
+
+  def increment(self, **counters):
+    """Increment counters, eg. increment(num_assets=1, num_interfaces=48).
+
+    Args:
+      counters: counter name and value to add
+    """
+
+    self.collection.update_one({'_id': STATS_ID},
+                               {'$inc': counters,
+                                '$currentDate': {'lastModified': True}},
+                               upsert=True)
+
+  def get(self):
+    """Return statistics. Counters are reconciled if never done before.
+
+    Returns:
+      stats: dict, num_assets, num_groups, num_interfaces, lastModified and reconciled
+    """
+
+    stats = self.collection.find_one({'_id': STATS_ID})
+
+    if stats is None or 'reconciled' not in stats:
+      stats = self.reconcile()
+
+    return stats
+
+  def reconcile(self):
+    """Recount all counters from the asset and group collections.
+
+    Returns:
+      stats: dict, reconciled statistics
+    """
+
+    assets = self.database[netspot_settings.COLL_NETSPOT]
+
+    try:
+      num_interfaces = assets.aggregate([
+          {'$project': {'count': {'$size': {'$ifNull': ['$interfaces', []]}}}},
+          {'$group': {'_id': None, 'count': {'$sum': '$count'}}}]).next()['count']
+    except StopIteration:
+      num_interfaces = 0
+
+    stats = {'num_assets': assets.count(),
+             'num_groups': self.database[netspot_settings.COLL_NETSPOT_GROUPS].count(),
+             'num_interfaces': num_interfaces}
+
+    return self.collection.find_one_and_update({'_id': STATS_ID},
+                                               {'$set': stats,
+                                                '$currentDate': {'lastModified': True,
+                                                                 'reconciled': True}},
+                                               upsert=True,
+                                               return_document=ReturnDocument.AFTER)
+
+class SPOTReports(SpotMAX):
+  """Class that materializes report results.
+
+  Reports are built from full collection aggregations by materialize(),
+  eg. from a periodic job, and read as a single document. Aggregations
+  prefer a secondary. Playbook run counts are also incremented for every
+  logged playbook run.
+  """
+
+  def __init__(self, database=netspot_settings.DATABASE, collection=netspot_settings.COLL_REPORTS):
+    SpotMAX.__init__(self, database, collection)
+
+  def _aggregate(self, collection, pipeline):
+    """Run an aggregation, on a secondary if available."""
+
+    collection = self.database[collection].with_options(
+        read_preference=ReadPreference.SECONDARY_PREFERRED)
+
+    return collection.aggregate(pipeline)
+
+  def _report_models(self):
+    """Return rows for the models report: [model, count]."""
+
+    models = self._aggregate(netspot_settings.COLL_NETSPOT,
+                             [{'$group' : {'_id': {'model': '$model',
+                                                   're0_model': '$re0_model',
+                                                   're1_model': '$re1_model'},
+                                           'count':{'$sum':1}}}])
+
+    result = dict()
+    for model in models:
+      for sub_model in model['_id']:
+        result[model['_id'][sub_model]] = result.get(model['_id'][sub_model], 0) + model['count']
+
+    return [[model, result[model]] for model in result]
+
+  def _report_junos_versions(self):
+    """Return rows for the JUNOS version report: [model, version]."""
+
+    models = self._aggregate(netspot_settings.COLL_NETSPOT,
+                             [{'$group':  {'_id': {'model':'$model', 'version': '$version'},
+                                           'count': {'$sum': 1}}}])
+
+    return [[model['_id']['model'], model['_id']['version']] for model in models]
+
+  def _report_playbook_runs(self):
+    """Return playbook run counts: [{'playbook': playbook, 'count': count}]."""
+
+    playbooks = self._aggregate(netspot_settings.COLL_PLAYBOOK_LOGS,
+                                [{'$group':  {'_id': {'playbook':'$playbook'},
+                                              'count': {'$sum': 1}}}])
+
+    return [{'playbook': playbook['_id']['playbook'], 'count': playbook['count']}
+            for playbook in playbooks]
+
+  def materialize(self, reports=None):
+    """Build and save reports.
+
+    Args:
+      reports: list, report names. Default: all reports in REPORTS
+    """
+
+    for report in reports or REPORTS:
+      if report == 'playbook_runs':
+        data = {'counts': self._report_playbook_runs()}
+      else:
+        data = {'rows': getattr(self, '_report_' + report)()}
+
+      self.collection.update_one({'_id': report},
+                                 {'$set': data, '$currentDate': {'updated': True}},
+                                 upsert=True)
+
+  def get(self, report):
+    """Return a materialized report. The report is built if missing.
+
+    Args:
+      report: string, report name eg. 'models'
+
+    Returns:
+      report: dict, rows: list of rows
+                    updated: datetime, when the report was updated
+    """
+
+    result = self.collection.find_one({'_id': report})
+
+    if result is None:
+      self.materialize([report])
+      result = self.collection.find_one({'_id': report})
+
+    if report == 'playbook_runs':
+      result['rows'] = [[count['playbook'], count['count']] for count in result.get('counts', [])]
+
+    return result
+
+  def count_playbook_run(self, playbook):
+    """Increment the run count of a playbook.
+
+    Args:
+      playbook: string, playbook name
+    """
+
+    increment = {'$inc': {'counts.$.count': 1}, '$currentDate': {'updated': True}}
+
+    # Increment existing count
+    result = self.collection.update_one({'_id': 'playbook_runs', 'counts.playbook': playbook},
+                                        increment)
+    if result.matched_count:
+      return
+
+    # First run of the playbook. Not counted if the report isn't materialized yet
+    result = self.collection.update_one({'_id': 'playbook_runs', 'counts.playbook': {'$ne': playbook}},
+                                        {'$push': {'counts': {'playbook': playbook, 'count': 1}},
+                                         '$currentDate': {'updated': True}})
+
+    # Added by someone else in the meantime
+    if not result.matched_count:
+      self.collection.update_one({'_id': 'playbook_runs', 'counts.playbook': playbook}, increment)
+
 class SPOTLog(SpotMAX):
   """Class to log playbook runs."""
 
@@ -262,6 +811,9 @@ class SPOTLog(SpotMAX):
 
     SpotMAX.__init__(self, database, collection)
 
+    # Materialized playbook run counts
+    self.reports = SPOTReports() if self.collection is not None else None
+
   def get_log_entries(self, limit=10):
     """Return X number of log entries."""
 
@@ -300,6 +852,9 @@ class SPOTLog(SpotMAX):
     # Save to database
     self.collection.insert_one(log_entry)
 
+    if self.reports:
+      self.reports.count_playbook_run(playbook)
+
 
 def main():
   """Do nothing."""
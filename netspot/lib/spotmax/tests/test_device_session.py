@@ -0,0 +1,106 @@
+#!/usr/bin/python -tt
+"""DeviceSession tests
+
+  Run: python -m unittest tests.test_device_session
+
+"""
+
+import mock
+import os
+import time
+import unittest
+
+from lxml import etree
+
+import device_session
+import net_collector
+import network_device
+
+
+class MockRPC(object):
+  def get_vlan_information(self, detail=False):
+    return etree.parse(os.path.join(os.path.dirname(__file__), 'data', 'vlans_ex.xml')).getroot()
+
+class MockPyEZDevice(object):
+  def __init__(self):
+    self.rpc = MockRPC()
+
+class MockDriver(object):
+  opened = 0
+  closed = 0
+
+  def __init__(self, host, username, password, timeout=60, optional_args=None):
+    self.host = host
+    self.optional_args = optional_args
+    self.device = MockPyEZDevice()
+
+  def open(self):
+    MockDriver.opened += 1
+
+  def close(self):
+    MockDriver.closed += 1
+
+  def get_facts(self):
+    time.sleep(0.1)
+    return {'model': 'EX4300-48T'}
+
+  def get_interfaces(self):
+    return {}
+
+  def get_lldp_neighbors(self):
+    return {}
+
+  def get_mac_address_table(self):
+    return [{'interface': u'ge-0/0/0.0',
+             'last_move': 0.0,
+             'mac': u'B8:27:EB:04:FF:A2',
+             'moves': 0,
+             'static': False,
+             'vlan': 201}]
+
+  def get_arp_table(self):
+    return []
+
+  def cli(self, commands):
+    return {commands[0]: ''}
+
+class TestDeviceSession(unittest.TestCase):
+  def setUp(self):
+    MockDriver.opened = 0
+    MockDriver.closed = 0
+
+  def test_session(self):
+    with device_session.DeviceSession('127.0.0.1', 'username', 'password', MockDriver,
+                                      ssh_keyfile='/tmp/key') as session:
+      facts = session.submit('get_facts')
+      output = session.cli('show vlans detail')
+
+      self.assertEqual({'model': 'EX4300-48T'}, facts.get())
+      self.assertEqual('', output.get())
+      self.assertEqual({}, session.call('get_interfaces'))
+      self.assertEqual({'key_file': '/tmp/key'}, session.device.optional_args)
+
+    self.assertEqual((1, 1), (MockDriver.opened, MockDriver.closed))
+    self.assertEqual(['get_facts', 'get_interfaces', 'show vlans detail'], sorted(session.latency))
+    self.assertGreaterEqual(session.latency['get_facts'], 0.1)
+    self.assertIn('get_facts: 0.1', session.report())
+
+  @mock.patch.object(network_device.netspot_settings, 'VLAN_RETRIEVAL', {'ex4300': 'rpc'})
+  def test_shared_session(self):
+    with device_session.DeviceSession('127.0.0.1', 'username', 'password', MockDriver) as session:
+      device = network_device.NetworkDevice('127.0.0.1', session=session)
+      collector = net_collector.NetCollector('testasset', 'username', 'password', session=session)
+
+    # One connection for discovery and MAC collection
+    self.assertEqual((1, 1), (MockDriver.opened, MockDriver.closed))
+    self.assertEqual('EX4300-48T', device.facts['model'])
+    self.assertEqual(1, len(collector.device_macs['macs']))
+    self.assertEqual(['get_arp_table', 'get_facts', 'get_interfaces', 'get_lldp_neighbors',
+                      'get_mac_address_table', 'get_vlan_information'], sorted(session.latency))
+
+    # VLANs retrieved with RPC
+    self.assertEqual(6, len(device.vlans))
+    self.assertEqual(set(['2200', '3999', '2010', '2030', '2100']), device.port_vlans['ae0'])
+
+if __name__ == '__main__':
+  unittest.main()
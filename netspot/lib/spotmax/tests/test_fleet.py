@@ -0,0 +1,147 @@
+#!/usr/bin/python -tt
+"""Fleet tests
+
+  Run: python -m unittest tests.test_fleet
+
+"""
+
+import threading
+import time
+import unittest
+
+from fleet import Fleet, check_cancelled
+
+
+def mock_collect(asset, delay=0):
+  """Mock device collection."""
+
+  if asset == 'failing_asset':
+    raise ValueError('Connection failed')
+  elif asset == 'exit_asset':
+    raise SystemExit('Could not resolv hostname')
+  elif asset == 'hanging_asset':
+    time.sleep(5)
+
+  time.sleep(delay)
+  return asset.upper()
+
+class FlakyCollect(object):
+  """Mock collection that fails the first attempts."""
+
+  def __init__(self, failures):
+    self.failures = failures
+    self.attempts = 0
+
+  def __call__(self, asset):
+    self.attempts += 1
+    if self.attempts <= self.failures:
+      raise IOError('Connection refused')
+    return asset
+
+class SlowCollect(object):
+  """Mock collection that outlives the timeout and then writes."""
+
+  def __init__(self, delay):
+    self.delay = delay
+    self.running = 0
+    self.max_running = 0
+    self.written = list()
+    self.lock = threading.Lock()
+
+  def __call__(self, asset):
+    with self.lock:
+      self.running += 1
+      self.max_running = max(self.max_running, self.running)
+    try:
+      time.sleep(self.delay)
+      check_cancelled()
+      self.written.append(asset)
+    finally:
+      with self.lock:
+        self.running -= 1
+
+class TestFleet(unittest.TestCase):
+
+  def test_run(self):
+    fleet = Fleet(workers=3, timeout=1)
+    summary = fleet.run(mock_collect, ['asset1', 'asset2', 'failing_asset', 'exit_asset'])
+
+    self.assertEqual(4, len(summary.results))
+    self.assertEqual(['asset1', 'asset2'], [result.asset for result in summary.succeeded])
+    self.assertEqual(['ASSET1', 'ASSET2'], [result.result for result in summary.succeeded])
+    self.assertEqual(['failing_asset', 'exit_asset'], [result.asset for result in summary.failed])
+    self.assertEqual('ValueError: Connection failed', summary.failed[0].error)
+    self.assertIn('FAILED exit_asset', summary.report())
+
+  def test_run_parallel(self):
+    fleet = Fleet(workers=10, timeout=5)
+    summary = fleet.run(mock_collect, ['asset%s' % i for i in range(10)], delay=0.2)
+
+    self.assertEqual(10, len(summary.succeeded))
+    self.assertLess(summary.duration, 1)
+
+  def test_timeout(self):
+    fleet = Fleet(workers=2, timeout=0.2)
+    summary = fleet.run(mock_collect, ['hanging_asset', 'asset1'])
+
+    self.assertEqual(['asset1'], [result.asset for result in summary.succeeded])
+    self.assertEqual('Timeout after 0.2s', summary.failed[0].error)
+    self.assertLess(summary.duration, 1)
+
+  def test_timeout_slots(self):
+    collect = SlowCollect(0.3)
+    fleet = Fleet(workers=2, timeout=0.1)
+    summary = fleet.run(collect, ['asset1', 'asset2', 'asset3', 'asset4'])
+    time.sleep(0.5)
+
+    # Timed out devices keep their slot and don't write
+    self.assertEqual(4, len(summary.failed))
+    self.assertEqual(2, collect.max_running)
+    self.assertEqual([], collect.written)
+
+    # Not cancelled outside a fleet run
+    check_cancelled()
+
+  def test_retry(self):
+    fleet = Fleet(workers=1, timeout=1, retries=2, backoff=0.1)
+
+    start = time.time()
+    summary = fleet.run(FlakyCollect(2), ['asset1'])
+
+    self.assertEqual(['asset1'], [result.asset for result in summary.succeeded])
+    self.assertEqual(3, summary.results[0].attempts)
+
+    # Backoff 0.1s + 0.2s
+    self.assertGreaterEqual(time.time() - start, 0.3)
+
+    summary = fleet.run(FlakyCollect(3), ['asset1'])
+    self.assertEqual(3, summary.failed[0].attempts)
+    self.assertIn('FAILED asset1 (0.0s, 3 attempts): IOError: Connection refused', summary.report())
+
+  def test_retry_errors(self):
+    fleet = Fleet(workers=2, timeout=1, retries=2, backoff=0, retry_errors=(IOError,))
+    summary = fleet.run(mock_collect, ['failing_asset', 'exit_asset'])
+
+    # Only retry_errors are retried
+    self.assertEqual([1, 1], [result.attempts for result in summary.failed])
+    self.assertEqual(3, fleet.run(FlakyCollect(3), ['asset1']).failed[0].attempts)
+
+  def test_retry_timeout(self):
+    # Not retried while the timed out attempt is still running
+    collect = SlowCollect(0.5)
+    summary = Fleet(workers=1, timeout=0.1, retries=1, backoff=0).run(collect, ['asset1'])
+    self.assertEqual(1, summary.failed[0].attempts)
+
+    # Retried once it has exited
+    time.sleep(0.5)
+    summary = Fleet(workers=1, timeout=0.1, retries=1, backoff=0.5).run(collect, ['asset1'])
+    self.assertEqual(2, summary.failed[0].attempts)
+    self.assertEqual(1, collect.max_running)
+
+  def test_empty(self):
+    summary = Fleet().run(mock_collect, [])
+    self.assertEqual([], summary.results)
+    self.assertIn('No devices found.', summary.report())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python -tt
+"""Index tests
+
+  Run: python -m unittest tests.test_indexes
+
+"""
+
+import unittest
+
+import indexes
+import netspot_settings
+
+from pymongo.errors import OperationFailure
+
+
+class MockCollection(object):
+  def __init__(self, name):
+    self.name = name
+    self.indexes = {'_id_': {}}
+
+  def index_information(self):
+    return self.indexes
+
+  def create_indexes(self, models):
+    for model in models:
+      # Existing data violates the unique index
+      if self.name == netspot_settings.COLL_IP and model.document.get('unique'):
+        raise OperationFailure('E11000 duplicate key error')
+      self.indexes[model.document['name']] = model.document
+
+class MockDatabase(object):
+  def __init__(self):
+    self.collections = dict()
+
+  def __getitem__(self, name):
+    return self.collections.setdefault(name, MockCollection(name))
+
+class TestIndexes(unittest.TestCase):
+
+  def setUp(self):
+    self.database = MockDatabase()
+
+  def test_missing_indexes(self):
+    missing = indexes.missing_indexes(self.database)
+
+    self.assertEqual(sum(len(models) for models in indexes.INDEXES.values()), len(missing))
+    self.assertIn((netspot_settings.COLL_NETSPOT, 'asset'), missing)
+    self.assertIn((netspot_settings.COLL_NETSPOT_GROUPS, 'group'), missing)
+    self.assertIn((netspot_settings.COLL_IP, 'ip'), missing)
+
+  def test_ensure_indexes(self):
+    errors = indexes.ensure_indexes(self.database)
+
+    self.assertEqual(1, len(errors))
+    self.assertEqual((netspot_settings.COLL_IP, 'ip'), errors[0][:2])
+    self.assertEqual([(netspot_settings.COLL_IP, 'ip')], indexes.missing_indexes(self.database))
+
+    # Unique indexes
+    self.assertTrue(self.database[netspot_settings.COLL_NETSPOT].indexes['asset']['unique'])
+    self.assertTrue(self.database[netspot_settings.COLL_NETSPOT_GROUPS].indexes['group']['unique'])
+
+  def test_outdated_indexes(self):
+    indexes.ensure_indexes(self.database)
+    collection = self.database[netspot_settings.COLL_NETSPOT]
+
+    # Same name, not unique
+    collection.indexes['asset'] = {'key': [('asset', 1)]}
+    self.assertIn((netspot_settings.COLL_NETSPOT, 'asset'), indexes.missing_indexes(self.database))
+
+    # Same name, other keys
+    collection.indexes['asset'] = {'key': [('asset', -1)], 'unique': True}
+    self.assertIn((netspot_settings.COLL_NETSPOT, 'asset'), indexes.missing_indexes(self.database))
+
+    # As returned by the server
+    collection.indexes['asset'] = {'key': [('asset', 1.0)], 'unique': True, 'v': 2}
+    self.assertNotIn((netspot_settings.COLL_NETSPOT, 'asset'), indexes.missing_indexes(self.database))
+
+if __name__ == '__main__':
+  unittest.main()
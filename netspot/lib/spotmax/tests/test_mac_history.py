@@ -0,0 +1,134 @@
+#!/usr/bin/python -tt
+"""MACHistory tests
+
+  Run: python -m unittest tests.test_mac_history
+
+"""
+
+import unittest
+
+from datetime import datetime, timedelta
+
+from pymongo import InsertOne
+
+import mac_history
+
+
+MACS = {'asset': 'testasset',
+        'macs': [{'interface': u'ge-0/0/0.0',
+                  'ip': u'192.168.31.1',
+                  'mac': u'B8:27:EB:04:FF:A2',
+                  'vlan': 201},
+                 {'interface': u'Router',
+                  'ip': None,
+                  'mac': u'54:E0:32:30:87:01',
+                  'vlan': 0}]}
+
+
+class MockCursor(list):
+  def sort(self, key, direction):
+    return MockCursor(sorted(self, key=lambda k: k[key], reverse=direction < 0))
+
+class MockCollection(object):
+  def __init__(self):
+    self.documents = list()
+    self.bulk_writes = 0
+
+  @staticmethod
+  def _match(document, query):
+    for key, value in query.items():
+      if not isinstance(value, dict):
+        if document.get(key) != value:
+          return False
+      elif '$in' in value and document.get(key) not in value['$in']:
+        return False
+      elif '$gte' in value and document.get(key) < value['$gte']:
+        return False
+      elif '$lte' in value and document.get(key) > value['$lte']:
+        return False
+    return True
+
+  def find(self, query, projection=None):
+    return MockCursor(document for document in self.documents if self._match(document, query))
+
+  def bulk_write(self, requests, ordered=True):
+    self.bulk_writes += 1
+    for request in requests:
+      if isinstance(request, InsertOne):
+        document = dict(request._doc)
+        document['_id'] = len(self.documents)
+        self.documents.append(document)
+      else:
+        for document in self.find(request._filter):
+          document.update(request._doc['$set'])
+
+class TestMACHistory(unittest.TestCase):
+  def setUp(self):
+    self.history = mac_history.MACHistory(None, None, gap=900, poll_interval=300)
+    self.history.collection = MockCollection()
+
+  def _poll(self, seconds):
+    """Move stored times back as if the next poll ran seconds later."""
+
+    for document in self.history.collection.documents:
+      document['first_seen'] -= timedelta(seconds=seconds)
+      document['last_seen'] -= timedelta(seconds=seconds)
+
+  def test_add_macs(self):
+    self.assertEqual({'extended': 0, 'started': 2}, self.history.add_macs(MACS))
+
+    # Seen again right away, nothing is written
+    self.assertEqual({'extended': 0, 'started': 0}, self.history.add_macs(MACS))
+    self.assertEqual(1, self.history.collection.bulk_writes)
+
+    # Interval is extended once the next poll would find it closed
+    self._poll(600)
+
+    self.assertEqual({'extended': 2, 'started': 0}, self.history.add_macs(MACS))
+    self.assertEqual(2, len(self.history.collection.documents))
+    self.assertEqual(2, self.history.collection.bulk_writes)
+
+    interval = self.history.collection.documents[0]
+    self.assertLess(interval['first_seen'], interval['last_seen'])
+
+  def test_add_macs_poll_cadence(self):
+    self.history.add_macs(MACS)
+    last_seen = [document['last_seen'] for document in self.history.collection.documents]
+
+    # Next poll at the usual cadence, no MAC changes
+    self._poll(300)
+    self.assertEqual({'extended': 0, 'started': 0}, self.history.add_macs(MACS))
+    self.assertEqual(1, self.history.collection.bulk_writes)
+    self.assertEqual([seen - timedelta(seconds=300) for seen in last_seen],
+                     [document['last_seen'] for document in self.history.collection.documents])
+
+    # The interval is still open at the poll after that
+    self._poll(300)
+    self.assertEqual({'extended': 2, 'started': 0}, self.history.add_macs(MACS))
+    self.assertEqual(2, len(self.history.collection.documents))
+
+  def test_add_macs_gap(self):
+    self.history.add_macs(MACS)
+
+    # Intervals closed by not being seen for longer than the gap
+    for document in self.history.collection.documents:
+      document['first_seen'] -= timedelta(hours=2)
+      document['last_seen'] -= timedelta(hours=1)
+
+    self.assertEqual({'extended': 0, 'started': 2}, self.history.add_macs(MACS))
+    self.assertEqual(4, len(self.history.collection.documents))
+
+  def test_where_was(self):
+    self.history.add_macs(MACS)
+    now = datetime.utcnow()
+
+    intervals = self.history.where_was('b8:27:eb:04:ff:a2', now - timedelta(hours=1), now)
+    self.assertEqual(1, len(intervals))
+    self.assertEqual(u'ge-0/0/0.0', intervals[0]['interface'])
+
+    self.assertEqual([], self.history.where_was('b8:27:eb:04:ff:a2',
+                                                now - timedelta(hours=2),
+                                                now - timedelta(hours=1)))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -12,6 +12,8 @@ from collections import defaultdict
 
 import net_collector
 
+from pymongo import DeleteMany, InsertOne
+
 
 
 MACS = [{u'active': True,
@@ -40,7 +42,7 @@ ARP = [{'age': 647.0,
 
 
 class MockDriver(object):
-  def __init__(self, host, username, password):
+  def __init__(self, host, username, password, timeout=60, optional_args=None):
     pass
 
   def open(self):
@@ -85,6 +87,57 @@ class MockSpotMAX(object):
   def _exist(ip, key=None):
     return None
 
+class MockBulkWriteResult(object):
+  def __init__(self, requests):
+    self.matched_count = 0
+    self.modified_count = 0
+    self.upserted_count = len(requests)
+
+class MockCollection(object):
+  def __init__(self):
+    self.bulk_writes = list()
+    self.documents = list()
+
+  def bulk_write(self, requests, ordered=True):
+    self.bulk_writes.append((requests, ordered))
+
+    # Apply MACEntries requests
+    for request in requests:
+      if isinstance(request, InsertOne):
+        document = dict(request._doc)
+        document['_id'] = id(document)
+        self.documents.append(document)
+      elif isinstance(request, DeleteMany):
+        self.documents = [document for document in self.documents
+                          if document['_id'] not in request._filter['_id']['$in']]
+      elif '_id' in request._filter:
+        for document in self.find(request._filter):
+          document.update(request._doc['$set'])
+
+    return MockBulkWriteResult(requests)
+
+  def find(self, query=None, projection=None):
+    return [document for document in self.documents
+            if all(document.get(key) == query[key] for key in query or {})]
+
+  def delete_many(self, query):
+    self.documents = [document for document in self.documents
+                      if document['asset'] != query['asset']]
+
+  def insert_many(self, documents, ordered=True):
+    self.documents.extend(documents)
+
+  def update_one(self, query, update, upsert=False):
+    self.delete_many(query)
+    self.documents.append(dict(update['$set']))
+
+class MockDatabase(object):
+  def __init__(self, collections):
+    self.collections = collections
+
+  def __getitem__(self, name):
+    return self.collections[name]
+
 
 def mock_get_network_driver(vendor):
   return MockDriver
@@ -99,8 +152,127 @@ class TestIPUsage(unittest.TestCase):
     device = net_collector.NetCollector('testasset', 'username', 'password')
     device_macs = device.device_macs
 
-    #ipu = net_collector.IPUsage(device_macs, 'TEST_DB', 'TEST_COLL')
-    #ipu.uppdate_ip()
+    # Add a second MAC with the same IP and one without IP
+    device_macs['macs'].append({'interface': u'ge-0/0/1.0',
+                                'ip': u'192.168.31.1',
+                                'last_move': 0.0,
+                                'mac': u'B8:27:EB:04:FF:A3',
+                                'moves': 0,
+                                'static': False,
+                                'vlan': 201})
+
+    ipu = net_collector.IPUsage(device_macs, None, None)
+    ipu.collection = MockCollection()
+    summary = ipu.uppdate_ip()
+
+    self.assertEqual({'matched': 0, 'modified': 0, 'upserted': 1, 'batches': 1}, summary)
+
+    requests, ordered = ipu.collection.bulk_writes[0]
+    self.assertFalse(ordered)
+    self.assertEqual(1, len(requests))
+    self.assertEqual({'ip': u'192.168.31.1'}, requests[0]._filter)
+    self.assertEqual(u'B8:27:EB:04:FF:A3', requests[0]._doc['$set']['mac'])
+    self.assertEqual('testasset', requests[0]._doc['$set']['asset'])
+
+  def test_uppdate_ip_batch_size(self):
+    device_macs = {'asset': 'testasset', 'macs': []}
+    for i in range(5):
+      device_macs['macs'].append({'interface': u'ge-0/0/%s.0' % i,
+                                  'ip': u'192.168.31.%s' % i,
+                                  'mac': u'B8:27:EB:04:FF:A%s' % i,
+                                  'vlan': 201})
+
+    ipu = net_collector.IPUsage(device_macs, None, None)
+    ipu.collection = MockCollection()
+    summary = ipu.uppdate_ip(batch_size=2)
+
+    self.assertEqual(3, summary['batches'])
+    self.assertEqual(5, summary['upserted'])
+    self.assertEqual([2, 2, 1], [len(requests) for requests, _ in ipu.collection.bulk_writes])
+
+class TestLegacyMACs(unittest.TestCase):
+  def test_add_macs(self):
+    net_collector.get_network_driver = mock_get_network_driver
+    net_collector.helpers = MockHelper()
+
+    legacy = net_collector.LegacyMACs(None, None)
+    legacy.collection = MockCollection()
+    device = net_collector.NetCollector('testasset', 'username', 'password')
+
+    # One document per asset, replaced on every run
+    legacy.add_macs(device.device_macs)
+    legacy.add_macs(device.device_macs)
+
+    self.assertEqual(1, len(legacy.collection.documents))
+    self.assertEqual(u'B8:27:EB:04:FF:A2', legacy.collection.documents[0]['macs'][0]['mac'])
+    self.assertIsInstance(legacy.collection.documents[0]['macs'][0], dict)
+
+class TestMACEntries(unittest.TestCase):
+  def setUp(self):
+    net_collector.get_network_driver = mock_get_network_driver
+    net_collector.helpers = MockHelper()
+
+    self.entries = net_collector.MACEntries(None, None)
+    self.entries.collection = MockCollection()
+
+  def test_add_macs(self):
+    device = net_collector.NetCollector('testasset', 'username', 'password')
+
+    self.assertEqual({'added': 2, 'removed': 0, 'moved': 0, 'changed': 0, 'unchanged': 0},
+                     self.entries.add_macs(device.device_macs))
+    self.assertEqual(2, len(self.entries.collection.documents))
+
+    entry = self.entries.collection.find({'mac': u'B8:27:EB:04:FF:A2'})[0]
+    self.assertEqual('testasset', entry['asset'])
+    self.assertEqual(u'ge-0/0/0.0', entry['interface'])
+    self.assertEqual(201, entry['vlan'])
+    self.assertEqual(u'192.168.31.1', entry['ip'])
+
+    # Nothing changed, nothing written
+    self.assertEqual({'added': 0, 'removed': 0, 'moved': 0, 'changed': 0, 'unchanged': 2},
+                     self.entries.add_macs(device.device_macs))
+    self.assertEqual(1, len(self.entries.collection.bulk_writes))
+
+    # Removed entry
+    device.device_macs['macs'] = device.device_macs['macs'][:1]
+    self.assertEqual({'added': 0, 'removed': 1, 'moved': 0, 'changed': 0, 'unchanged': 1},
+                     self.entries.add_macs(device.device_macs))
+    self.assertEqual(1, len(self.entries.collection.documents))
+
+  def test_add_macs_delta(self):
+    device_macs = {'asset': 'testasset',
+                   'macs': [{'interface': 'ge-0/0/1.0', 'vlan': 'v1', 'mac': 'M1', 'ip': None},
+                            {'interface': 'ge-0/0/2.0', 'vlan': 'v1', 'mac': 'M2', 'ip': None}]}
+    self.entries.add_macs(device_macs)
+
+    # M1 moves to another interface and M2 gets an IP address
+    device_macs['macs'] = [{'interface': 'ge-0/0/3.0', 'vlan': 'v1', 'mac': 'M1', 'ip': None},
+                           {'interface': 'ge-0/0/2.0', 'vlan': 'v1', 'mac': 'M2', 'ip': '10.0.0.2'}]
+
+    self.assertEqual({'added': 1, 'removed': 1, 'moved': 1, 'changed': 1, 'unchanged': 0},
+                     self.entries.add_macs(device_macs))
+    self.assertEqual(['ge-0/0/2.0', 'ge-0/0/3.0'],
+                     sorted(entry['interface'] for entry in self.entries.collection.documents))
+    self.assertEqual('10.0.0.2', self.entries.collection.find({'mac': 'M2'})[0]['ip'])
+
+    # Only the delta is written
+    requests, ordered = self.entries.collection.bulk_writes[-1]
+    self.assertFalse(ordered)
+    self.assertEqual(3, len(requests))
+
+  def test_migrate(self):
+    legacy = MockCollection()
+    legacy.documents = [{'asset': 'asset1',
+                         'macs': [{'interface': 'ge-0/0/1.0', 'vlan': 'v1', 'mac': 'M1', 'ip': None},
+                                  {'interface': 'ge-0/0/2.0', 'vlan': 'v1', 'mac': 'M2', 'ip': None}]},
+                        {'asset': 'asset2',
+                         'macs': [{'interface': 'ae0.0', 'vlan': 'v2', 'mac': 'M1', 'ip': '10.0.0.1'}]},
+                        {'asset': 'asset3'}]
+    self.entries.database = MockDatabase({'legacy': legacy})
+
+    self.assertEqual((3, 3), self.entries.migrate('legacy'))
+    self.assertEqual(['asset1', 'asset2'],
+                     sorted(entry['asset'] for entry in self.entries.collection.find({'mac': 'M1'})))
 
 class TestNetCollector(unittest.TestCase):
   def setUp(self):
@@ -143,7 +315,7 @@ class TestNetCollector(unittest.TestCase):
                       'moves': 0,
                       'static': False,
                       'vlan': 201},
-                      nc.device_macs['macs'][0])
+                      nc.device_macs['macs'][0].to_dict())
     self.assertEqual({'interface': u'Router',
                       'ip': None,
                       'last_move': 0.0,
@@ -151,7 +323,7 @@ class TestNetCollector(unittest.TestCase):
                       'moves': 0,
                       'static': True,
                       'vlan': 0},
-                      nc.device_macs['macs'][1])
+                      nc.device_macs['macs'][1].to_dict())
 
   def test_get_mac_table(self):
     devices = defaultdict()
@@ -10,6 +10,8 @@ import netspot
 
 from collections import namedtuple
 
+from fleet import Fleet
+
 from tests.test_spotmax import MockCollection
 
 DEVICE1_FACTS = {'2RE': False,
@@ -106,7 +108,8 @@ Interface = namedtuple('Interface', ['name',
                                      'mtu'])
 
 class MockNetworkDevice(object):
-  def __init__(self, asset, loopback=None, groups='', username=None, password=None, ssh_keyfile=None):
+  def __init__(self, asset, loopback=None, groups='', username=None, password=None, ssh_keyfile=None,
+               session=None, timeout=60):
 
     if loopback == '1':
       self.facts = DEVICE1_FACTS
@@ -143,8 +146,27 @@ class MockNetworkDevice(object):
                   u'vlan': 0}]
 
     self.vlans = list()
+    self.port_vlans = dict()
     self.lldp = dict()
 
+class MockBulkCollection(object):
+  def __init__(self):
+    self.bulk_writes = list()
+
+  def bulk_write(self, requests, ordered=True):
+    self.bulk_writes.append(requests)
+
+  def find(self, query, projection=None):
+    return [{'asset': 'asset1', 'interfaces': [{'interface': 'ge-0/0/0'}, {'interface': 'ge-0/0/1'}]}]
+
+class MockStats(object):
+  def __init__(self):
+    self.counters = dict()
+
+  def increment(self, **counters):
+    for counter, value in counters.items():
+      self.counters[counter] = self.counters.get(counter, 0) + value
+
 class TestNetSPOT(unittest.TestCase):
 
   def setUp(self):
@@ -186,6 +208,65 @@ class TestNetSPOT(unittest.TestCase):
     self.ns.add_new_asset(self.asset)
     self.assertTrue(self.ns.discover(self.asset))
 
+  def test_discover_fleet(self):
+    self.ns.search = lambda search_filter, key, limit: [{'asset': 'asset1', 'loopback': '1'},
+                                                        {'asset': 'asset2', 'loopback': '2'},
+                                                        {'asset': 'asset3', 'loopback': '3'}]
+    self.ns.collection = MockBulkCollection()
+
+    summary = self.ns.discover_fleet('group:test_group', 'test_user', 'test_password',
+                                     fleet=Fleet(workers=3), batch_size=2)
+
+    self.assertEqual(3, len(summary.succeeded))
+    self.assertEqual([2, 1], [len(requests) for requests in self.ns.collection.bulk_writes])
+
+    request = self.ns.collection.bulk_writes[0][0]
+    self.assertEqual({'asset': 'asset1'}, request._filter)
+    self.assertEqual('w-b080001-a-0', request._doc['$set']['hostname'])
+    self.assertEqual('ge-0/0/6', request._doc['$set']['interfaces'][0]['interface'])
+
+  def test_discover_fleet_no_loopback(self):
+    self.ns.search = lambda search_filter, key, limit: [{'asset': 'asset1', 'loopback': '1'},
+                                                        {'asset': 'asset2'}]
+    self.ns.collection = MockBulkCollection()
+
+    summary = self.ns.discover_fleet('group:test_group', 'test_user', 'test_password',
+                                     fleet=Fleet(workers=2))
+
+    # Other assets are still discovered
+    self.assertEqual(['asset1'], [result.asset for result in summary.succeeded])
+    self.assertEqual(['asset2'], [result.asset for result in summary.failed])
+    self.assertIn('Loopback missing', str(summary.failed[0].error))
+
+  def test_discover_fleet_failed(self):
+    self.ns.search = lambda search_filter, key, limit: [{'asset': 'asset1', 'loopback': '1'}]
+    self.ns.collection = MockBulkCollection()
+
+    def discover_update(device):
+      raise ValueError('No facts')
+    self.ns._discover_update = discover_update
+
+    changes = list()
+    self.ns._changed = lambda operation, names=None: changes.append((operation, names))
+
+    summary = self.ns.discover_fleet('group:test_group', 'test_user', 'test_password',
+                                     fleet=Fleet(workers=1))
+
+    # Nothing changed, nothing published
+    self.assertEqual(1, len(summary.failed))
+    self.assertEqual([], changes)
+
+  def test_discover_fleet_stats(self):
+    self.ns.search = lambda search_filter, key, limit: [{'asset': 'asset1', 'loopback': '1'},
+                                                        {'asset': 'asset2', 'loopback': '2'}]
+    self.ns.collection = MockBulkCollection()
+    self.ns.stats = MockStats()
+
+    self.ns.discover_fleet('group:test_group', 'test_user', 'test_password', fleet=Fleet(workers=2))
+
+    # asset1 had two interfaces, both assets now have one
+    self.assertEqual({'num_interfaces': 0}, self.ns.stats.counters)
+
   def test_update_interfaces(self):
     self.ns.add_new_asset(self.asset)
 
@@ -204,6 +285,10 @@ class TestNetSPOT(unittest.TestCase):
     cursor = self.ns.update_interfaces(self.asset.asset, mock_device)
     self.assertEqual(1, cursor.matched_count)
 
+    # VLANs from the reverse index
+    mock_device.port_vlans = {'ge-0/0/6': set(['201', '10'])}
+    self.assertEqual('10, 201', self.ns._interfaces(mock_device)[0]['vlan'])
+
     # Test empty interfaces
     mock_device.interfaces = []
     cursor = self.ns.update_interfaces(self.asset.asset, mock_device)
@@ -5,14 +5,10 @@
 
 """
 
+import mock
 import unittest
 import network_device
 
-VLAN_INTERFACES = """  Untagged interfaces: ge-0/0/0.0, ge-0/0/1.0,
-                        ge-0/0/46.0, ge-0/0/47.0, xe-2/0/0.0
-                        Tagged interfaces: ae0.0*
-                        """
-
 VLAN_DETAIL = """VLAN: acc-wlan-client-staff, 802.1Q Tag: 2200, Admin State: Enabled
                   Number of interfaces: 1 (Active = 1)
                     Tagged interfaces: ae0.0*
@@ -151,10 +147,11 @@ class MockPhyPortTable(object):
 
 
 class MockDriver(object):
-  def __init__(self, host, user, password, ssh_private_key_file=None):
+  def __init__(self, host, user, password, timeout=60, optional_args=None):
     self.facts = {'model': 'EX4800-PS3'}
     self.interfaces = dict()
     self.lldp_neighbors = dict()
+    self.calls = list()
 
   def open(self):
     return True
@@ -163,15 +160,19 @@ class MockDriver(object):
     return True
 
   def get_facts(self):
+    self.calls.append('get_facts')
     return self.facts
 
   def get_interfaces(self):
+    self.calls.append('get_interfaces')
     return self.interfaces
 
   def get_lldp_neighbors(self):
+    self.calls.append('get_lldp_neighbors')
     return self.lldp_neighbors
 
   def cli(self, command):
+    self.calls.append(command[0])
     return {command[0]: ''}
 
 
@@ -190,6 +191,11 @@ class TestSPOTMAX(unittest.TestCase):
   def test_parse_search_term(self):
     self.assertEqual('127.0.0.1', self.device.ip_address)
 
+  def test_discover_order(self):
+    # LLDP neighbors are retrieved while the VLAN output is parsed
+    self.assertEqual(['get_facts', 'get_interfaces', 'show vlans detail', 'get_lldp_neighbors'],
+                     self.device.session.device.calls)
+
   def test_get_vlan_information(self):
     self.device.get_vlan_information(VLAN_DETAIL)
 
@@ -220,16 +226,20 @@ class TestSPOTMAX(unittest.TestCase):
     self.assertEqual(['ae0'], self.device.vlans[7]['tagged_interfaces'])
     self.assertEqual(['ae1', 'ae2', 'ae5', 'ae6', 'xe-0/0/12', 'xe-0/0/13', 'xe-0/0/9'], self.device.vlans[7]['untagged_interfaces'])
 
-  def test_get_interfaces_per_vlan(self):
-    untagged, tagged = self.device.get_interfaces_per_vlan(VLAN_INTERFACES)
-    self.assertEqual(5, len(untagged))
-    self.assertEqual(1, len(tagged))
+  def test_port_vlans(self):
+    self.device.get_vlan_information(VLAN_DETAIL)
+
+    self.assertEqual(set(['2200', '3999']), self.device.port_vlans['ae0'])
+    self.assertEqual(set(['3999']), self.device.port_vlans['ge-1/0/0'])
+    self.assertNotIn('ge-0/0/1', self.device.port_vlans)
+
+    self.device.get_vlan_information_qfx(VLAN_DETAIL_QFX)
+    self.assertEqual(set(['2031']), self.device.port_vlans['xe-0/0/9'])
 
-  def test_clean_interface(self):
-    self.assertEqual('ge-0/0/1', self.device.clean_interface('ge-0/0/1*'))
-    self.assertEqual('ge-0/0/1', self.device.clean_interface('ge-0/0/1,'))
-    self.assertEqual('ge-0/0/1', self.device.clean_interface('ge-0/0/1.0'))
-    self.assertEqual('ge-0/0/1', self.device.clean_interface('ge-0/0/1\n'))
+  @mock.patch.object(network_device.netspot_settings, 'VLAN_RETRIEVAL', {'qfx': 'rpc'})
+  def test_vlan_retrieval(self):
+    self.assertEqual('rpc', self.device.vlan_retrieval('QFX5100-48S-6Q'))
+    self.assertEqual('cli', self.device.vlan_retrieval('EX4200-48T'))
 
 if __name__ == '__main__':
   unittest.main()
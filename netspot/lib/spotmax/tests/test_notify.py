@@ -0,0 +1,110 @@
+#!/usr/bin/python -tt
+"""Change notification tests
+
+  Run: python -m unittest tests.test_notify
+
+"""
+
+import mock
+import unittest
+
+import netspot_settings
+import notify
+from pymongo.errors import AutoReconnect
+from spotmax import SPOTGroup
+
+class MockCollection(object):
+  def __init__(self, name):
+    self.name = name
+
+  def find(self, query):
+    return [query]
+
+  def insert_one(self, document):
+    pass
+
+class MockStream(list):
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    pass
+
+  def close(self):
+    pass
+
+class MockDatabase(object):
+  def __init__(self, listener, streams):
+    self.listener = listener
+    self.streams = streams
+    self.resume_tokens = list()
+
+  def watch(self, pipeline, full_document=None, resume_after=None):
+    self.resume_tokens.append(resume_after)
+    stream = self.streams.pop(0)
+
+    if not self.streams:
+      self.listener.stopped.set()
+    if isinstance(stream, Exception):
+      raise stream
+
+    return stream
+
+
+class TestNotify(unittest.TestCase):
+  def setUp(self):
+    self.changes = list()
+    notify.subscribe('test', self.callback)
+    notify.subscribe(netspot_settings.COLL_NETSPOT_GROUPS, self.callback)
+
+  def tearDown(self):
+    notify.unsubscribe('test', self.callback)
+    notify.unsubscribe(netspot_settings.COLL_NETSPOT_GROUPS, self.callback)
+
+  def callback(self, collection, operation, names):
+    self.changes.append((collection, operation, names))
+
+  def test_publish(self):
+    notify.publish('test', 'update', ['w-b080001-a-0'])
+    notify.publish('other', 'update', ['w-b080001-a-0'])
+
+    self.assertEqual([('test', 'update', ['w-b080001-a-0'])], self.changes)
+
+  def test_write_path(self):
+    groups = SPOTGroup(database=None, collection=None)
+    groups.collection = MockCollection(netspot_settings.COLL_NETSPOT_GROUPS)
+    groups._exist = lambda name, key: False
+
+    self.assertTrue(groups.add_group('blue'))
+    self.assertEqual([(netspot_settings.COLL_NETSPOT_GROUPS, 'insert', ['blue'])], self.changes)
+
+  def test_change_stream(self):
+    notify.ChangeListener.publish_change({'ns': {'coll': netspot_settings.COLL_NETSPOT_GROUPS},
+                                          'operationType': 'update',
+                                          'fullDocument': {'group': 'blue'}})
+    notify.ChangeListener.publish_change({'ns': {'coll': netspot_settings.COLL_NETSPOT_GROUPS},
+                                          'operationType': 'delete',
+                                          'documentKey': {'_id': 1}})
+
+    self.assertEqual([(netspot_settings.COLL_NETSPOT_GROUPS, 'update', ['blue']),
+                      (netspot_settings.COLL_NETSPOT_GROUPS, 'delete', None)], self.changes)
+
+  @mock.patch.object(notify, 'RECONNECT_DELAY', 0)
+  def test_reconnect(self):
+    change = {'_id': 'token1',
+              'ns': {'coll': netspot_settings.COLL_NETSPOT_GROUPS},
+              'operationType': 'update',
+              'fullDocument': {'group': 'blue'}}
+
+    listener = notify.ChangeListener(None, collections=[netspot_settings.COLL_NETSPOT_GROUPS])
+    listener.database = MockDatabase(listener, [MockStream([change]),
+                                                AutoReconnect('connection lost'),
+                                                MockStream([])])
+    listener.run()
+
+    # Resumed after the last change
+    self.assertEqual([None, 'token1', 'token1'], listener.database.resume_tokens)
+    self.assertEqual([(netspot_settings.COLL_NETSPOT_GROUPS, 'update', ['blue'])], self.changes)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/python -tt
+"""Ansible inventory tests
+
+  Run: python -m unittest tests.test_nsinv
+
+"""
+
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import inventory_cache
+import nsinv
+from inventory_cache import InventoryCache
+
+ASSETS = [{'_id': 1, 'asset': 'w-b080001-a-0', 'loopback': '10.0.0.1',
+           'groups': ['blue', 'access'], 'variables': [{'vlan': 201}]},
+          {'_id': 2, 'asset': 'w-b080002-a-0', 'loopback': '10.0.0.2',
+           'groups': ['blue']},
+          {'_id': 3, 'asset': 'w-b080003-a-0', 'loopback': '10.0.0.3',
+           'groups': []}]
+
+class MockInventory(object):
+  def __init__(self):
+    self.searches = list()
+
+  def search(self, searchterm, limit=100):
+    self.searches.append((searchterm, limit))
+    return iter(ASSETS)
+
+class MockEmptyInventory(object):
+  def search(self, searchterm, limit=100):
+    return iter([])
+
+class MockGroupInventory(object):
+  def __init__(self):
+    self.queries = list()
+
+  def get_group_variables(self, groups):
+    self.queries.append(sorted(groups))
+    return {'blue': [{'ntp': '10.0.0.254'}, {'_id': 1}]}
+
+
+class TestAnsibleInventory(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+    self.cache = InventoryCache(path=self.path, ttl=60)
+    self.inventory = MockInventory()
+    self.groups = MockGroupInventory()
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+    inventory_cache._INVALIDATION_FAILED.clear()
+
+  def test_build_inventory(self):
+    data = nsinv.AnsibleInventory(attribute='w-b08', json_output=False,
+                                  inventory=self.inventory, group_inventory=self.groups)
+
+    # All assets, one query for all group variables
+    self.assertEqual([('w-b08', 0)], self.inventory.searches)
+    self.assertEqual([['access', 'blue']], self.groups.queries)
+
+    self.assertEqual({'hosts': ['w-b080001-a-0', 'w-b080002-a-0'],
+                      'vars': {'ntp': '10.0.0.254'}}, data['blue'])
+    self.assertEqual({'hosts': ['w-b080001-a-0'], 'vars': {}}, data['access'])
+    self.assertEqual(3, len(data['_meta']['hostvars']))
+    self.assertEqual({'asset': 'w-b080001-a-0', 'loopback': '10.0.0.1', 'groups': ['blue', 'access'],
+                      'vlan': 201}, data['_meta']['hostvars']['w-b080001-a-0'])
+
+  def test_no_match(self):
+    self.assertEqual({}, nsinv.build_inventory(MockEmptyInventory(), 'x', self.groups))
+    self.assertEqual([], self.groups.queries)
+
+  def test_cache(self):
+    data = nsinv.AnsibleInventory(attribute='group:blue', inventory=self.inventory,
+                                  group_inventory=self.groups, cache=self.cache)
+    cached = nsinv.AnsibleInventory(attribute='group:blue', inventory=self.inventory,
+                                    group_inventory=self.groups, cache=self.cache)
+
+    self.assertEqual(data, cached)
+    self.assertEqual(1, len(self.inventory.searches))
+
+    # Refresh and other filters are not served from the cache
+    nsinv.AnsibleInventory(attribute='group:blue', inventory=self.inventory,
+                           group_inventory=self.groups, cache=self.cache, refresh=True)
+    nsinv.AnsibleInventory(attribute='group:red', inventory=self.inventory,
+                           group_inventory=self.groups, cache=self.cache)
+    self.assertEqual(3, len(self.inventory.searches))
+
+  def test_invalidate(self):
+    self.cache.set('group:blue', {'blue': {}})
+    self.assertEqual({'blue': {}}, self.cache.get('group:blue'))
+
+    self.cache.invalidate()
+    self.assertIsNone(self.cache.get('group:blue'))
+
+    # Data read before the invalidation is not cached
+    self.cache.set('group:blue', {'blue': {}}, started=0)
+    self.assertIsNone(self.cache.get('group:blue'))
+
+  def test_invalidate_groups(self):
+    self.cache.set('group:blue', {'blue': {}, '_meta': {}})
+    self.cache.set('group:red', {'red': {}, '_meta': {}})
+
+    self.cache.invalidate(groups=['blue'])
+    self.assertIsNone(self.cache.get('group:blue'))
+    self.assertEqual({'red': {}, '_meta': {}}, self.cache.get('group:red'))
+
+  def test_invalidate_assets(self):
+    self.cache.set('groups:blue', {'blue': {}, '_meta': {'hostvars': {'w-b080001-a-0': {}}}})
+    self.cache.set('groups:red', {'red': {}, '_meta': {'hostvars': {'w-b080002-a-0': {}}}})
+    self.cache.set('model:ex4300*', {})
+
+    # Entries that contain the asset or whose filter matches it now
+    self.cache.invalidate(assets=['w-b080001-a-0'], matches=lambda key: key == 'model:ex4300*')
+    self.assertIsNone(self.cache.get('groups:blue'))
+    self.assertIsNone(self.cache.get('model:ex4300*'))
+    self.assertEqual({'red': {}, '_meta': {'hostvars': {'w-b080002-a-0': {}}}},
+                     self.cache.get('groups:red'))
+
+  def test_invalidate_failed(self):
+    self.cache.set('group:blue', {'blue': {}})
+
+    def remove(filename):
+      raise OSError(errno.EACCES, 'Permission denied', filename)
+    self.cache._remove = remove
+
+    # Entry left in place, the cache is not used anymore
+    self.cache.invalidate()
+    self.assertTrue(os.path.exists(self.cache._filename('group:blue')))
+    self.assertIsNone(self.cache.get('group:blue'))
+
+    self.cache.set('group:red', {'red': {}})
+    self.assertIsNone(InventoryCache(path=self.path, ttl=60).get('group:red'))
+
+  def test_file_modes(self):
+    cache = InventoryCache(path=os.path.join(self.path, 'cache'), ttl=60)
+    cache.set('group:blue', {'blue': {}})
+    cache.invalidate(groups=['red'])
+
+    self.assertEqual(inventory_cache.DIR_MODE, stat.S_IMODE(os.stat(cache.path).st_mode))
+    for filename in (cache._filename('group:blue'),
+                     os.path.join(cache.path, inventory_cache.GENERATION_FILE)):
+      self.assertEqual(inventory_cache.FILE_MODE, stat.S_IMODE(os.stat(filename).st_mode))
+
+  def test_ttl(self):
+    self.cache.set('group:blue', {'blue': {}})
+    filename = self.cache._filename('group:blue')
+    os.utime(filename, (0, 0))
+
+    self.assertIsNone(self.cache.get('group:blue'))
+
+  def test_not_serializable(self):
+    self.cache.set('group:blue', {'blue': object()})
+
+    self.assertIsNone(self.cache.get('group:blue'))
+    self.assertEqual([], os.listdir(self.path))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/python -tt
+"""Parser tests
+
+  Run: python -m unittest tests.test_parsers
+
+"""
+
+import json
+import os
+import unittest
+
+from lxml import etree
+
+import parsers
+
+# Recorded device output and expected result
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def corpus(name):
+  """Return recorded output and expected VLANs."""
+
+  with open(os.path.join(DATA, name + '.json')) as expected:
+    return os.path.join(DATA, name + '.txt'), json.load(expected)
+
+class TestParseVlans(unittest.TestCase):
+
+  def test_parse_vlans(self):
+    output, expected = corpus('vlans_ex')
+
+    with open(output) as lines:
+      self.assertEqual(expected, list(parsers.parse_vlans(lines)))
+
+    with open(output) as lines:
+      self.assertEqual(expected, list(parsers.parse_vlans(lines.read())))
+
+  def test_parse_vlans_qfx(self):
+    output, expected = corpus('vlans_qfx')
+
+    with open(output) as lines:
+      self.assertEqual(expected, list(parsers.parse_vlans_qfx(lines)))
+
+    with open(output) as lines:
+      self.assertEqual(expected, list(parsers.parse_vlans_qfx(lines.read())))
+
+  def test_parse_vlans_xml(self):
+    for name in ('vlans_ex', 'vlans_qfx'):
+      output, expected = corpus(name)
+      xml = output.replace('.txt', '.xml')
+
+      # File, string and RPC reply
+      with open(xml) as reply:
+        self.assertEqual(expected, list(parsers.parse_vlans_xml(reply)))
+
+      with open(xml) as reply:
+        self.assertEqual(expected, list(parsers.parse_vlans_xml(reply.read())))
+
+      self.assertEqual(expected, list(parsers.parse_vlans_xml(etree.parse(xml).getroot())))
+
+  def test_parse_vlans_incremental(self):
+    vlans = parsers.parse_vlans(iter(['VLAN: v1, 802.1Q Tag: 10, Admin State: Enabled\n',
+                                      '  Tagged interfaces: ae0.0*\n',
+                                      'VLAN: v2, 802.1Q Tag: 20, Admin State: Enabled\n']))
+
+    # First VLAN is yielded when the next one starts
+    self.assertEqual({'vlan': '10', 'name': 'v1',
+                      'untagged_interfaces': [], 'tagged_interfaces': ['ae0']}, next(vlans))
+    self.assertEqual('20', next(vlans)['vlan'])
+    self.assertRaises(StopIteration, next, vlans)
+
+  def test_parse_switching_table(self):
+    with open(os.path.join(DATA, 'switching_table.txt')) as output:
+      entries = list(parsers.parse_switching_table(output.read()))
+
+    # Flood entry '*' is skipped
+    self.assertEqual(6, len(entries))
+    self.assertEqual(('acc-3gev-dia', '00:19:0f:0e:e2:06', 'D', '1:22', 'ae0.0'), entries[0])
+    self.assertEqual('Static', entries[4].type)
+    self.assertEqual('ge-0/0/47.0', entries[4].interface)
+
+    entries = parsers.parse_switching_table('  servers   00:50:56:94:31:4c   D   -   ge-0/0/1.0',
+                                            upper=True)
+    self.assertEqual('00:50:56:94:31:4C', next(entries).mac)
+
+  def test_lines(self):
+    self.assertEqual(['a\n', 'b\n', 'c'], list(parsers.lines('a\nb\nc')))
+    self.assertEqual([], list(parsers.lines('')))
+
+if __name__ == '__main__':
+  unittest.main()
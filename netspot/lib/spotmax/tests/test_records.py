@@ -0,0 +1,42 @@
+#!/usr/bin/python -tt
+"""Record tests
+
+  Run: python -m unittest tests.test_records
+
+"""
+
+import unittest
+
+from records import ARPEntry, MACEntry
+
+
+class TestRecords(unittest.TestCase):
+
+  def test_mac_entry(self):
+    entry = MACEntry('ge-0/0/0.0', 'B8:27:EB:04:FF:A2', 201, static=False)
+
+    self.assertEqual('ge-0/0/0.0', entry.interface)
+    self.assertEqual('B8:27:EB:04:FF:A2', entry['mac'])
+    self.assertEqual(None, entry.get('ip'))
+    self.assertEqual('default', entry.get('missing', 'default'))
+    self.assertRaises(KeyError, entry.__getitem__, 'missing')
+
+    entry['ip'] = '192.168.31.1'
+    self.assertEqual({'interface': 'ge-0/0/0.0',
+                      'mac': 'B8:27:EB:04:FF:A2',
+                      'vlan': 201,
+                      'static': False,
+                      'moves': None,
+                      'last_move': None,
+                      'ip': '192.168.31.1'}, entry.to_dict())
+
+  def test_slots(self):
+    entry = ARPEntry('me0.0', '00:10:DB:FF:10:01', '192.168.96.1')
+
+    self.assertFalse(hasattr(entry, '__dict__'))
+    self.assertRaises(AttributeError, setattr, entry, 'vlan', 10)
+    self.assertRaises(TypeError, ARPEntry, 'me0.0', vlan=10)
+    self.assertEqual(ARPEntry('me0.0', '00:10:DB:FF:10:01', '192.168.96.1'), entry)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,7 +6,9 @@
 """
 
 import unittest
-from spotmax import SpotMAX, SPOTGroup
+import netspot_settings
+import spotmax
+from spotmax import SpotMAX, SPOTGroup, SPOTReports
 from collections import defaultdict
 
 class MockNetworkDevice(object):
@@ -112,6 +114,13 @@ class MockCursor(object):
     """Makes the object indexable."""
     return self.data[index][0]
 
+class MockStats(object):
+  def __init__(self):
+    self.increments = list()
+
+  def increment(self, num_groups=0):
+    self.increments.append(num_groups)
+
 class MockCollection(object):
   def __init__(self):
     self.data = MockData()
@@ -137,9 +146,13 @@ class MockCollection(object):
       key = query.get('group')
 
     # Check if asset is empty and if query is in "or" form
-    # Eg. {'$or': [{'asset': {'$regex': 'test_asset'}}, {'interfaces.asset': {'$regex': 'test_asset'}}, {'macs.asset': {'$regex': 'test_asset'}}]}
+    # Eg. {'$or': [{'asset': {'$regex': '^test_asset'}}, {'asset': {'$regex': '^test_asset2'}}]}
     if not key and '$or' in query.keys():
-      key = query['$or'][0]['asset']['$regex']
+      key = query['$or'][0]['asset']
+
+    # Prefix search eg. {'asset': {'$regex': '^test_asset'}}
+    if isinstance(key, dict):
+      key = key['$regex'].lstrip('^').replace('\\', '')
 
     # If asset is set return MockCursor with the entry
     # Otherwise return empty MockCursor
@@ -210,7 +223,7 @@ class MockCollection(object):
     return cursor
 
   def delete_one(self, query=None):
-    asset = query['asset']
+    asset = self._get_key(query)
     cursor = MockCursor()
 
     # Delete data if found. Otherwise return empty cursor
@@ -220,6 +233,88 @@ class MockCollection(object):
 
     return cursor
 
+class MockUpdateResult(object):
+  def __init__(self, matched_count):
+    self.matched_count = matched_count
+
+class MockReportCollection(object):
+  """Supports the playbook run count updates."""
+
+  def __init__(self):
+    self.reports = dict()
+
+  def find_one(self, query):
+    return self.reports.get(query['_id'])
+
+  def update_one(self, query, update, upsert=False):
+    report = self.reports.get(query['_id'])
+    if report is None and not upsert:
+      return MockUpdateResult(0)
+
+    report = self.reports.setdefault(query['_id'], {'_id': query['_id']})
+    playbooks = [count['playbook'] for count in report.get('counts', [])]
+    playbook = query.get('counts.playbook')
+
+    if isinstance(playbook, dict):
+      if playbook['$ne'] in playbooks:
+        return MockUpdateResult(0)
+      report['counts'].append(update['$push']['counts'])
+    elif playbook:
+      if playbook not in playbooks:
+        return MockUpdateResult(0)
+      report['counts'][playbooks.index(playbook)]['count'] += 1
+    else:
+      report.update(update['$set'])
+
+    return MockUpdateResult(1)
+
+def _match(document, query):
+  """Evaluate the query subset used by keyset pagination."""
+
+  for field, condition in query.items():
+    if field == '$and':
+      if not all(_match(document, sub_query) for sub_query in condition):
+        return False
+    elif field == '$or':
+      if not any(_match(document, sub_query) for sub_query in condition):
+        return False
+    elif isinstance(condition, dict) and '$gt' in condition:
+      if not document.get(field) > condition['$gt']:
+        return False
+    elif isinstance(condition, dict) and '$lt' in condition:
+      if not document.get(field) < condition['$lt']:
+        return False
+    elif document.get(field) != condition:
+      return False
+
+  return True
+
+class MockSortedCursor(object):
+  def __init__(self, documents):
+    self.documents = documents
+
+  def sort(self, sort):
+    for field, direction in reversed(sort):
+      self.documents.sort(key=lambda document: document.get(field), reverse=direction == -1)
+    return self
+
+  def limit(self, limit):
+    if limit:
+      self.documents = self.documents[:limit]
+    return self
+
+  def __iter__(self):
+    return iter(self.documents)
+
+class MockKeysetCollection(object):
+  def __init__(self, documents):
+    self.documents = documents
+    self.queries = list()
+
+  def find(self, query):
+    self.queries.append(query)
+    return MockSortedCursor([document for document in self.documents if _match(document, query)])
+
 class TestSPOTMAX(unittest.TestCase):
  
   def setUp(self):
@@ -242,12 +337,17 @@ class TestSPOTMAX(unittest.TestCase):
   def test_delete(self):
     asset = 'test_asset'
 
-    # Delete non-existing asset
+    changes = list()
+    self.sm._changed = lambda operation, names=None: changes.append((operation, names))
+
+    # Delete non-existing asset, no change published
     self.assertFalse(self.sm.delete(asset, key='asset'))
+    self.assertEqual([], changes)
 
     # Add asset and test
     self.sm.collection.data.add({'asset': 'test_asset', 'variables': []})
     self.assertTrue(self.sm.delete(asset, key='asset'))
+    self.assertEqual([('delete', [asset])], changes)
 
   def test_delete_variable(self):
     asset = 'test_asset'
@@ -304,6 +404,79 @@ class TestSPOTMAX(unittest.TestCase):
     # Test non-existing asset again
     self.assertEqual(0, self.sm.search('empty_again').count())
 
+class TestSharedClient(unittest.TestCase):
+
+  def tearDown(self):
+    spotmax.close_clients()
+
+  def test_get_database(self):
+    database = spotmax.get_database('test_db')
+    self.assertEqual('test_db', database.name)
+
+    # Same client for the same database
+    self.assertIs(database.client, spotmax.get_database('test_db').client)
+
+    # SpotMAX objects share the client
+    self.assertIs(database.client, SpotMAX('test_db', 'coll1').client)
+    self.assertIs(database.client, SPOTGroup('test_db', 'coll2').client)
+
+  def test_get_database_after_fork(self):
+    client = spotmax.get_database('test_db').client
+
+    # Pretend that the client was created by the parent process
+    spotmax._CLIENTS['test_db'] = (client, -1)
+    self.assertIsNot(client, spotmax.get_database('test_db').client)
+
+class TestSearchQuery(unittest.TestCase):
+
+  def setUp(self):
+    self.sm = SpotMAX(None, None)
+    self.sm.collection = MockCollection()
+
+  def test_prefix(self):
+    self.assertEqual({'asset': {'$regex': '^w-b08'}}, self.sm.build_query('w-b08'))
+    self.assertEqual({'asset': {'$regex': '^w-b08'}}, self.sm.build_query('asset:w-b08*'))
+    self.assertEqual({'asset': {'$regex': '^w\\.b08'}}, self.sm.build_query('w.b08'))
+    self.assertEqual({'ip': {'$regex': '^192\\.168\\.'}}, self.sm.build_query('192.168.', key='ip'))
+
+  def test_exact(self):
+    self.assertEqual({'groups': 'blue'}, self.sm.build_query('groups:blue'))
+    self.assertEqual({'groups': {'$in': ['blue', 'green']}}, self.sm.build_query('groups:green,blue'))
+    self.assertEqual({'loopback': '10.0.0.1'}, self.sm.build_query('10.0.0.1', key='loopback'))
+    self.assertEqual({'mac': 'B0:A8:6E:0C:5C:2B'},
+                     self.sm.build_query('b0:a8:6e:0c:5c:2b', key='mac'))
+
+  def test_substring(self):
+    self.assertEqual({'mac': {'$regex': '10:00'}}, self.sm.build_query('mac:*10:00*'))
+    self.assertEqual({'ip': {'$regex': '0\\.4'}}, self.sm.build_query('ip:*0.4'))
+    self.assertEqual({'asset': {'$regex': 'b08'}}, self.sm.build_query('b08', substring=True))
+
+  def test_empty(self):
+    self.assertEqual({}, self.sm.build_query(''))
+    self.assertEqual({}, self.sm.build_query('groups:'))
+
+  def test_embedded(self):
+    self.sm.collection.name = netspot_settings.COLL_NETSPOT
+    self.assertEqual({'interfaces.mac': 'B0:A8:6E:0C:5C:2B'},
+                     self.sm.build_query('mac:b0:a8:6e:0c:5c:2b'))
+    self.assertEqual({'asset': {'$regex': '^w-b08'}}, self.sm.build_query('w-b08'))
+
+    # A bare MAC address is searched in the MAC field, not the default key
+    self.assertEqual({'interfaces.mac': 'B0:A8:6E:0C:5C:2B'},
+                     self.sm.build_query('b0:a8:6e:0c:5c:2b'))
+
+    # Trunk VLANs and neighbor hosts match a whole value
+    self.assertEqual({'interfaces.vlan': {'$regex': '(^|, )201(,|$)'}},
+                     self.sm.build_query('vlan:201'))
+    self.assertEqual({'interfaces.lldp_neighbor': {'$regex': '^w-b08\\.lab(:|$)'}},
+                     self.sm.build_query('lldp_neighbor:w-b08.lab'))
+
+    self.sm.collection.name = netspot_settings.COLL_MACS
+    self.assertEqual({'macs.ip': '10.0.0.1'}, self.sm.build_query('ip:10.0.0.1'))
+    self.assertEqual({'$or': [{'macs.ip': {'$regex': '^10\\.0\\.0\\.1'}},
+                              {'macs.ip': {'$regex': '^10\\.0\\.0\\.2'}}]},
+                     self.sm.build_query('ip:10.0.0.1*,10.0.0.2*'))
+
 class TestSPOTGroup(unittest.TestCase):
 
   def setUp(self):
@@ -320,6 +493,16 @@ class TestSPOTGroup(unittest.TestCase):
     # Already exist
     self.assertFalse(self.ns.add_group('test_group'))
 
+  def test_group_stats(self):
+    self.ns.stats = MockStats()
+
+    self.assertTrue(self.ns.add_group('test_group'))
+    self.assertTrue(self.ns.add_group('test_group2'))
+    self.assertTrue(self.ns.delete('test_group'))
+    self.assertFalse(self.ns.delete('test_group'))
+
+    self.assertEqual([1, 1, -1], self.ns.stats.increments)
+
   def test_delete_variable(self):
     group = 'test_group'
     variable = 'TEST_VAR:TEST_VALUE'
@@ -352,5 +535,74 @@ class TestSPOTGroup(unittest.TestCase):
     variables = self.ns.get_variables(group)
     self.assertEqual(2, len(variables))
 
+class TestKeysetPagination(unittest.TestCase):
+
+  def setUp(self):
+    # Two IPs per date and time to test the _id tie breaker
+    documents = [{'_id': i, 'ip': '10.0.0.%s' % i, 'date': '2017-01-%02d' % (i / 4 + 1),
+                  'time': '12:%02d' % (i / 2 % 2)} for i in range(10)]
+    self.sm = SpotMAX(None, None)
+    self.sm.collection = MockKeysetCollection(documents)
+    self.sort = [('date', 1), ('time', 1)]
+
+  def test_pages(self):
+    pages = list()
+    page = self.sm.search_page('', key='ip', sort=self.sort, limit=4)
+    pages.append([document['_id'] for document in page])
+
+    while page.next_token:
+      page = self.sm.search_page('', key='ip', sort=self.sort, limit=4, after=page.next_token)
+      pages.append([document['_id'] for document in page])
+
+    self.assertEqual([[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]], pages)
+    self.assertIsNone(page.next_token)
+
+    # Walk back from the last page
+    page = self.sm.search_page('', key='ip', sort=self.sort, limit=4, before=page.prev_token)
+    self.assertEqual([4, 5, 6, 7], [document['_id'] for document in page])
+    page = self.sm.search_page('', key='ip', sort=self.sort, limit=4, before=page.prev_token)
+    self.assertEqual([0, 1, 2, 3], [document['_id'] for document in page])
+    self.assertIsNone(page.prev_token)
+    self.assertIsNotNone(page.next_token)
+
+  def test_search_after(self):
+    first = self.sm.search_page('', key='ip', limit=3)
+    cursor = self.sm.search('', key='ip', limit=3, after=first.next_token)
+
+    self.assertEqual(['10.0.0.3', '10.0.0.4', '10.0.0.5'], [document['ip'] for document in cursor])
+
+  def test_invalid_token(self):
+    page = self.sm.search_page('', key='ip', limit=4, after='invalid')
+
+    self.assertEqual([0, 1, 2, 3], [document['_id'] for document in page])
+    self.assertRaises(ValueError, spotmax.decode_token, 'invalid', self.sort)
+
+class TestSPOTReports(unittest.TestCase):
+
+  def setUp(self):
+    self.reports = SPOTReports(database=None, collection=None)
+    self.reports.collection = MockReportCollection()
+    self.reports._report_playbook_runs = lambda: [{'playbook': 'site.yml', 'count': 2}]
+    self.reports._aggregate = lambda collection, pipeline: [
+        {'_id': {'model': 'Virtual Chassis', 're0_model': 'EX4300-48T', 're1_model': None},
+         'count': 2},
+        {'_id': {'model': 'EX4300-48T', 're0_model': 'EX4300-48T', 're1_model': None},
+         'count': 1}]
+
+  def test_models(self):
+    rows = self.reports.get('models')['rows']
+
+    self.assertEqual([[None, 3], ['EX4300-48T', 4], ['Virtual Chassis', 2]], sorted(rows))
+
+  def test_playbook_runs(self):
+    # Not counted before the report is materialized
+    self.reports.count_playbook_run('site.yml')
+    self.assertEqual([['site.yml', 2]], self.reports.get('playbook_runs')['rows'])
+
+    self.reports.count_playbook_run('site.yml')
+    self.reports.count_playbook_run('ports.yml')
+    self.assertEqual([['site.yml', 3], ['ports.yml', 1]],
+                     self.reports.get('playbook_runs')['rows'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""Create or verify the netspot MongoDB indexes."""
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from netspot import netspot_settings
+from netspot.lib.spotmax import indexes, spotmax
+
+
+class Command(BaseCommand):
+  """Create or verify the netspot MongoDB indexes."""
+
+  help = 'Create missing MongoDB indexes. Use --check to only list missing indexes.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--check',
+                        action='store_true',
+                        dest='check',
+                        default=False,
+                        help='Only report missing indexes.')
+
+  def handle(self, *args, **options):
+    database = spotmax.get_database(netspot_settings.DATABASE)
+
+    if not options['check']:
+      for collection, name, error in indexes.ensure_indexes(database):
+        self.stderr.write('Failed to create %s.%s: %s' % (collection, name, error))
+
+    missing = indexes.missing_indexes(database)
+    for collection, name in missing:
+      self.stdout.write('Missing index: %s.%s' % (collection, name))
+
+    if missing:
+      raise CommandError('%s index(es) missing.' % len(missing))
+
+    self.stdout.write('All indexes present.')
@@ -0,0 +1,29 @@
+"""Migrate MAC entries from the one document per asset layout."""
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from netspot import netspot_settings
+from netspot.lib.spotmax import net_collector
+
+
+class Command(BaseCommand):
+  """Copy MAC entries from COLL_MACS to COLL_MAC_ENTRIES."""
+
+  help = ('Copy MAC entries from the one document per asset collection (COLL_MACS) '
+          'to the MAC entries collection (COLL_MAC_ENTRIES).')
+
+  def add_arguments(self, parser):
+    parser.add_argument('--source',
+                        dest='source',
+                        default=netspot_settings.COLL_MACS,
+                        help='Source collection. Default: %s' % netspot_settings.COLL_MACS)
+
+  def handle(self, *args, **options):
+    assets, entries = net_collector.MACEntries().migrate(options['source'])
+
+    self.stdout.write('Migrated %s MAC entries from %s assets.' % (entries, assets))
+
+    if netspot_settings.MAC_LEGACY_LAYOUT:
+      self.stdout.write('Set MAC_LEGACY_LAYOUT = False to stop writing %s.' % options['source'])
@@ -0,0 +1,27 @@
+"""Materialize the netspot reports."""
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from netspot.lib.spotmax import spotmax
+
+
+class Command(BaseCommand):
+  """Rebuild the materialized reports."""
+
+  help = 'Rebuild materialized reports. Run periodically, eg. from cron outside business hours.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('reports',
+                        nargs='*',
+                        help='Reports to rebuild: %s. Default: all.' % ', '.join(spotmax.REPORTS))
+
+  def handle(self, *args, **options):
+    unknown = set(options['reports']) - set(spotmax.REPORTS)
+    if unknown:
+      raise CommandError('Unknown report(s): %s' % ', '.join(sorted(unknown)))
+
+    spotmax.SPOTReports().materialize(options['reports'] or None)
+
+    self.stdout.write('Reports updated.')
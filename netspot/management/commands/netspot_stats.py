@@ -0,0 +1,20 @@
+"""Reconcile the netspot dashboard statistics."""
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from netspot.lib.spotmax import spotmax
+
+
+class Command(BaseCommand):
+  """Recount the dashboard statistics from the asset and group collections."""
+
+  help = 'Recount dashboard statistics. Run periodically, eg. from cron.'
+
+  def handle(self, *args, **options):
+    stats = spotmax.SPOTStats().reconcile()
+
+    self.stdout.write('Assets: %s, interfaces: %s, groups: %s' % (stats['num_assets'],
+                                                                 stats['num_interfaces'],
+                                                                 stats['num_groups']))
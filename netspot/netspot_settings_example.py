@@ -9,11 +9,37 @@ from django_auth_ldap.config import LDAPSearch, GroupOfNamesType
 DATABASE = 'netspot'                          # Database name
 DB_USERNAME = ''                              # Database username
 DB_PASSWORD = ''                              # Database password
+DB_HOST = 'localhost'                         # Database server
+DB_PORT = 27017                               # Database port
+DB_MAX_POOL_SIZE = 50                         # Max connections per process
+DB_TIMEOUT = 5                                # Connect/server selection timeout in seconds
 COLL_NETSPOT = 'netspot'                      # Base collection
 COLL_NETSPOT_GROUPS = 'netspot_groups'        # Groups collection name
-COLL_MACS = 'netspot_macs'                    # MACs collection name
+COLL_MACS = 'netspot_macs'                    # MACs collection name (legacy, one document per asset)
+COLL_MAC_ENTRIES = 'netspot_mac_entries'      # MAC entries collection name
+COLL_MAC_HISTORY = 'netspot_mac_history'      # MAC history collection name
 COLL_IP = 'netspot_ip_usage'                  # IP collection name
 COLL_PLAYBOOK_LOGS = 'netspot_playbook_logs'  # Playbook log collection
+COLL_STATS = 'netspot_stats'                  # Dashboard statistics collection
+COLL_REPORTS = 'netspot_reports'              # Materialized reports collection
+
+# MAC entries
+MAC_LEGACY_LAYOUT = True                      # Also write COLL_MACS. Disable after netspot_migrate_macs
+
+# MAC history
+MAC_HISTORY_GAP = 900                         # Seconds without observation before a new interval starts
+MAC_POLL_INTERVAL = 300                       # Seconds between MAC collections (nc_client), less than MAC_HISTORY_GAP
+MAC_HISTORY_RETENTION = 90                    # Days to keep MAC history
+
+# Device discovery
+# VLAN retrieval per model family (model name prefix): 'cli' scrapes 'show vlans detail',
+# 'rpc' uses the get-vlan-information RPC. Models not listed use 'cli'.
+VLAN_RETRIEVAL = {'qfx': 'rpc', 'ex4300': 'rpc'}
+
+# Ansible inventory cache
+INVENTORY_CACHE_PATH = '/tmp/netspot_inventory'  # Directory for cached inventory data, '' disables caching
+INVENTORY_CACHE_TTL = 300                       # Seconds cached inventory data is valid
+CHANGE_STREAMS = False                          # Follow MongoDB change streams (requires a replica set)
 
 # NetMagis database connection
 NM_DATABASE = ''
@@ -28,6 +54,11 @@ PORT_TEMPLATES = 'Network ports'              # Name of template category for po
 
 # Task DB
 TASK_DATABASE = ''                            # Path and name of the taskdb file eg. /blah/taskdb.db
+TASK_LEASE = 300                              # Seconds a runner holds a task without heartbeat
+TASK_NOTIFY_SOCKET = ''                       # Unix socket to wake the task runner eg. /blah/taskdb.sock, '' = poll
+TASK_WORKERS = 3                              # Number of playbooks running at the same time
+TASK_BACKEND = 'process'                      # 'process': one process per playbook, 'thread': in the runner
+TASK_TIMEOUT = 3600                           # Seconds before a playbook process is killed, 0 = no timeout
 
 # LDAP configuration
 AUTH_LDAP_SERVER_URI = ''
@@ -1,13 +1,13 @@
 #!/usr/bin/python -tt
 """ts_lib tests
 
-  Run: python -m unittest tests.test_ts_lib
+  Run: python -m unittest netspot.tests.test_ts_lib
 
 """
 
 import unittest
 
-import ts_lib
+import netspot.ts_lib as ts_lib
 
 
 class TestTSLib(unittest.TestCase):
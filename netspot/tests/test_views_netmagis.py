@@ -17,47 +17,24 @@ class MockNetSPOT(object):
   def search(self, search, key=None, sort=None):
     return [{u'lastModified': datetime.datetime(2017, 9, 8, 10, 1, 11, 161000),
              u'_id': '58eb78dde79d524a3f6163f3',
-             u'macs': [{u'ip': None,
-                        u'vlan': u'net-wlan-mgmt',
-                        u'last_move': None,
-                        u'mac': u'00:00:48:42:71:E7',
-                        u'static': False,
-                        u'interface': u'ge-7/0/13.0',
-                        u'moves': None},
-                       {u'ip': None,
-                        u'vlan': u'acc-voip-ldc',
-                        u'last_move': None,
-                        u'mac': u'00:1B:4F:33:6A:0B',
-                        u'static': False,
-                        u'interface': u'ae0.0',
-                        u'moves': None},
-                       {u'ip': None,
-                       u'vlan': u'net-wlan-mgmt',
-                       u'last_move': None,
-                       u'mac': u'40:B4:F0:26:7A:C0',
-                       u'static': False,
-                       u'interface': u'ae0.0',
-                       u'moves': None}],
-              u'asset':
-              u'w-e110032-a-2'},
-             {u'lastModified': datetime.datetime(2017, 9, 8, 10, 1, 38, 291000),
-              u'_id': '59086a97e79d526a5d261c0f',
-              u'macs': [{u'ip': u'194.47.254.175',
-                         u'vlan': None,
-                         u'last_move': None,
-                         u'mac': u'00:00:48:42:71:E7',
-                         u'static': None,
-                         u'interface': u'reth1.2205',
-                         u'moves': None},
-                        {u'ip': u'192.168.73.114',
-                         u'vlan': None,
-                         u'last_move': None,
-                         u'mac': u'6C:88:14:67:BA:04',
-                         u'static': None,
-                         u'interface': u'reth1.2200',
-                         u'moves': None}],
-              u'asset':
-              u'w-kirk01-fw-0'}]
+             u'asset': u'w-e110032-a-2',
+             u'ip': None,
+             u'vlan': u'net-wlan-mgmt',
+             u'last_move': None,
+             u'mac': u'00:00:48:42:71:E7',
+             u'static': False,
+             u'interface': u'ge-7/0/13.0',
+             u'moves': None},
+            {u'lastModified': datetime.datetime(2017, 9, 8, 10, 1, 38, 291000),
+             u'_id': '59086a97e79d526a5d261c0f',
+             u'asset': u'w-kirk01-fw-0',
+             u'ip': u'194.47.254.175',
+             u'vlan': None,
+             u'last_move': None,
+             u'mac': u'00:00:48:42:71:E7',
+             u'static': None,
+             u'interface': u'reth1.2205',
+             u'moves': None}]
 
 class MockNetMagisDB(object):
 
@@ -8,14 +8,7 @@ import helpers
 
 from napalm import get_network_driver
 from jnpr.junos.exception import ConnectRefusedError, ConnectAuthError
-
-# JUNOS MAC table RE
-RE_VLAN = r'\s+([\w\d-]+)\s+'
-RE_MAC = r'\s?([*\w\d:]+)\s+'
-RE_TYPE = r'\s?([\w]+) '
-RE_AGE = r'\s+([-\d:]+)'
-RE_INTERFACE = r'\s+([-.\w\d/]+)'
-RE_SWITCHING_TABLE = RE_VLAN + RE_MAC + RE_TYPE + RE_AGE + RE_INTERFACE
+from .lib.spotmax import parsers
 
 
 class TroubleshootDevice(object):
@@ -180,16 +173,8 @@ class MACTable(object):
   def analyze_output(self):
     """Parse JUNOS show ethernet-switching interface X command."""
 
-    # Remote chassis ID
-    match = re.findall(RE_SWITCHING_TABLE, self.output)
-    for entry in match:
-      if entry[1] != '*':
-        mac_entry = {'vlan': entry[0],
-                     'mac': entry[1],
-                     'type': entry[2],
-                     'age': entry[3],
-                     'interface': entry[4]}
-        self.mac_entries.append(mac_entry)
+    for entry in parsers.parse_switching_table(self.output):
+      self.mac_entries.append(entry._asdict())
 
   def __str__(self):
     if self.mac_entries:
@@ -18,7 +18,6 @@ urlpatterns = [
     # Assets
     url(r'^$', views.index, name='index'),
     url(r'^assets/$', views.assets, name='assets'),
-    url(r'^assets/(?P<page>[0-9]+)$', views.assets, name='assets'),
     url(r'^assets/(?P<asset_name>%s)/$' % ASSET_NAME_RE, views.asset, name='asset'),
     url(r'^addvariable/$', views.addvariable, name='addvariable'),
     url(r'^deletevariable/asset/(?P<asset_name>%s)/(?P<variable>%s)$' % (ASSET_NAME_RE, VARIABLE_RE), views.deletevariable, name='deletevariable'),
@@ -74,6 +73,7 @@ urlpatterns = [
 
     # API version 1
     url(r'^api/v1/getmac/(?P<ip_address>[0-9.-]+)/$', api.api_get_mac, name='api_get_mac'),
+    url(r'^api/v1/machistory/(?P<mac>[0-9a-fA-F:]+)/$', api.api_mac_history, name='api_mac_history'),
     url(r'^api/v1/netmagis_search/(?P<search_keyword>[\w\d.-]+)/$', api.api_netmagis_search, name='api_netmagis_search'),
 
     # Port automation
@@ -61,17 +61,15 @@ def index(request):
   """Index."""
 
   # Statistics
-  num_groups = spotmax.SPOTGroup().count()
-  num_assets = netspot.NetSPOT().count()
-  num_interfaces = netspot.NetSPOT().count_interfaces()
+  stats = spotmax.SPOTStats().get()
 
   # Return
   return render(
       request,
       'index.htm',
-      context={'num_assets': num_assets,
-               'num_interfaces': num_interfaces,
-               'num_groups': num_groups},
+      context={'num_assets': stats.get('num_assets', 0),
+               'num_interfaces': stats.get('num_interfaces', 0),
+               'num_groups': stats.get('num_groups', 0)},
   )
 
 @login_required
@@ -136,7 +134,7 @@ def asset(request, asset_name, message=None):
 
   # Get asset
   inventory = netspot.NetSPOT()
-  asset_details = inventory.search(asset_name, key='asset')[0]
+  asset_details = inventory.search('asset:%s' % asset_name, key='asset')[0]
 
   # Get user variables if any
   try:
@@ -174,43 +172,32 @@ def asset(request, asset_name, message=None):
   )
 
 @login_required
-def assets(request, page=1):
+def assets(request):
   """Lists all assets."""
 
   # Pagination
-  page = int(page)
   limit = 50
 
-  # Previous page
-  if page >= 2:
-    prev_page = page - 1
-    no_prev = False
-  else:
-    prev_page = 1
-    no_prev = True
-
   # Search
   inventory = netspot.NetSPOT()
-  result = inventory.search('', key='asset', limit=limit, page=page)
+  result = inventory.search_page('',
+                                 key='asset',
+                                 limit=limit,
+                                 after=request.GET.get('after'),
+                                 before=request.GET.get('before'))
 
-  # Next page
-  if result.count(True) == limit:
-    next_page = page + 1
-    no_next = False
-  else:
-    next_page = page
-    no_next = True
+  showing_result = ''
+  if result:
+    showing_result = '%s - %s' % (result[0]['asset'], result[-1]['asset'])
 
   return render(
       request,
       'assets.htm',
       context={'assets': result,
                'filter': '',
-               'showing_result': '%s - %s' % (limit*(page-1), limit*(page)),
-               'prev_page': prev_page,
-               'next_page': next_page,
-               'no_prev': no_prev,
-               'no_next': no_next},
+               'showing_result': showing_result,
+               'prev_token': result.prev_token,
+               'next_token': result.next_token},
   )
 
 @login_required
@@ -260,7 +247,7 @@ def group(request, group_name, message=None):
 
   # Get group data
   inventory = spotmax.SPOTGroup()
-  group_data = inventory.search(group_name, key='group')[0]
+  group_data = inventory.search('group:%s' % group_name, key='group')[0]
 
   # Get assets in group
   inventory_groups = netspot.NetSPOT()
@@ -1,6 +1,7 @@
 """NetSPOT MAC views."""
 
-from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
 
 import helpers
 import netspot_settings
@@ -10,18 +11,36 @@ from django.contrib.auth.decorators import login_required
 
 from .lib.spotmax import netspot
 
+# Max number of MAC entries per page in a search result
+MAX_MAC_ENTRIES = 1000
+
+# Number of IPs per page
+IP_PAGE_SIZE = 20
+
+# IP usage sort order, oldest first
+IP_SORT = [('date', 1), ('time', 1)]
+
 # IP Usage
 @login_required
 def ipusage(request):
   """Lists all assets."""
 
   inventory = netspot.NetSPOT(collection=netspot_settings.COLL_IP)
-  search_result = inventory.search('', key='ip', sort=[("date", 1), ("time", 1)], limit=20)
+  search_result = inventory.search_page('',
+                                        key='ip',
+                                        sort=IP_SORT,
+                                        limit=IP_PAGE_SIZE,
+                                        after=request.GET.get('after'),
+                                        before=request.GET.get('before'))
 
   return render(
       request,
       'ipusage.htm',
-      context={'filter': '', 'ips': search_result,},
+      context={'filter': '',
+               'ips': search_result,
+               'page_url': 'ipusage',
+               'prev_token': search_result.prev_token,
+               'next_token': search_result.next_token},
   )
 
 @login_required
@@ -33,12 +52,21 @@ def ipusagesearch(request):
 
   # Search
   inventory = netspot.NetSPOT(collection=netspot_settings.COLL_IP)
-  search_result = inventory.search(find, key='ip', sort=[("date", 1), ("time", 1)])
+  search_result = inventory.search_page(find,
+                                        key='ip',
+                                        sort=IP_SORT,
+                                        after=request.GET.get('after'),
+                                        before=request.GET.get('before'))
 
   return render(
       request,
       'ipusage.htm',
-      context={'ips': search_result, 'ipusagefilter': find},
+      context={'ips': search_result,
+               'ipusagefilter': find,
+               'page_url': 'ipusagesearch',
+               'page_search': find,
+               'prev_token': search_result.prev_token,
+               'next_token': search_result.next_token},
   )
 
 # MACs
@@ -47,14 +75,13 @@ def macs(request):
   """Lists all assets."""
 
   # Get the MongoDB collection
-  collection = helpers.mongo_helper(netspot_settings.COLL_MACS)
-  num_assets = collection.count()
+  collection = helpers.mongo_helper(netspot_settings.COLL_MAC_ENTRIES)
+  num_assets = len(collection.distinct('asset'))
 
-  # Number of MACs
+  # Number of distinct MACs
   try:
-    num_macs = collection.aggregate([{"$unwind":"$macs"},
-                                     {"$group": {"_id":"$macs"}},
-                                     {"$group": {"_id":"DistictCount",
+    num_macs = collection.aggregate([{"$group": {"_id": "$mac"}},
+                                     {"$group": {"_id": "DistictCount",
                                                  "count": {"$sum": 1}}}]).next()
     num_macs = num_macs['count']
   except StopIteration:
@@ -73,34 +100,31 @@ def macsearch(request):
   # Get search term
   find = helpers.get_search_term(request)
 
-  # Get key and value from search
-  key, value = netspot.NetSPOT().parse_variable(find)
-
   # Search
-  inventory = netspot.NetSPOT(collection=netspot_settings.COLL_MACS)
-  search_result = inventory.search(find, key='asset', sort='asset')
-
-  # Filter out any other MAC entries
+  inventory = netspot.NetSPOT(collection=netspot_settings.COLL_MAC_ENTRIES)
+  search_result = inventory.search_page(find,
+                                        key='asset',
+                                        sort=[('asset', 1), ('interface', 1)],
+                                        limit=MAX_MAC_ENTRIES,
+                                        after=request.GET.get('after'),
+                                        before=request.GET.get('before'))
+
+  # Group MAC entries per asset
   counter = 0
-  if key:
-    search_filtered = []
-    for asset in search_result:
-      entry = defaultdict()
-      entry['asset'] = asset['asset']
-      if asset.get('macs'):
-        for mac in asset['macs']:
-          if mac[key] and value in mac[key]:
-            entry['macs'] = [mac]
-            search_filtered.append(entry)
-            counter += 1
-    search_result = search_filtered
-  else:
-    counter = len(search_result[0]['macs'])
+  devices = list()
+  for asset, entries in groupby(search_result, key=itemgetter('asset')):
+    entries = list(entries)
+    devices.append({'asset': asset, 'macs': entries})
+    counter += len(entries)
 
   return render(
       request,
       'macs.htm',
-      context={'devices': search_result,
+      context={'devices': devices,
                'result_counter': counter,
-               'macfilter': find},
+               'macfilter': find,
+               'page_url': 'macsearch',
+               'page_search': find,
+               'prev_token': search_result.prev_token,
+               'next_token': search_result.next_token},
   )
@@ -88,7 +88,7 @@ def searchhost(request):
               netmagis_result.append(host_entry)
 
   # Search for MACs
-  inventory = netspot.NetSPOT(collection=netspot_settings.COLL_MACS)
+  inventory = netspot.NetSPOT(collection=netspot_settings.COLL_MAC_ENTRIES)
   mac_search = []
 
   # Find MAC addresses in the MAC database
@@ -100,15 +100,12 @@ def searchhost(request):
     # Find interface in the MAC database
     search_result = inventory.search('mac:%s' % host['mac'].upper(), key='asset', sort='asset')
 
-    # Filter out any other MAC entries
-    for asset in search_result:
-      for mac in asset.get('macs', []):
-        if host['mac'].upper() in mac.get('mac', ''):
-          mac_search.append({'asset': asset['asset'],
-                             'mac': mac['mac'],
-                             'ip': mac['ip'],
-                             'interface': mac['interface'],
-                             'vlan': mac['vlan']})
+    for mac in search_result:
+      mac_search.append({'asset': mac['asset'],
+                         'mac': mac['mac'],
+                         'ip': mac['ip'],
+                         'interface': mac['interface'],
+                         'vlan': mac['vlan']})
 
   # Find outlet for each physical interface
   for entry in mac_search:
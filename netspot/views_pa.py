@@ -95,12 +95,12 @@ def pa_troubleshoot(request):
     helpers.check_beamline_access(request, beamline)
 
     # Get asset
-    asset_details = netspot.NetSPOT().search(asset, key='asset')
+    asset_details = netspot.NetSPOT().search('asset:%s' % asset, key='asset')
 
     # Get group SSH key file
     group_name = asset_details[0]['groups'][0]
     loopback = asset_details[0]['loopback']
-    group_details = spotmax.SPOTGroup().search(group_name, key='group')
+    group_details = spotmax.SPOTGroup().search('group:%s' % group_name, key='group')
 
     # Find SSH key
     for var in group_details[0]['variables']:
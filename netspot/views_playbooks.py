@@ -6,7 +6,7 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from .models import Playbook, PlaybookVariable
-from .lib.spotmax import netspot, nsinv
+from .lib.spotmax import netspot, nsinv, inventory_cache
 from .lib.spotmax import spotmax
 from .lib.ansible_runner import taskdb
 from netspot.views_templify import template_input
@@ -63,7 +63,8 @@ class PlaybookRun(object):
     # Get inventory
     inventory = nsinv.AnsibleInventory(attribute=self.search_filter,
                                        json_output=False,
-                                       inventory=netspot.NetSPOT())
+                                       inventory=netspot.NetSPOT(),
+                                       cache=inventory_cache.InventoryCache())
 
     # Add Ansible job
     with taskdb.TaskDB() as tasks:
@@ -246,6 +247,7 @@ def ansibletasks(request):
   active_tasks = None
   queued_tasks = None
   processed_tasks = None
+  queue_depth = 0
   error_message = None
 
   # Get queued tasks
@@ -254,6 +256,7 @@ def ansibletasks(request):
       active_tasks = tasks.get_tasks_by_status(taskdb.Task.STATUS_CODES['ACTIVE'], limit=10)
       queued_tasks = tasks.get_tasks_by_status(taskdb.Task.STATUS_CODES['QUEUED'], limit=10)
       processed_tasks = tasks.get_processed_tasks(limit=10)
+      queue_depth = tasks.count_tasks_by_status(taskdb.Task.STATUS_CODES['QUEUED'])
   except taskdb.DatabaseMissing:
     error_message = 'Database is either missing or damaged.'
 
@@ -263,7 +266,8 @@ def ansibletasks(request):
       context={'error_message': error_message,
                'active_tasks': active_tasks,
                'processed_tasks': processed_tasks,
-               'queued_tasks': queued_tasks}
+               'queued_tasks': queued_tasks,
+               'queue_depth': queue_depth}
   )
 
 @login_required
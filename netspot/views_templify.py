@@ -114,11 +114,11 @@ def generate_config(request):
   inventory = netspot.NetSPOT()
 
   if asset_name:
-    asset_details = inventory.search(asset_name, key='asset')[0]
+    asset_details = inventory.search('asset:%s' % asset_name, key='asset')[0]
 
     # Get variable for each group
     for group in asset_details['groups']:
-      group_details = spotmax.SPOTGroup().search(group, key='group')[0]
+      group_details = spotmax.SPOTGroup().search('group:%s' % group, key='group')[0]
 
       # Get user variables if any
       if group_details['variables']: